@@ -0,0 +1,73 @@
+"""
+    Compare the payload encodings (see `shopfloor_simulation/encoding.py`) on
+    the entities of a declarative scenario: encode time and payload size of the
+    head topics (whole entities) and of the atomic topics (one per attribute).
+
+        python encoding_benchmark.py
+        python encoding_benchmark.py --scenario shopfloor_simulation/scenarios/dtv/flexibility0.json --rounds 2000
+
+    Encodings whose package isn't installed (msgpack, cbor2) are skipped.
+"""
+
+import argparse
+import json
+import os
+from time import perf_counter
+
+from shopfloor_simulation.encoding import ENCODINGS, JsonEncoding
+from shopfloor_simulation.scenario_loader import CompiledScenario
+
+DEFAULT_SCENARIO = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "shopfloor_simulation", "scenarios", "dtv", "flexibility0.json")
+
+
+def benchmark(encoding, entities, rounds):
+    ''' Return (seconds per round, head topic bytes, atomic topic bytes) of `encoding`. '''
+    start = perf_counter()
+    for _ in range(rounds):
+        for entity in entities:
+            encoding.encode(entity)
+    elapsed = (perf_counter() - start) / rounds
+
+    head_bytes = 0
+    atomic_bytes = 0
+    for entity in entities:
+        payload = encoding.encode(entity)
+        head_bytes += len(payload if isinstance(payload, bytes) else payload.encode())
+        for value in encoding.decode(payload).values():
+            value = encoding.encode_value(value)
+            atomic_bytes += len(value if isinstance(value, bytes) else value.encode())
+    return elapsed, head_bytes, atomic_bytes
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare the encode time and payload size of the payload encodings.")
+    parser.add_argument("--scenario", default=DEFAULT_SCENARIO,
+                        help="Scenario definition whose entities are encoded (JSON).")
+    parser.add_argument("--rounds", type=int, default=1000,
+                        help="Times every entity is encoded (default: 1000).")
+    args = parser.parse_args()
+
+    with open(args.scenario) as definition_file:
+        compiled = CompiledScenario(json.load(definition_file),
+                                    os.path.splitext(os.path.basename(args.scenario))[0])
+    entities = list(compiled.entities.values())
+
+    print("[#] Encoding " + str(len(entities)) + " entities " +
+          str(args.rounds) + " times.\n")
+    print("{:<10}{:>14}{:>14}{:>10}{:>14}{:>10}".format(
+        "encoding", "us/round", "head bytes", "ratio", "atomic bytes", "ratio"))
+
+    json_result = benchmark(JsonEncoding(), entities, args.rounds)
+    for name, encoding_class in ENCODINGS.items():
+        try:
+            encoding = encoding_class()
+        except ImportError as error:
+            print("{:<10}[W] skipped: {}".format(name, error))
+            continue
+        elapsed, head_bytes, atomic_bytes = benchmark(encoding, entities, args.rounds)
+        print("{:<10}{:>14.1f}{:>14}{:>10.2f}{:>14}{:>10.2f}".format(
+            name, elapsed * 1e6,
+            head_bytes, head_bytes / json_result[1],
+            atomic_bytes, atomic_bytes / json_result[2]))
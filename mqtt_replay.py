@@ -0,0 +1,81 @@
+"""
+    Record the simulation's MQTT traffic to a log file, or replay a log against a broker.
+
+    Record until CTRL + C:
+        python mqtt_replay.py record session.mqlog
+
+    Replay at 1x, 10x or maximum speed:
+        python mqtt_replay.py replay session.mqlog
+        python mqtt_replay.py replay session.mqlog --speed 10
+        python mqtt_replay.py replay session.mqlog --speed max --host localhost
+"""
+
+import argparse
+import logging
+import threading
+
+from shopfloor_simulation.mqtt_log import DEFAULT_TOPICS, MqttLogPlayer, MqttLogRecorder
+from shopfloor_simulation.settings import MQTT_HOST, MQTT_PORT
+
+
+def parse_speed(value):
+    if value == "max":
+        return 0
+    speed = float(value)
+    if speed <= 0:
+        raise argparse.ArgumentTypeError("speed must be positive or 'max'")
+    return speed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Record and replay the simulation's MQTT traffic.")
+    parser.add_argument("--host", default=MQTT_HOST)
+    parser.add_argument("--port", type=int, default=MQTT_PORT)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    record_parser = commands.add_parser(
+        "record", help="Record messages until interrupted.")
+    record_parser.add_argument("log")
+    record_parser.add_argument("--topic", action="append", dest="topics",
+                               help="Topic filter to record (default: the simulation's topics).")
+
+    replay_parser = commands.add_parser(
+        "replay", help="Publish the messages of a log.")
+    replay_parser.add_argument("log")
+    replay_parser.add_argument("--speed", type=parse_speed, default=1.0,
+                               help="Playback speed factor, or 'max' (default: 1).")
+
+    args = parser.parse_args()
+
+    # Create event for syncing thread shut down.
+    run_event = threading.Event()
+    run_event.set()
+
+    try:
+        if args.command == "record":
+            recorder = MqttLogRecorder(args.log, host=args.host, port=args.port,
+                                       subscribed_topics=args.topics or DEFAULT_TOPICS)
+            record_thread = threading.Thread(
+                target=recorder.mqtt_loop, args=[run_event])
+            record_thread.start()
+            print("[#] Recording to " + args.log + ". Press CTRL + C to stop.")
+            while record_thread.is_alive():
+                record_thread.join(0.5)
+        else:
+            player = MqttLogPlayer(args.log, speed=args.speed,
+                                   host=args.host, port=args.port)
+            player.replay(run_event)
+
+    # Allow the use of a keyboard interrupt to stop the program
+    except KeyboardInterrupt:
+        print("\n[W] Keyboard Interrupt detected. Shutting down.")
+        run_event.clear()
+        if args.command == "record":
+            record_thread.join()
+
+    # Handle unexpected errors
+    except:
+        print("\n[!] Unexpected error:")
+        logging.exception('')
+        run_event.clear()
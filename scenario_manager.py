@@ -4,18 +4,27 @@ import logging
 from time import sleep
 
 
-# Always import the desired scenario 'as Scenario' to keep the code compatible.
-from shopfloor_simulation.scenarios.dtv.flexibility0 import Shopfloor as Scenario_flexibility0
-from shopfloor_simulation.scenarios.dtv.flexibility1 import Shopfloor as Scenario_flexibility1
 from shopfloor_simulation.entities import DigitalTwinViewerManager
+from shopfloor_simulation.recorder import TimeSeriesRecorder
+from shopfloor_simulation.settings import HOT_STANDBY, MAX_WARM_SCENARIOS, RECORDER_PATH
 
 
 if __name__ == "__main__":
-    # List of scenarios
-    scenarios = [Scenario_flexibility0, Scenario_flexibility1]
+    # Scenarios by flexibility. They're only imported once selected.
+    scenarios = {
+        0: "shopfloor_simulation.scenarios.dtv.flexibility0:Shopfloor",
+        1: "shopfloor_simulation.scenarios.dtv.flexibility1:Shopfloor",
+    }
 
     # Scenario Manager object
-    dtv_manager = DigitalTwinViewerManager(scenarios)
+    dtv_manager = DigitalTwinViewerManager(
+        scenarios, max_warm_scenarios=MAX_WARM_SCENARIOS, hot_standby=HOT_STANDBY)
+
+    # Optionally record entity changes for offline analysis
+    recorder = None
+    if RECORDER_PATH:
+        recorder = TimeSeriesRecorder(RECORDER_PATH)
+        recorder.start()
 
     # Run scenarios
     try:
@@ -34,3 +43,9 @@ if __name__ == "__main__":
     except:
         print("\n[!] Unexpected error:")
         logging.exception('')
+
+    # Shut down the scenario waiting on standby, if any
+    dtv_manager.discard_standby()
+
+    if recorder is not None:
+        recorder.stop()
@@ -0,0 +1,145 @@
+import sqlite3
+import threading as th
+from queue import Empty, SimpleQueue
+from time import time
+
+import jsonpickle
+
+from shopfloor_simulation.settings import ARCHIVE_PATH
+
+
+class JobArchive:
+    ''' Append-only history of finished Jobs, stored in a local SQLite database.
+
+        `archive()` only queues the Job. A background writer thread owns the
+        database connection and writes the queued Jobs in batches, one
+        transaction per batch, so the state machine never waits on the disk.
+
+        Example:
+
+            archive = JobArchive("job_history.sqlite3", scenario="flexibility0")
+            archive.start()
+            ...
+            archive.archive(job, started_at=start_time)
+            ...
+            archive.stop()  # Writes whatever is still queued
+    '''
+
+    def __init__(self, path=ARCHIVE_PATH, scenario="", batch_size=100, flush_interval=1.0):
+        self.path = path
+        self.scenario = scenario  # Stored alongside every Job
+        self.batch_size = batch_size  # Max amount of Jobs written per transaction
+        self.flush_interval = flush_interval  # Max time (s) a Job waits in the queue
+        self.queue = SimpleQueue()
+        self.writer_thread = None
+        self.archived_count = 0  # How many Jobs have been written so far
+
+    def start(self):
+        ''' Start the writer thread. '''
+        if self.writer_thread is not None and self.writer_thread.is_alive():
+            return
+        self.writer_thread = th.Thread(
+            target=self.writer_loop, name="JobArchive-writer", daemon=True)
+        self.writer_thread.start()
+
+    def stop(self):
+        ''' Write the queued Jobs and stop the writer thread. '''
+        if self.writer_thread is None:
+            return
+        self.queue.put(None)  # Shutdown sentinel
+        self.writer_thread.join()
+        self.writer_thread = None
+
+    def archive(self, job, started_at=None, finished_at=None):
+        ''' Queue a finished Job to be written to the archive. Doesn't block.
+
+            The Job must not be modified afterwards, since it's serialized by
+            the writer thread.
+        '''
+        if finished_at is None:
+            finished_at = time()
+        self.queue.put((job, started_at, finished_at))
+
+    def writer_loop(self):
+        ''' Wait for queued Jobs and write them in batches until stopped. '''
+        connection = sqlite3.connect(self.path)
+        self.create_table(connection)
+
+        running = True
+        while running:
+            # Block until there's something to write, then gather a batch.
+            try:
+                batch = [self.queue.get(timeout=self.flush_interval)]
+            except Empty:
+                continue
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except Empty:
+                    break
+
+            if None in batch:
+                running = False
+                batch = [item for item in batch if item is not None]
+                # Drain anything queued before the sentinel was received
+                while True:
+                    try:
+                        item = self.queue.get_nowait()
+                    except Empty:
+                        break
+                    if item is not None:
+                        batch.append(item)
+
+            if len(batch) > 0:
+                self.write_batch(connection, batch)
+
+        connection.close()
+        print("[#] Job archive closed (" +
+              str(self.archived_count) + " Jobs archived).")
+
+    def create_table(self, connection):
+        with connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "job_id TEXT, name TEXT, scenario TEXT, status TEXT, "
+                "is_real INTEGER, started_at REAL, finished_at REAL, "
+                "cycle_time REAL, payload TEXT)")
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS jobs_finished_at ON jobs (finished_at)")
+
+    def write_batch(self, connection, batch):
+        ''' Write a batch of Jobs in a single transaction. '''
+        rows = []
+        for job, started_at, finished_at in batch:
+            cycle_time = None
+            if started_at is not None:
+                cycle_time = finished_at - started_at
+            rows.append((
+                job.header._id,
+                job.header.name,
+                self.scenario,
+                job.status,
+                int(job.is_real),
+                started_at,
+                finished_at,
+                cycle_time,
+                jsonpickle.encode(job, unpicklable=False)
+            ))
+        try:
+            with connection:
+                connection.executemany(
+                    "INSERT INTO jobs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            self.archived_count += len(rows)
+        except sqlite3.Error as error:
+            print("[!] Job archive failed to write " +
+                  str(len(rows)) + " Jobs: " + str(error))
+
+    def cycle_times(self, limit=100):
+        ''' Return the (job_id, cycle_time) of the latest archived Jobs. '''
+        connection = sqlite3.connect(self.path)
+        try:
+            return connection.execute(
+                "SELECT job_id, cycle_time FROM jobs ORDER BY finished_at DESC LIMIT ?",
+                (limit,)).fetchall()
+        finally:
+            connection.close()
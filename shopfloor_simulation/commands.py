@@ -0,0 +1,75 @@
+import threading as th
+from collections import deque
+from time import perf_counter
+
+from shopfloor_simulation.metrics import Metrics
+
+# Command types
+JOB_STATUS = "job_status"  # key: Job id, value: the new status
+
+
+class CommandQueue:
+    ''' Commands received from MQTT, waiting to be applied to a scenario.
+
+        The MQTT network thread calls `put()` and the simulation calls
+        `drain()` once per State Machine iteration, which applies every
+        waiting command in one batch. Commands are (type, key, value): only the
+        last value of every (type, key) in a batch is applied, e.g. only the
+        latest status of every Job.
+
+        `handlers`: command type -> function(scenario, key, value) that applies
+        the command. `put()` doesn't lock, since appending to a deque is
+        thread-safe. Draining is serialized, so batches are applied in order.
+
+        The metrics count the received, applied and coalesced commands, and
+        keep the queue depth and the latency between receiving a command and
+        applying it (`drain`).
+    '''
+
+    def __init__(self, handlers, metrics=None):
+        self.handlers = handlers
+        self.queue = deque()  # (type, key, value, time received)
+        self.drain_lock = th.Lock()
+        self.metrics = metrics if metrics is not None else Metrics(
+            "commands", "Commands received by the scenario")
+
+    def put(self, command_type, key, value):
+        ''' Queue a command. Safe to call from any thread. '''
+        self.queue.append((command_type, key, value, perf_counter()))
+        self.metrics.increment("received")
+        self.metrics.set_gauge("depth", len(self.queue))
+
+    def drain(self, scenario):
+        ''' Apply every waiting command to `scenario`. Returns how many were applied. '''
+        with self.drain_lock:
+            # Keep the last value of every (type, key), in the order they were last received
+            latest = {}
+            received = 0
+            while True:
+                try:
+                    command_type, key, value, received_at = self.queue.popleft()
+                except IndexError:
+                    break
+                received += 1
+                latest.pop((command_type, key), None)
+                latest[(command_type, key)] = (value, received_at)
+
+            if received == 0:
+                return 0
+
+            for (command_type, key), (value, received_at) in latest.items():
+                handler = self.handlers.get(command_type)
+                if handler is None:
+                    print("[W] No handler for commands of type " + command_type + ".")
+                    continue
+                try:
+                    handler(scenario, key, value)
+                except:
+                    print("[!] Couldn't apply the " + command_type +
+                          " command " + str((key, value)) + ".")
+                self.metrics.add_latency("drain", perf_counter() - received_at)
+
+            self.metrics.increment("applied", len(latest))
+            self.metrics.increment("coalesced", received - len(latest))
+            self.metrics.set_gauge("depth", len(self.queue))
+            return len(latest)
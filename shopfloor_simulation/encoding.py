@@ -0,0 +1,90 @@
+import jsonpickle
+
+try:
+    import msgpack
+except ImportError:  # msgpack is only needed for the "msgpack" encoding
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:  # cbor2 is only needed for the "cbor" encoding
+    cbor2 = None
+
+''' Payload encodings.
+
+    Entities are published as JSON by default, which ThingWorx and the DTV
+    expect. Topic subtrees read only by our own consumers can use a compact
+    binary encoding instead (see PAYLOAD_ENCODINGS in `settings.py`).
+'''
+
+
+def flatten(entity):
+    ''' The entity as plain Python data (dicts, lists, strings, numbers), like its JSON payload. '''
+    return jsonpickle.Pickler(unpicklable=False).flatten(entity)
+
+
+class JsonEncoding:
+    ''' jsonpickle JSON text. Atomic string values are sent as they are. '''
+    name = "json"
+    content_type = "application/json"
+
+    def encode(self, entity):
+        return jsonpickle.encode(entity, unpicklable=False)
+
+    def decode(self, payload):
+        return jsonpickle.decode(payload)
+
+    def encode_value(self, value):
+        if type(value) is str:  # Avoid escaping characters
+            return value
+        return jsonpickle.encode(value, unpicklable=False)
+
+
+class MsgpackEncoding:
+    ''' MessagePack. Every payload, atomic values included, is a MessagePack document. '''
+    name = "msgpack"
+    content_type = "application/msgpack"
+
+    def __init__(self):
+        if msgpack is None:
+            raise ImportError("The msgpack encoding requires the msgpack package.")
+
+    def encode(self, entity):
+        return msgpack.packb(flatten(entity))
+
+    def decode(self, payload):
+        return msgpack.unpackb(payload)
+
+    def encode_value(self, value):
+        return msgpack.packb(value)
+
+
+class CborEncoding:
+    ''' CBOR. Every payload, atomic values included, is a CBOR document. '''
+    name = "cbor"
+    content_type = "application/cbor"
+
+    def __init__(self):
+        if cbor2 is None:
+            raise ImportError("The cbor encoding requires the cbor2 package.")
+
+    def encode(self, entity):
+        return cbor2.dumps(flatten(entity))
+
+    def decode(self, payload):
+        return cbor2.loads(payload)
+
+    def encode_value(self, value):
+        return cbor2.dumps(value)
+
+
+# Encoding name -> class
+ENCODINGS = {"json": JsonEncoding, "msgpack": MsgpackEncoding, "cbor": CborEncoding}
+
+
+def get_encoding(name):
+    ''' Return an instance of the encoding called `name`. '''
+    if name not in ENCODINGS:
+        raise ValueError("Unknown payload encoding '" + str(name) +
+                         "'. Use one of: " + ", ".join(ENCODINGS) + ".")
+    return ENCODINGS[name]()
@@ -1,7 +1,11 @@
-from time import sleep
+from time import sleep, time
+import asyncio
 import copy
+import importlib
+import logging
 import random
-from shopfloor_simulation.settings import ROOT_TOPIC
+import sys
+from shopfloor_simulation.settings import DEAD_RECKONING_TOLERANCE, ROOT_TOPIC
 import threading as th
 from queue import Queue
 
@@ -19,9 +23,122 @@ class Header:
         self.description = description
 
 
-class Robot:
+class EntityRegistry:
+    ''' Ordered collection of entities (e.g. the publishing entities or the Job
+        queue) with O(1) add, remove and membership.
+
+        Entities are keyed by object identity, since different Jobs can hold
+        copies of the same ProcessStep (same header id). Iterating the registry
+        yields a cached snapshot, so the publishing thread can loop over it
+        while the state machine adds and removes entities.
+    '''
+
+    def __init__(self, entities=None):
+        self._entities = {}  # id(entity) -> entity, in insertion order
+        self._snapshot = ()
+        self._lock = th.Lock()
+        if entities is not None:
+            self.extend(entities)
+
+    def add(self, entity):
+        ''' Register an entity. Adding an already registered entity does nothing. '''
+        with self._lock:
+            if id(entity) not in self._entities:
+                self._entities[id(entity)] = entity
+                self._snapshot = None
+
+    def extend(self, entities):
+        ''' Register every entity in `entities`. '''
+        for entity in entities:
+            self.add(entity)
+
+    def remove(self, entity):
+        ''' Unregister an entity. Raises KeyError if it isn't registered. '''
+        with self._lock:
+            del self._entities[id(entity)]
+            self._snapshot = None
+
+    def discard(self, entity):
+        ''' Unregister an entity if it is registered. '''
+        with self._lock:
+            if self._entities.pop(id(entity), None) is not None:
+                self._snapshot = None
+
+    def snapshot(self):
+        ''' Tuple with the registered entities. Rebuilt only after a change. '''
+        with self._lock:
+            if self._snapshot is None:
+                self._snapshot = tuple(self._entities.values())
+            return self._snapshot
+
+    def __iter__(self):
+        return iter(self.snapshot())
+
+    def __len__(self):
+        return len(self._entities)
+
+    def __contains__(self, entity):
+        return id(entity) in self._entities
+
+    def __getstate__(self):
+        ''' Pickle the entities only. Their ids change, so the keys are rebuilt. '''
+        return {"entities": list(self._entities.values())}
+
+    def __setstate__(self, state):
+        self.__init__(state["entities"])
+
+
+class Observable:
+    ''' Notifies observers whenever one of the `watched_attributes` is assigned.
+
+        Observers are callables `observer(entity, name, value)`. They're called
+        from whichever thread assigned the attribute (e.g. a Robot's move
+        thread), so they must be quick and must not block. Observers are kept
+        in a class attribute, so they never end up in an entity's payload.
+    '''
+
+    observers = ()  # Replaced (never mutated) so it can be iterated safely
+    watched_attributes = ()
+
+    def __setattr__(self, name, value):
+        object.__setattr__(self, name, value)
+        if Observable.observers and name in self.watched_attributes:
+            for observer in Observable.observers:
+                observer(self, name, value)
+
+    @staticmethod
+    def add_observer(observer):
+        Observable.observers = Observable.observers + (observer,)
+
+    @staticmethod
+    def remove_observer(observer):
+        Observable.observers = tuple(
+            x for x in Observable.observers if x is not observer)
+
+
+def motion_position(motion, at):
+    ''' Where a Robot following the motion segment `motion` is at the time `at` (see `Robot.move_steps`).
+
+        Every axis moves towards the target at `velocity` (units/s) on its own,
+        and stops once it's reached, like the steps of `move_steps`.
+    '''
+    travelled = motion["velocity"] * max(0.0, at - motion["start_time"])
+    position = []
+    for start, target in zip(motion["start"], motion["target"]):
+        distance = target - start
+        if abs(distance) <= travelled:
+            position.append(target)
+        else:
+            position.append(start + travelled if distance > 0 else start - travelled)
+    return position
+
+
+class Robot(Observable):
     '''The Robots work on the products and can be either stationary, mobile or agvs'''
 
+    watched_attributes = ("pose2", "status", "battery_status")
+    track_motion = DEAD_RECKONING_TOLERANCE > 0  # Keep `motion` while moving, for dead reckoning
+
     def __init__(self, _id, name, namespace, description, _type, initial_position=[0, 0, 0], initial_euler=[0, 0, 0], initial_orientation=[0, 0, 0, 0], current_station: Header = None):
         self.header = Header(_id, name, namespace, description)
         self.type = _type  # agv, stationary, or mobile
@@ -46,6 +163,18 @@ class Robot:
         self.robotMode = "AUTOMATIC"
         self.motionPossible = True
         self.move_thread = None
+        self.motion = None  # Motion segment of the current move (see move_steps)
+
+    def __getstate__(self):
+        ''' Leave `motion` out of the payload (and copies) unless dead reckoning uses it. '''
+        state = self.__dict__.copy()
+        if not self.track_motion:
+            del state["motion"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__dict__.setdefault("motion", None)
 
     def reset(self):
         '''Reset the Robot's attributes. Used when the Robot has to go back to it's initial State.'''
@@ -59,10 +188,48 @@ class Robot:
         self.move_thread.start()
         # self.move_robot_thread(target)
 
-    def move_robot_thread(self, target):
+    def move_robot_thread(self, target, preemption=None):
         '''
         Change position incrementally in a linear movement interpolated by the current position and the target position.
 
+        `target`: xyz coordinates for the Robot's destination.
+        `preemption`: optional Preemption of the scenario. The Robot then stops
+        while the current Job is ON_HOLD, and stops moving if the scenario is
+        shutting down. The scenario's thread should wait for the move with
+        `preemption.join()`, which applies the received commands.
+        '''
+        steps = self.move_steps(target)
+        for _ in steps:
+            if preemption is None:
+                sleep(MOVEMENT_SLEEP)
+            elif not preemption.wait(MOVEMENT_SLEEP, update=False):
+                steps.close()
+                break
+        return
+
+    async def move_robot_async(self, target, clock=None):
+        ''' asyncio counterpart of `move_robot_thread`. Returns once the target is reached.
+
+            `clock`: optional SimClock used for the delay between steps.
+        '''
+        for _ in self.move_steps(target):
+            if clock is None:
+                await asyncio.sleep(MOVEMENT_SLEEP)
+            else:
+                await clock.sleep(MOVEMENT_SLEEP)
+
+    def move_steps(self, target):
+        '''
+        Generator that moves the Robot a single step towards `target` every
+        iteration. The caller decides how long to wait between steps.
+
+        While moving with `track_motion` (dead reckoning), `motion` describes
+        the move, so consumers can predict the position instead of receiving
+        every step (see `motion_position`): start and target positions
+        (`pose["position"]`), velocity (units/s, per axis, assuming
+        MOVEMENT_SLEEP between steps) and start time (UNIX time). It's None
+        otherwise.
+
         `target`: xyz coordinates for the Robot's destination.
         '''
         prev_status = self.status
@@ -72,44 +239,47 @@ class Robot:
                        "y": self.pose["position"][1],
                        "z": self.pose["position"][2]}
         target_pos = {"x": target[0], "y": target[1], "z": target[2]}
-
-        # Distances (dx and dy are the sides of the triangle in a 2D plane)K
-        dx = target_pos["x"] - current_pos["x"]
-        dy = target_pos["y"] - current_pos["y"]
-        dz = target_pos["z"] - current_pos["z"]
+        if self.track_motion:
+            self.motion = {"start": [current_pos["x"], current_pos["y"], current_pos["z"]],
+                           "target": [target[0], target[1], target[2]],
+                           "velocity": MOVEMENT_STEP / MOVEMENT_SLEEP,
+                           "start_time": time()}
 
         # Pathing: change current_pos by a value of MOVEMENT_STEP until it equals target_pos
-        target_reached = False
-        while not target_reached:
-            # Check if the target destination has been reached
-            if (current_pos["x"] == target_pos["x"] and current_pos["y"] == target_pos["y"] and current_pos["z"] == target_pos["z"]):
-                target_reached = True
-                break
-
-            # Calculate steps for each axis
-            for xyz in target_pos.keys():
-                distance = target_pos[xyz] - current_pos[xyz]
-                if (distance > 0 and abs(distance) > MOVEMENT_STEP):
-                    current_pos[xyz] += MOVEMENT_STEP
-                elif (distance < 0 and abs(distance) > MOVEMENT_STEP):
-                    current_pos[xyz] -= MOVEMENT_STEP
-                else:
-                    # Target is very close. Snap to it.
-                    current_pos[xyz] = target_pos[xyz]
-
-            # Update the Robot's positions
-            self.pose["position"] = [current_pos["x"],
-                                     current_pos["y"],
-                                     current_pos["z"]]
-            self.pose2 = "PE,"+str(current_pos["x"])+","+str(-1*current_pos["y"])+","+str(
-                current_pos["z"])+','+','.join(map(str, self.euler))
-            # Battery drain
-            if "battery_status" in vars(self):
-                self.battery_status -= 0.0001
-
-            sleep(MOVEMENT_SLEEP)
-        self.status = prev_status
-        return
+        # The status is restored even if the caller stops the movement halfway.
+        try:
+            target_reached = False
+            while not target_reached:
+                # Check if the target destination has been reached
+                if (current_pos["x"] == target_pos["x"] and current_pos["y"] == target_pos["y"] and current_pos["z"] == target_pos["z"]):
+                    target_reached = True
+                    break
+
+                # Calculate steps for each axis
+                for xyz in target_pos.keys():
+                    distance = target_pos[xyz] - current_pos[xyz]
+                    if (distance > 0 and abs(distance) > MOVEMENT_STEP):
+                        current_pos[xyz] += MOVEMENT_STEP
+                    elif (distance < 0 and abs(distance) > MOVEMENT_STEP):
+                        current_pos[xyz] -= MOVEMENT_STEP
+                    else:
+                        # Target is very close. Snap to it.
+                        current_pos[xyz] = target_pos[xyz]
+
+                # Update the Robot's positions
+                self.pose["position"] = [current_pos["x"],
+                                         current_pos["y"],
+                                         current_pos["z"]]
+                self.pose2 = "PE,"+str(current_pos["x"])+","+str(-1*current_pos["y"])+","+str(
+                    current_pos["z"])+','+','.join(map(str, self.euler))
+                # Battery drain
+                if "battery_status" in vars(self):
+                    self.battery_status -= 0.0001
+
+                yield
+        finally:
+            self.motion = None
+            self.status = prev_status
 
     def move_object_absolute(self, target):
         ''' Change position incrementally in a linear movement interpolated by the current position and the target position as an absolute value.
@@ -252,9 +422,11 @@ class Station(Zone):
         self.status = "OPERABLE"  # SETUP, OPERABLE, UNKNOWN, ERROR
 
 
-class Job:
+class Job(Observable):
     ''' For the Shopfloor simulation, only one Job is repeatedly executed, consisting of a list of process steps (PSs) '''
 
+    watched_attributes = ("status", "progress")
+
     def __init__(self, _id, name, namespace, description, process_steps: list):
         self.header = Header(_id, name, namespace, description)
         self.status = "IDLE"  # CREATED, IDLE, IN_PROGRESS, ON_HOLD, DONE, ERROR, UNKNOWN
@@ -314,8 +486,16 @@ class ProcessStep:
         self.operations = operations
         self.progress = 0  # In percentage
         self.station = station
-        self.nextProcessStep = nextPs  # The id of the PS to be executed next
-        self.prevProcessStep = prevPs  # The id of the PS that must be executed beforehand
+        self.nextProcessStep = nextPs  # The id(s) of the PS(s) to be executed next
+        self.prevProcessStep = prevPs  # The id(s) of the PS(s) that must be executed beforehand
+
+    def predecessors(self):
+        ''' Ids of the PSs that must be executed beforehand. `prevPs` can be "", an id, or a list of ids. '''
+        return ids_as_list(self.prevProcessStep)
+
+    def successors(self):
+        ''' Ids of the PSs to be executed next. `nextPs` can be "", an id, or a list of ids. '''
+        return ids_as_list(self.nextProcessStep)
 
     def update_progress(self):
         ''' Update current progress on the Process Step '''
@@ -334,6 +514,15 @@ class ProcessStep:
         self.progress = round(completed/(completed + pending)*100, 0)
 
 
+def ids_as_list(ids):
+    ''' Normalize a ProcessStep link ("", a single id, or a list of ids) to a list of ids. '''
+    if not ids:
+        return []
+    if isinstance(ids, str):
+        return [ids]
+    return list(ids)
+
+
 class Operation:
     '''  Atomic element that consists of a specific Operation to be executed as part of a Process Step '''
 
@@ -343,21 +532,164 @@ class Operation:
         self.progress = 0  # In percentage
 
 
+def resolve_scenario(reference):
+    """ Turn a scenario reference into something that creates the scenario.
+
+        `reference` is either the scenario class (or any callable that takes
+        the manager) itself, a "package.module:Attribute" string, or the path
+        of a .json/.toml scenario definition.
+    """
+    if not isinstance(reference, str):
+        return reference
+    if reference.endswith((".json", ".toml")):
+        # Imported here, since the scenario loader depends on this module
+        from shopfloor_simulation.scenario_loader import load_scenario
+        return load_scenario(reference)
+    module_name, _, attribute = reference.partition(":")
+    return getattr(importlib.import_module(module_name), attribute or "Shopfloor")
+
+
+def release_scenario(reference):
+    """ Drop a scenario module imported by `resolve_scenario`, so its layout
+        can be garbage collected. It's imported (and built) again when needed.
+    """
+    if isinstance(reference, str) and not reference.endswith((".json", ".toml")):
+        module_name = reference.partition(":")[0]
+        module = sys.modules.pop(module_name, None)
+        # The parent package keeps the module as an attribute, too
+        parent_name, _, child = module_name.rpartition(".")
+        parent = sys.modules.get(parent_name)
+        if module is not None and getattr(parent, child, None) is module:
+            delattr(parent, child)
+
+
 class DigitalTwinViewerManager():
     """ 
         Scenario Manager for the Digital Twin Viewer related scenarios.
 
         Enables the execution of selected `scenarios` by their `flexibility`.
+
+        `scenarios` is a list, tuple or dict (flexibility -> scenario) of
+        scenario classes or of references to them (see `resolve_scenario`).
+        References are only imported or built once their flexibility is
+        selected. Up to `max_warm_scenarios` of them are kept ready; the
+        least recently used one is released when there are more (None keeps
+        all of them).
+
+        With `hot_standby`, the scenario most likely selected next is built
+        and connected in the background while the current one runs (see
+        `prepare_standby`), so switching flexibility only has to activate it.
     """
 
-    def __init__(self, scenarios, allowed_flexibility: list[int] = [0, 1]):
+    def __init__(self, scenarios, allowed_flexibility: list[int] = None, max_warm_scenarios=None, hot_standby=False):
         self.header = Header("DTV-000", "DTV Scenario Manager",
                              "scenario_manager", "Scenario Manager for DTV related scenarios.")
         self.scenarios = scenarios  # List, tuple or dict of scenarios
         self.selected_flexibility = 0  # Determines which scenario should be loaded
+        if allowed_flexibility is None:
+            allowed_flexibility = list(scenarios.keys()) if isinstance(
+                scenarios, dict) else list(range(len(scenarios)))
         self.allowed_flexibility = allowed_flexibility
         self.efficiency = 0  # From 0 to 1
         self.is_enabled = True  # Flag that enables the manager
+        self.max_warm_scenarios = max_warm_scenarios
+        self.warm_scenarios = {}  # Flexibility -> resolved scenario, least recently used first
+
+        # Hot standby related properties
+        self.hot_standby = hot_standby
+        self.last_flexibility = None  # The flexibility selected before the current one
+        self.active_factory = None  # What created the running scenario
+        self.standby = None  # (flexibility, scenario) built in the background
+        self.standby_thread = None  # Thread that builds the standby scenario
+        self.standby_clients = []  # The standby scenario's MQTT clients, activated on cutover
+
+    def get_scenario(self, flexibility):
+        """ Resolve the scenario of `flexibility`, keeping it warm for next time. """
+        scenario = self.warm_scenarios.pop(flexibility, None)
+        if scenario is None:
+            scenario = resolve_scenario(self.scenarios[flexibility])
+        self.warm_scenarios[flexibility] = scenario  # Now the most recently used
+
+        while self.max_warm_scenarios is not None and len(self.warm_scenarios) > self.max_warm_scenarios:
+            evicted = next(iter(self.warm_scenarios))
+            del self.warm_scenarios[evicted]
+            release_scenario(self.scenarios[evicted])
+            print("[#] Released the scenario of flexibility " + str(evicted) + ".")
+        return scenario
+
+    def standby_flexibility(self):
+        """ The flexibility most likely selected next: the one selected before
+            the current one, otherwise the next allowed one. None if there's none.
+        """
+        current = self.selected_flexibility
+        if self.last_flexibility in self.allowed_flexibility and self.last_flexibility != current:
+            return self.last_flexibility
+        if len(self.allowed_flexibility) < 2:
+            return None
+        index = self.allowed_flexibility.index(current)
+        return self.allowed_flexibility[(index + 1) % len(self.allowed_flexibility)]
+
+    def is_preparing_standby(self):
+        """ True when called from the thread that builds the standby scenario. """
+        return self.standby_thread is th.current_thread()
+
+    def prepare_standby(self, flexibility):
+        """ Build the scenario of `flexibility` in a background thread.
+
+            The scenario runs its initial State as usual (MQTT connection, Jobs,
+            start delays), but its MQTT clients stay quiet until the scenario
+            takes over in `take_standby`. Scenarios that keep their state on
+            the class can't be built twice, so the running one is skipped.
+        """
+        if flexibility is None:
+            return
+
+        def build():
+            try:
+                factory = self.get_scenario(flexibility)
+                if factory is not self.active_factory:
+                    self.standby = (flexibility, factory(self))
+            except:
+                print("[!] Couldn't prepare the scenario of flexibility " +
+                      str(flexibility) + " on standby:")
+                logging.exception('')
+
+        self.standby_clients = []
+        self.standby_thread = th.Thread(target=build, name="standby", daemon=True)
+        self.standby_thread.start()
+
+    def take_standby(self, flexibility):
+        """ Activate and return the standby scenario if it's the one of
+            `flexibility`. Otherwise shut it down and return None.
+        """
+        if self.standby_thread is None:
+            return None
+        self.standby_thread.join()
+        self.standby_thread = None
+        standby, self.standby = self.standby, None
+        clients, self.standby_clients = self.standby_clients, []
+        if standby is None:
+            return None
+
+        standby_flexibility, scenario = standby
+        if standby_flexibility != flexibility:
+            # Shut it down like any other scenario, without waiting for it
+            th.Thread(target=scenario.shutdown.run, daemon=True).start()
+            return None
+
+        for client in clients:
+            client.activate()
+        return scenario
+
+    def discard_standby(self):
+        """ Shut down the standby scenario, if any, and wait for it. """
+        if self.standby_thread is not None:
+            self.standby_thread.join()
+            self.standby_thread = None
+        if self.standby is not None:
+            self.standby[1].shutdown.run()
+            self.standby = None
+        self.standby_clients = []
 
     def load_scenario(self):
         """ Scenario will be loaded according to the selected flexibility. """
@@ -365,6 +697,29 @@ class DigitalTwinViewerManager():
         # Selected flexibility must be one of these values, otherwise reset to 0
         if self.selected_flexibility not in self.allowed_flexibility:
             self.selected_flexibility = 0
+        flexibility = self.selected_flexibility
+
+        # Take over from the standby scenario, or build the scenario now.
+        # Taking it first joins the standby thread, which uses the warm scenarios too.
+        scenario = self.take_standby(flexibility)
+        factory = self.get_scenario(flexibility)
+        if scenario is None:
+            scenario = factory(self)
+        self.active_factory = factory
+
+        if self.hot_standby:
+            self.prepare_standby(self.standby_flexibility())
+        self.last_flexibility = flexibility
 
         # Run the scenario
-        self.scenarios[self.selected_flexibility](self).runAll()
+        scenario.runAll()
+
+    def __getstate__(self):
+        """ Leave the warm and standby scenarios, their MQTT clients and
+            settings out of the payload.
+        """
+        state = self.__dict__.copy()
+        for name in ("max_warm_scenarios", "warm_scenarios", "hot_standby", "last_flexibility",
+                     "active_factory", "standby", "standby_thread", "standby_clients"):
+            del state[name]
+        return state
@@ -0,0 +1,70 @@
+import threading as th
+
+from shopfloor_simulation.entities import Header
+
+
+class LatencyStats:
+    ''' Running count, mean, max and last value of a latency, in milliseconds. '''
+
+    def __init__(self):
+        self.count = 0
+        self.mean_ms = 0.0
+        self.max_ms = 0.0
+        self.last_ms = 0.0
+
+    def add(self, seconds):
+        ms = seconds * 1000
+        self.count += 1
+        self.mean_ms += (ms - self.mean_ms) / self.count
+        self.last_ms = ms
+        if ms > self.max_ms:
+            self.max_ms = ms
+
+
+class Metrics:
+    ''' Counters, gauges and latency statistics of a component.
+
+        Metrics have a header, so they show up under `ROOT_TOPIC/metrics/<id>`
+        like any other entity. The MQTT clients always collect theirs, and
+        publish them there every METRICS_INTERVAL seconds if it's set (see
+        `MqttGeneric.publish_metrics`).
+    '''
+
+    def __init__(self, _id, description=""):
+        self.header = Header(_id, _id, "metrics", description)
+        self.counters = {}  # Name -> amount, only ever increases
+        self.gauges = {}  # Name -> current value
+        self.latencies = {}  # Name -> LatencyStats
+        self._lock = th.Lock()
+
+    def increment(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def set_gauge(self, name, value):
+        self.gauges[name] = value
+
+    def add_latency(self, name, seconds):
+        with self._lock:
+            stats = self.latencies.get(name)
+            if stats is None:
+                stats = self.latencies[name] = LatencyStats()
+            stats.add(seconds)
+
+    def snapshot(self):
+        ''' The metrics as plain data, like their payload. Safe to call while they're updated. '''
+        with self._lock:
+            return {"header": dict(vars(self.header)),
+                    "counters": dict(self.counters),
+                    "gauges": dict(self.gauges),
+                    "latencies": {name: dict(vars(stats)) for name, stats in self.latencies.items()}}
+
+    def __getstate__(self):
+        ''' Leave the lock out of the payload (and copies). '''
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = th.Lock()
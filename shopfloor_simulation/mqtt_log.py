@@ -0,0 +1,179 @@
+import mmap
+import struct
+import threading as th
+from time import perf_counter, sleep
+
+import paho.mqtt.client as mqtt
+
+from shopfloor_simulation.mqtt_utils import MqttGeneric
+from shopfloor_simulation.settings import ROOT_TOPIC
+
+''' Binary MQTT message log.
+
+    The log starts with `LOG_MAGIC`, followed by one record per message:
+    a `RECORD_HEADER` (time since the recording started, topic length, payload
+    length, QoS and retain flag) and then the topic and payload bytes.
+'''
+LOG_MAGIC = b"SFMQLOG1"
+RECORD_HEADER = struct.Struct("<dHIBB")
+DEFAULT_TOPICS = [ROOT_TOPIC + "#", "/VR/viewer_info/#"]
+
+
+class MqttLogWriter:
+    ''' Appends messages to a log file. Can be called from any thread. '''
+
+    def __init__(self, path):
+        self.file = open(path, "wb")
+        self.file.write(LOG_MAGIC)
+        self.lock = th.Lock()
+        self.start_time = perf_counter()
+        self.message_count = 0
+
+    def write(self, topic, payload, qos, retain):
+        ''' Append a message, timed from when the writer was created. '''
+        topic = topic.encode("utf-8")
+        header = RECORD_HEADER.pack(
+            perf_counter() - self.start_time, len(topic), len(payload), qos, int(retain))
+        with self.lock:
+            self.file.write(header)
+            self.file.write(topic)
+            self.file.write(payload)
+            self.message_count += 1
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+class MqttLogRecorder(MqttGeneric):
+    ''' Subscribes to the simulation's topics and appends every message to a log file.
+
+        It subscribes with QoS 2, so messages are logged with the QoS they
+        were published with. With MQTT v5, the retain flag is logged as
+        published. With v3.1.1 the broker only sets it on the retained
+        messages sent when subscribing, so live messages are logged (and
+        replayed) as not retained.
+    '''
+
+    subscribe_qos = 2
+    retain_as_published = True
+
+    def __init__(self, path, subscribed_topics=DEFAULT_TOPICS, name="MQTT-Recorder", **kwargs):
+        # Never rate limited: it only publishes its metrics, and those shouldn't be held back
+        super().__init__(subscribed_topics=subscribed_topics, name=name,
+                         rate_limit=None, topic_rate_limits={}, **kwargs)
+        self.writer = MqttLogWriter(path)
+
+    def on_message(self, client, userdata, msg):
+        ''' (OVERRIDDEN) Append the received message to the log. '''
+        self.writer.write(msg.topic, msg.payload, msg.qos, msg.retain)
+
+    def on_publish(self, client, userdata, mid):
+        ''' (OVERRIDDEN) Nothing is published. Do nothing. '''
+        pass
+
+    def mqtt_loop(self, run_event):
+        ''' (OVERRIDDEN) Record until the run_event is cleared, then close the log. '''
+        super().mqtt_loop(run_event)
+        self.writer.close()
+        print("[#] " + self.name + " recorded " +
+              str(self.writer.message_count) + " messages.")
+
+
+class MqttLogReader:
+    ''' Reads a message log through `mmap`.
+
+        `records()` yields memoryviews into the mapped file, so topics and
+        payloads aren't copied until they're used.
+    '''
+
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.map[:len(LOG_MAGIC)] != LOG_MAGIC:
+            self.close()
+            raise ValueError(path + " is not an MQTT message log.")
+
+    def records(self):
+        ''' Yield (time, topic, payload, qos, retain) for every logged message. '''
+        view = memoryview(self.map)
+        offset = len(LOG_MAGIC)
+        end = len(view)
+        try:
+            while offset + RECORD_HEADER.size <= end:
+                timestamp, topic_len, payload_len, qos, retain = RECORD_HEADER.unpack_from(
+                    view, offset)
+                offset += RECORD_HEADER.size
+                topic = view[offset:offset + topic_len]
+                offset += topic_len
+                payload = view[offset:offset + payload_len]
+                offset += payload_len
+                if offset > end:
+                    print("[!] Message log is truncated. Stopping.")
+                    break
+                yield timestamp, topic, payload, qos, bool(retain)
+        finally:
+            view.release()
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+
+class MqttLogPlayer(MqttGeneric):
+    ''' Publishes the messages of a log with their original timing.
+
+        `speed`: 1 replays in real time, N replays N times faster, and 0
+        replays as fast as possible.
+
+        The player is never rate limited: the rate limits keep only the
+        latest message of a topic, so a throttled replay would skip messages.
+    '''
+
+    def __init__(self, path, speed=1.0, name="MQTT-Player", **kwargs):
+        super().__init__(subscribed_topics=[], name=name,
+                         rate_limit=None, topic_rate_limits={}, **kwargs)
+        self.path = path
+        self.speed = speed
+
+    def on_publish(self, client, userdata, mid):
+        ''' (OVERRIDDEN) Do nothing. '''
+        pass
+
+    def replay(self, run_event=None):
+        ''' Publish every logged message. Returns the amount of messages sent. '''
+        reader = MqttLogReader(self.path)
+        records = reader.records()
+        topic = payload = None
+        self.client.loop_start()
+        count = 0
+        info = None  # MQTTMessageInfo of the last message sent
+        start = perf_counter()
+        try:
+            for timestamp, topic, payload, qos, retain in records:
+                if run_event is not None and not run_event.is_set():
+                    break
+                if self.speed > 0:
+                    delay = timestamp / self.speed - (perf_counter() - start)
+                    if delay > 0:
+                        sleep(delay)
+                info = self.publish(str(topic, "utf-8"), payload, qos, retain)
+                count += 1
+
+            # At maximum speed, the tail of the log is still queued in paho
+            while info is not None and info.rc == mqtt.MQTT_ERR_SUCCESS and not info.is_published():
+                if run_event is not None and not run_event.is_set():
+                    break
+                sleep(self.run_event_check_sleep)
+        finally:
+            # The memoryviews must be released before the map is closed
+            topic = payload = None
+            records.close()
+            reader.close()
+            self.client.disconnect()
+            self.client.loop_stop()
+
+        elapsed = perf_counter() - start
+        print("[#] " + self.name + " replayed " + str(count) +
+              " messages in " + str(round(elapsed, 2)) + "s.")
+        return count
@@ -1,32 +1,251 @@
 import paho.mqtt.client as mqtt
-from time import sleep, perf_counter
+from paho.mqtt.packettypes import PacketTypes
+from paho.mqtt.properties import Properties
+import asyncio
+import itertools
+import threading as th
+from time import sleep, perf_counter, time
 import json
 import jsonpickle
 import copy
 from random import randint
-from shopfloor_simulation.entities import Structure
-from shopfloor_simulation.settings import MQTT_HOST, MQTT_PORT, MQTT_USERNAME, MQTT_PASSWORD, MQTT_CLIENT_ID, ROOT_TOPIC
+from shopfloor_simulation.entities import Robot, Structure, motion_position
+from shopfloor_simulation.commands import JOB_STATUS
+from shopfloor_simulation.encoding import JsonEncoding, get_encoding
+from shopfloor_simulation.metrics import Metrics
+from shopfloor_simulation.publish_filter import PayloadFilter
+from shopfloor_simulation.rate_limit import RateLimiter
+from shopfloor_simulation.settings import DEAD_RECKONING_TOLERANCE, FRAME_NAMESPACES, LAYOUT_SNAPSHOT, METRICS_INTERVAL, MQTT_CONTROL_CONNECTION, MQTT_HOST, MQTT_PORT, MQTT_USERNAME, MQTT_PASSWORD, MQTT_CLIENT_ID, MQTT_VERSION, MQTT_SESSION_EXPIRY, MQTT_USER_PROPERTIES, MQTT_RATE_BURST, MQTT_RATE_LIMIT, PAYLOAD_ENCODINGS, PUBLISH_FILTERS, ROOT_TOPIC, TOPIC_RATE_LIMITS
+from shopfloor_simulation.snapshot import SNAPSHOT_HASH_TOPIC, SNAPSHOT_TOPIC, LayoutSnapshot, published_hashes
+from shopfloor_simulation.state_machine import SimulatedScenario
+from shopfloor_simulation.topic_router import TopicRouter
 import os
+from collections import OrderedDict, deque
 from multiprocessing.pool import ThreadPool
 
+DTV_SUBSCRIBE_DELAY = 3  # Time (s) the DTV needs to subscribe to the Structure's topics
+MQTT_PROTOCOLS = {3: mqtt.MQTTv311, 5: mqtt.MQTTv5}  # MQTT_VERSION -> paho protocol
+ECHO_HISTORY = 8  # Own payloads per topic remembered to recognize their echo (MQTT v3.1.1)
+TOPIC_CACHE_SIZE = 10000  # Topics remembered (e.g. as subscribed or not) before starting over
+ACK_TRACKING_SIZE = 10000  # Publishes (and early acks) tracked for the latency before the oldest are dropped
+TOPIC_ALIAS_THRESHOLD = 3  # Publishes on a topic before it gets a topic alias (MQTT v5)
+TOOLTIP_REQUEST_TOPIC = "/VR/viewer_info/tooltip_request"  # The DTV asks for a tooltip
+TOOLTIP_TOPIC = "/VR/viewer_info/tooltip"  # The tooltip shown by the DTV
+DEAD_RECKONED_ATTRIBUTES = ("pose", "pose2", "battery_status")  # Held back while a move is predictable
+
+
+def payload_bytes(payload):
+    ''' The bytes paho sends for `payload`. '''
+    if payload is None:
+        return b""
+    if isinstance(payload, str):
+        return payload.encode("utf-8")
+    if isinstance(payload, (int, float)):
+        return str(payload).encode("ascii")
+    return bytes(payload)
+
+
+def track(times, mid, timestamp):
+    ''' Remember `timestamp` for `mid`, forgetting the oldest beyond ACK_TRACKING_SIZE. '''
+    times[mid] = timestamp
+    if len(times) > ACK_TRACKING_SIZE:
+        times.popitem(last=False)
+
+
+def coalesce_messages(held, newer):
+    ''' The publish that replaces one held back by the rate limits: the newer
+        one, retained and with the higher QoS if either of them asked for it.
+    '''
+    payload, qos, retain, user_properties, content_type = newer
+    return (payload, max(qos, held[1]), retain or held[2], user_properties, content_type)
+
+
+class TopicAliases:
+    ''' Topic aliases of an MQTT v5 connection, from client to broker.
+
+        A topic published TOPIC_ALIAS_THRESHOLD times gets an alias: its next
+        message carries both the topic and the alias, and from then on only
+        the alias (and an empty topic). The broker sets how many aliases can
+        be used. Once they're all taken, the least recently used one is
+        given to the new topic.
+
+        Only QoS 0 messages use aliases: paho retransmits unacknowledged QoS
+        1 and 2 messages after a reconnection as they were, and the aliases
+        of the previous connection mean nothing to the broker then.
+    '''
+
+    def __init__(self, threshold=TOPIC_ALIAS_THRESHOLD):
+        self.threshold = threshold
+        self.maximum = 0  # Aliases allowed by the broker. 0 disables them.
+        self.aliases = OrderedDict()  # Topic -> alias, least recently used first
+        self.counts = {}  # Topic -> publishes, until it gets an alias
+
+    def reset(self, maximum):
+        ''' Forget every alias. Call it on every (re)connection. '''
+        self.maximum = maximum
+        self.aliases.clear()
+        self.counts.clear()
+
+    def resolve(self, topic, qos=0):
+        ''' Return the topic to send and its alias (or None). '''
+        if qos > 0:
+            # Might be retransmitted on a new connection, so send the full topic
+            return topic, None
+        alias = self.aliases.get(topic)
+        if alias is not None:
+            self.aliases.move_to_end(topic)
+            return "", alias
+        if self.maximum == 0:
+            return topic, None
+
+        count = self.counts.get(topic, 0) + 1
+        if count < self.threshold:
+            if len(self.counts) >= TOPIC_CACHE_SIZE:
+                self.counts.clear()
+            self.counts[topic] = count
+            return topic, None
+
+        # Hot topic. Send it once more along with its new alias.
+        self.counts.pop(topic, None)
+        if len(self.aliases) < self.maximum:
+            alias = len(self.aliases) + 1
+        else:
+            _, alias = self.aliases.popitem(last=False)
+        self.aliases[topic] = alias
+        return topic, alias
+
+
+class AsyncioHelper:
+    ''' Drives a paho client from an asyncio event loop instead of paho's network thread.
+
+        paho notifies the helper when its socket opens, closes or has data to
+        write, and the helper registers the matching readers and writers on
+        the event loop. A small task calls `loop_misc()` for keepalives.
+        Must be created before the client connects.
+    '''
+
+    def __init__(self, loop, client):
+        self.loop = loop
+        self.client = client
+        self.misc_task = None
+        self.client.on_socket_open = self.on_socket_open
+        self.client.on_socket_close = self.on_socket_close
+        self.client.on_socket_register_write = self.on_socket_register_write
+        self.client.on_socket_unregister_write = self.on_socket_unregister_write
+
+    def on_socket_open(self, client, userdata, sock):
+        self.loop.add_reader(sock, client.loop_read)
+        self.misc_task = self.loop.create_task(self.misc_loop())
+
+    def on_socket_close(self, client, userdata, sock):
+        self.loop.remove_reader(sock)
+        if self.misc_task is not None:
+            self.misc_task.cancel()
+
+    def on_socket_register_write(self, client, userdata, sock):
+        self.loop.add_writer(sock, client.loop_write)
+
+    def on_socket_unregister_write(self, client, userdata, sock):
+        self.loop.remove_writer(sock)
+
+    async def misc_loop(self):
+        while self.client.loop_misc() == mqtt.MQTT_ERR_SUCCESS:
+            try:
+                await asyncio.sleep(1)
+            except asyncio.CancelledError:
+                break
+
 
 class MqttGeneric:
-    '''Generic class for MQTT protocol communication'''
+    '''Generic class for MQTT protocol communication
+
+        By default, paho's network thread is used (see `mqtt_loop`). If an
+        asyncio event `loop` is given, the client is driven by that loop instead
+        and must be created from inside it; use the `*_async` methods then.
+
+        Messages the client published itself on a subscribed topic aren't
+        passed to `on_message`. With MQTT v5 (`protocol=5`), the broker doesn't
+        send them back at all ("no local" subscriptions). With v3.1.1, the
+        client remembers what it published and drops it when it comes back.
+
+        With MQTT v5, the session outlives short disconnections (see
+        MQTT_SESSION_EXPIRY), frequently used topics are replaced by topic
+        aliases (see TopicAliases), and metadata can be sent as user properties
+        instead of inside the payload (see `publish`).
+
+        Publishing can be rate limited, globally (`rate_limit` messages/s, with
+        bursts of `rate_burst`) and per topic (`topic_rate_limits`, see
+        RateLimiter). Messages over the limits wait, and only the latest one
+        of every topic is sent once there are tokens again. Waiting messages
+        go out on the next `publish` or `flush_rate_limited` call, which the
+        publishing loops make every iteration.
+
+        The client's metrics, and the ones given to `add_metrics`, are
+        published every `metrics_interval` seconds, if it isn't 0 (see
+        `publish_metrics`).
+    '''
+
+    subscribe_qos = 0  # Maximum QoS of the received messages
+    retain_as_published = False  # Receive the retain flag as published (v5), not only for stored messages
 
     def __init__(self, host=MQTT_HOST, port=MQTT_PORT, username=MQTT_USERNAME, password=MQTT_PASSWORD,
-                 run_event_check_sleep: float = 0.1, subscribed_topics: list = [], name="MQTT", root_topic=ROOT_TOPIC):
+                 run_event_check_sleep: float = 0.1, subscribed_topics: list = None, name="MQTT", root_topic=ROOT_TOPIC, loop=None, protocol=MQTT_VERSION, stamp_messages=MQTT_USER_PROPERTIES,
+                 rate_limit=MQTT_RATE_LIMIT, rate_burst=MQTT_RATE_BURST, topic_rate_limits=TOPIC_RATE_LIMITS, metrics_interval=METRICS_INTERVAL):
         self.client_id = MQTT_CLIENT_ID + name + "-" + str(randint(0, 1000))
-        self.client = mqtt.Client(self.client_id)
+        self.protocol = MQTT_PROTOCOLS[protocol]
+        self.client = mqtt.Client(self.client_id, protocol=self.protocol)
         self.client.username_pw_set(username, password)
-        self.client.on_connect = self.on_connect
-        self.client.on_message = self.on_message
-        self.client.on_publish = self.on_publish
-        self.client.connect(host, port, 60)
-        self.subscribed_topics = subscribed_topics
+        self.client.on_connect = self.handle_connect
+        self.client.on_message = self.handle_message
+        self.client.on_publish = self.handle_publish
+        self.client.on_disconnect = self.handle_disconnect
+        self.subscribed_topics = subscribed_topics if subscribed_topics is not None else []
         self.run_event_check_sleep = run_event_check_sleep
         self.name = name
         self.root_topic = root_topic
 
+        # Publish/ack latency tracking
+        self.metrics = Metrics(self.client_id, "MQTT client " + name)
+        self.published_metrics = [self.metrics]  # See `publish_metrics`
+        self.metrics_interval = metrics_interval
+        self.metrics_published_at = perf_counter()
+        # Both are bounded: acks of messages lost while disconnected never come
+        self.publish_times = OrderedDict()  # mid -> perf_counter() at publish
+        self.early_acks = OrderedDict()  # mid -> perf_counter() of acks seen before publish() returned
+        self.publish_lock = th.Lock()
+
+        # Echo suppression without MQTT v5 (see `handle_message`)
+        self.own_payloads = {}  # Topic -> deque of payloads published but not received back yet
+        self.subscribed_cache = {}  # Topic -> whether it matches a subscribed topic
+        self.echo_lock = th.Lock()
+
+        # MQTT v5 topic aliases and user properties (see `publish`)
+        self.topic_aliases = TopicAliases()
+        self.alias_lock = th.Lock()  # Held while publishing, so aliases reach the broker in order
+        self.stamp_messages = stamp_messages
+        self.sequence = itertools.count(1)
+
+        # Rate limits. None publishes everything right away.
+        self.rate_limiter = None
+        if rate_limit is not None or topic_rate_limits:
+            self.rate_limiter = RateLimiter(
+                rate_limit, rate_burst, topic_rate_limits, self.metrics,
+                coalesce=coalesce_messages, cache_size=TOPIC_CACHE_SIZE)
+
+        # asyncio transport
+        self.loop = loop
+        self.asyncio_helper = None
+        if loop is not None:
+            self.asyncio_helper = AsyncioHelper(loop, self.client)
+
+        if self.protocol == mqtt.MQTTv5:
+            # Keep the session (e.g. the subscriptions) if the connection drops
+            properties = Properties(PacketTypes.CONNECT)
+            properties.SessionExpiryInterval = MQTT_SESSION_EXPIRY
+            self.client.connect(host, port, 60, properties=properties)
+        else:
+            self.client.connect(host, port, 60)
+
     def mqtt_loop(self, run_event):
         '''
             Starts the MQTT communication. Designed to be used with the threading library. Shuts down when the run_event is cleared.
@@ -47,20 +266,43 @@ class MqttGeneric:
         '''
         self.client.loop_start()
         while run_event.is_set():
+            self.flush_rate_limited()
+            self.publish_metrics()
             sleep(self.run_event_check_sleep)
         self.client.loop_stop()
         print("[#] " + self.name + " shutting down.")
 
-    def on_connect(self, client, userdata, flags, rc):
+    def handle_connect(self, client, userdata, flags, rc, properties=None):
+        ''' paho's on_connect callback. Start over with the topic aliases, then call `on_connect`. '''
+        # Aliases only last one connection, and the broker sets how many we can use
+        maximum = getattr(properties, "TopicAliasMaximum", 0) if properties is not None else 0
+        with self.alias_lock:
+            self.topic_aliases.reset(maximum)
+        self.on_connect(client, userdata, flags, rc, properties)
+
+    def handle_disconnect(self, client, userdata, rc, properties=None):
+        ''' paho's on_disconnect callback. The connection's topic aliases are gone with it. '''
+        with self.alias_lock:
+            self.topic_aliases.reset(0)
+
+    def on_connect(self, client, userdata, flags, rc, properties=None):
         '''
             The callback for when the client receives a CONNACK response from the server.
             Subscribing in on_connect() means that if we lose the connection and reconnect then subscriptions will be renewed.
         '''
         print("[#] " + self.name + " connected with result code " + str(rc))
         for topic in self.subscribed_topics:
-            client.subscribe(topic)
+            self.subscribe(topic)
             print("[#] " + self.name + " subscribed to: " + topic)
 
+    def subscribe(self, topic):
+        ''' Subscribe to `topic`. With MQTT v5, the broker won't send our own messages back. '''
+        if self.protocol == mqtt.MQTTv5:
+            self.client.subscribe(topic, options=mqtt.SubscribeOptions(
+                qos=self.subscribe_qos, noLocal=True, retainAsPublished=self.retain_as_published))
+        else:
+            self.client.subscribe(topic, self.subscribe_qos)
+
     def on_message(self, client, userdata, msg):
         '''The callback for when a PUBLISH message is received from the server.'''
         print("[#] " + self.name + " " + msg.topic + " " + str(msg.payload))
@@ -69,20 +311,230 @@ class MqttGeneric:
         '''The callback for when a message is published.'''
         print("[#] " + self.name + " ({}s) (msgs={})".format(perf_counter(), mid))
 
+    async def mqtt_loop_async(self, stop_event):
+        ''' asyncio counterpart of `mqtt_loop`. Runs until `stop_event` (asyncio.Event) is set. '''
+        await stop_event.wait()
+        self.client.disconnect()
+        print("[#] " + self.name + " shutting down.")
+
+    def publish(self, topic, payload=None, qos=0, retain=False, user_properties=None, content_type=None):
+        ''' Publish a message and track its publish/ack latency.
+
+            With MQTT v5, `user_properties` (name -> value) are sent as user
+            properties, and so are a sequence number (`seq`) and a timestamp
+            (`ts`) if `stamp_messages` is set. `content_type` is sent as the
+            Content Type property. They're dropped with v3.1.1.
+
+            Returns paho's MQTTMessageInfo, or None if the rate limits hold
+            the message back.
+        '''
+        if self.rate_limiter is not None:
+            self.flush_rate_limited()
+            message = (payload, qos, retain, user_properties, content_type)
+            if not self.rate_limiter.admit(topic, message):
+                return None
+        return self.publish_now(topic, payload, qos, retain, user_properties, content_type)
+
+    def add_metrics(self, metrics):
+        ''' Publish `metrics` (see metrics.Metrics) along with the client's own. '''
+        if metrics not in self.published_metrics:
+            self.published_metrics.append(metrics)
+
+    def publish_metrics(self):
+        ''' Publish the metrics if `metrics_interval` seconds went by since the last time.
+            The publishing loops call it every iteration. 0 never publishes them.
+        '''
+        if not self.metrics_interval:
+            return
+        now = perf_counter()
+        if now - self.metrics_published_at < self.metrics_interval:
+            return
+        self.metrics_published_at = now
+        for metrics in self.published_metrics:
+            self.send_metrics(metrics)
+
+    def send_metrics(self, metrics):
+        ''' Publish `metrics` as JSON on ROOT_TOPIC/metrics/<id>. '''
+        self.publish(self.root_topic + metrics.header._namespace + "/" + metrics.header._id,
+                     json.dumps(metrics.snapshot()))
+
+    def flush_rate_limited(self):
+        ''' Publish the messages held back by the rate limits that can go out now.
+
+            Returns the MQTTMessageInfo of the last one, or None.
+        '''
+        info = None
+        if self.rate_limiter is None:
+            return info
+        for topic, message in self.rate_limiter.release():
+            info = self.publish_now(topic, *message)
+        return info
+
+    def publish_now(self, topic, payload, qos, retain, user_properties, content_type):
+        ''' Publish a message, regardless of the rate limits. '''
+        if isinstance(payload, memoryview):
+            # paho only accepts str, bytes, bytearray and numbers
+            payload = payload.tobytes()
+
+        # Remember it before publishing, the echo may arrive before publish() returns
+        if self.protocol != mqtt.MQTTv5 and self.is_subscribed(topic):
+            with self.echo_lock:
+                payloads = self.own_payloads.get(topic)
+                if payloads is None:
+                    payloads = self.own_payloads[topic] = deque(maxlen=ECHO_HISTORY)
+                payloads.append(payload_bytes(payload))
+
+        start = perf_counter()
+        if self.protocol == mqtt.MQTTv5:
+            info = self.publish_v5(
+                topic, payload, qos, retain, user_properties, content_type)
+        else:
+            info = self.client.publish(topic, payload, qos, retain)
+        if info.rc != mqtt.MQTT_ERR_SUCCESS:
+            # Not sent (e.g. disconnected), so it won't be acked either
+            self.metrics.increment("publish_failed")
+            return info
+        with self.publish_lock:
+            # The ack may already have been handled by another thread
+            ack = self.early_acks.pop(info.mid, None)
+            if ack is None:
+                track(self.publish_times, info.mid, start)
+        if ack is not None:
+            self.metrics.add_latency("publish_ack", ack - start)
+        self.metrics.increment("published")
+        return info
+
+    def publish_v5(self, topic, payload, qos, retain, user_properties, content_type):
+        ''' Publish with a topic alias, user properties and content type, if any. '''
+        metadata = []
+        if self.stamp_messages:
+            metadata = [("seq", str(next(self.sequence))), ("ts", repr(time()))]
+        if user_properties:
+            metadata.extend((name, str(value)) for name, value in user_properties.items())
+
+        with self.alias_lock:
+            sent_topic, alias = self.topic_aliases.resolve(topic, qos)
+            properties = None
+            if alias is not None or metadata or content_type:
+                properties = Properties(PacketTypes.PUBLISH)
+                if alias is not None:
+                    properties.TopicAlias = alias
+                if metadata:
+                    properties.UserProperty = metadata
+                if content_type:
+                    properties.ContentType = content_type
+            info = self.client.publish(sent_topic, payload, qos, retain, properties)
+
+        if not sent_topic:
+            self.metrics.increment("topic_bytes_saved", len(topic))
+        return info
+
+    def is_subscribed(self, topic):
+        ''' True if `topic` matches one of the subscribed topics. '''
+        subscribed = self.subscribed_cache.get(topic)
+        if subscribed is None:
+            if len(self.subscribed_cache) >= TOPIC_CACHE_SIZE:
+                self.subscribed_cache = {}
+            subscribed = any(mqtt.topic_matches_sub(sub, topic)
+                             for sub in self.subscribed_topics)
+            self.subscribed_cache[topic] = subscribed
+        return subscribed
+
+    def is_echo(self, msg):
+        ''' True if `msg` is one of our own messages coming back (MQTT v3.1.1). '''
+        with self.echo_lock:
+            payloads = self.own_payloads.get(msg.topic)
+            if not payloads or msg.payload not in payloads:
+                return False
+            # Messages arrive in the order they were published. Forget this
+            # one and the older ones, whose echoes were lost.
+            while payloads.popleft() != msg.payload:
+                pass
+            if not payloads:
+                del self.own_payloads[msg.topic]
+            return True
+
+    def handle_message(self, client, userdata, msg):
+        ''' paho's on_message callback. Drop our own messages, then call `on_message`. '''
+        if self.protocol != mqtt.MQTTv5 and self.is_echo(msg):
+            self.metrics.increment("echoes_dropped")
+            return
+        self.metrics.increment("received")
+        self.on_message(client, userdata, msg)
+
+    def handle_publish(self, client, userdata, mid):
+        ''' paho's on_publish callback. Record the message latency, then call `on_publish`.
+
+            For QoS 0 the ack is the message being written to the socket, for
+            QoS 1 and 2 it's the broker's acknowledgement.
+        '''
+        ack = perf_counter()
+        with self.publish_lock:
+            start = self.publish_times.pop(mid, None)
+            if start is None:
+                track(self.early_acks, mid, ack)
+        if start is not None:
+            self.metrics.add_latency("publish_ack", ack - start)
+        self.on_publish(client, userdata, mid)
+
+
+class RetiredEntities:
+    ''' Eviction of entities that left the publishing entities (mixin).
+
+        For publishers with `send_payload`, `prev_payloads` and a
+        `retired_entities` deque, whose publishing loop calls
+        `release_retired_entities` at the start of every iteration.
+
+        What's cached about an entity is keyed by `id(entity)`, like in
+        EntityRegistry: the ProcessSteps and Operations of different Jobs are
+        copies with the same header ids.
+    '''
+
+    def retire_entity(self, entity, retain=False):
+        ''' Schedule an entity that left the publishing entities for eviction.
 
-class ShopfloorPublisher(MqttGeneric):
+            The publishing thread handles it at the start of its next loop, once
+            the entity is no longer part of the iterated snapshot: its final
+            state is published (as a retained message if `retain` is True) and
+            its cached payload is dropped from `prev_payloads`.
+        '''
+        self.retired_entities.append((entity, retain))
+
+    def release_retired_entities(self):
+        ''' Publish the final state of retired entities and evict their payloads. '''
+        while self.retired_entities:
+            entity, retain = self.retired_entities.popleft()
+            self.send_payload(entity)
+            if retain:
+                self.publish_retained(entity)
+            self.forget_entity(entity)
+
+    def publish_retained(self, entity):
+        ''' Publish the entity's full payload as a retained message. '''
+        mqtt_topic = self.root_topic + \
+            entity.header._namespace + "/" + entity.header._id
+        self.publish(mqtt_topic, jsonpickle.encode(
+            entity, unpicklable=False), 0, retain=True)
+
+    def forget_entity(self, entity):
+        ''' Drop what's cached about a retired entity. '''
+        self.prev_payloads.pop(id(entity), None)
+
+
+class ShopfloorPublisher(RetiredEntities, MqttGeneric):
     ''' MQTT Publisher that handles the Shopfloor's entities payloads. '''
 
-    def __init__(self, host=MQTT_HOST, port=MQTT_PORT, username=MQTT_USERNAME, password=MQTT_PASSWORD, run_event_check_sleep=0.1, publishing_entities=[], name='MQTT', root_topic=ROOT_TOPIC):
+    def __init__(self, host=MQTT_HOST, port=MQTT_PORT, username=MQTT_USERNAME, password=MQTT_PASSWORD, run_event_check_sleep=0.1, publishing_entities=None, name='MQTT', root_topic=ROOT_TOPIC, loop=None, protocol=MQTT_VERSION):
         super().__init__(host=host, port=port, username=username, password=password,
-                         run_event_check_sleep=run_event_check_sleep, subscribed_topics=[], name=name, root_topic=root_topic)
-        self.publishing_entities = publishing_entities
+                         run_event_check_sleep=run_event_check_sleep, subscribed_topics=None, name=name, root_topic=root_topic, loop=loop, protocol=protocol)
+        self.publishing_entities = publishing_entities if publishing_entities is not None else []
         self.prev_payloads = {}
+        self.retired_entities = deque()  # (entity, retain) waiting for eviction
 
-    def on_connect(self, client, userdata, flags, rc):
+    def on_connect(self, client, userdata, flags, rc, properties=None):
         print("[" + self.name + "] Connected with result code " + str(rc))
         for topic in self.subscribed_topics:
-            client.subscribe(topic)
+            self.subscribe(topic)
             print("[" + self.name + "] Subscribed to: " + topic)
         for entity in self.publishing_entities:
             if isinstance(entity, Structure):
@@ -94,12 +546,28 @@ class ShopfloorPublisher(MqttGeneric):
         self.client.loop_start()
         self.initialize_topics()
         while run_event.is_set():
+            self.release_retired_entities()
             for entity in self.publishing_entities:
                 self.send_payload(entity)
+            self.flush_rate_limited()
+            self.publish_metrics()
             sleep(self.run_event_check_sleep)
         self.client.loop_stop()
         print("[" + self.name + "] Shutting down.")
 
+    async def mqtt_loop_async(self, stop_event):
+        ''' (OVERRIDDEN) asyncio counterpart of `mqtt_loop`. Runs until `stop_event` is set. '''
+        self.initialize_topics()
+        while not stop_event.is_set():
+            self.release_retired_entities()
+            for entity in self.publishing_entities:
+                self.send_payload(entity)
+            self.flush_rate_limited()
+            self.publish_metrics()
+            await asyncio.sleep(self.run_event_check_sleep)
+        self.client.disconnect()
+        print("[" + self.name + "] Shutting down.")
+
     def initialize_topics(self):
         ''' Publish all publishing_entities's payloads to their topics. '''
         # for entity in self.publishing_entities:
@@ -120,14 +588,14 @@ class ShopfloorPublisher(MqttGeneric):
         # Initialize the head topic with the entire payload
         mqtt_topic = self.root_topic + \
             entity.header._namespace + "/" + entity.header._id
-        self.client.publish(mqtt_topic, payload, 0)
+        self.publish(mqtt_topic, payload, 0)
 
         # Initialize the atomic topics (sub-topics) with the payload items
         for key, value in payload_dict.items():
             atomic_topic = mqtt_topic + '/' + key
             if type(value) is not str:  # Avoid escaping characters
                 value = jsonpickle.encode(value)
-            self.client.publish(atomic_topic, value, 0)
+            self.publish(atomic_topic, value, 0)
 
     def send_payload(self, entity):
         ''' Publish the entity's attributes as a JSON payload. 
@@ -140,7 +608,7 @@ class ShopfloorPublisher(MqttGeneric):
         payload = jsonpickle.encode(entity, unpicklable=False)
 
         # The payload id is used to verify if the new payload is different from its previous instance.
-        payload_id = entity.header._id
+        payload_id = id(entity)
 
         # Verify if the payload exists in the prev_payload dict. If it does, check if the new and the prev are different.
         if payload_id not in self.prev_payloads:
@@ -156,7 +624,7 @@ class ShopfloorPublisher(MqttGeneric):
         # Publish the new payload.
         mqtt_topic = self.root_topic + \
             entity.header._namespace + "/" + entity.header._id
-        self.client.publish(mqtt_topic, payload, 0)
+        self.publish(mqtt_topic, payload, 0)
 
         # Update the atomic topics as well
         self.send_payload_atomic(
@@ -185,7 +653,7 @@ class ShopfloorPublisher(MqttGeneric):
                 atomic_topic = mqtt_topic + '/' + key
                 if type(new_value) is not str:  # Avoid escaping characters
                     new_value = jsonpickle.encode(new_value)
-                self.client.publish(atomic_topic, new_value, 0)
+                self.publish(atomic_topic, new_value, 0)
 
     def on_publish(self, client, userdata, mid):
         '''(OVERRIDDEN) The callback for when a message is published. Do nothing.'''
@@ -210,9 +678,9 @@ class ActionBasedManager(MqttGeneric):
         Replaced by the JobManager, which fits scenario01 better.
     '''
 
-    def __init__(self, host=MQTT_HOST, port=MQTT_PORT, username=MQTT_USERNAME, password=MQTT_PASSWORD, run_event_check_sleep=0.1, subscribed_topics=[], name='MQTT', root_topic=ROOT_TOPIC):
+    def __init__(self, host=MQTT_HOST, port=MQTT_PORT, username=MQTT_USERNAME, password=MQTT_PASSWORD, run_event_check_sleep=0.1, subscribed_topics=None, name='MQTT', root_topic=ROOT_TOPIC, protocol=MQTT_VERSION):
         super().__init__(host=host, port=port, username=username, password=password,
-                         run_event_check_sleep=run_event_check_sleep, subscribed_topics=subscribed_topics, name=name, root_topic=root_topic)
+                         run_event_check_sleep=run_event_check_sleep, subscribed_topics=subscribed_topics, name=name, root_topic=root_topic, protocol=protocol)
         self.prev_action = ""
         self.action_queue = []
 
@@ -250,30 +718,33 @@ class JobManager(MqttGeneric):
         frontend's Job Board.
     '''
 
-    def __init__(self, host=MQTT_HOST, port=MQTT_PORT, username=MQTT_USERNAME, password=MQTT_PASSWORD, run_event_check_sleep=0.1, subscribed_topics=[], name='MQTT', root_topic=ROOT_TOPIC):
+    def __init__(self, host=MQTT_HOST, port=MQTT_PORT, username=MQTT_USERNAME, password=MQTT_PASSWORD, run_event_check_sleep=0.1, subscribed_topics=None, name='MQTT', root_topic=ROOT_TOPIC, loop=None, protocol=MQTT_VERSION):
         super().__init__(host=host, port=port, username=username, password=password,
-                         run_event_check_sleep=run_event_check_sleep, subscribed_topics=subscribed_topics, name=name, root_topic=root_topic)
+                         run_event_check_sleep=run_event_check_sleep, subscribed_topics=subscribed_topics, name=name, root_topic=root_topic, loop=loop, protocol=protocol)
         self.job_update_queue = []
 
+        # Received messages are dispatched by topic
+        self.router = TopicRouter()
+        self.router.add(TOOLTIP_REQUEST_TOPIC, self.handle_tooltip_request)
+        self.router.add(self.root_topic + "jobs/{job_id}/status", self.handle_job_status)
+
     def on_message(self, client, userdata, msg):
         '''The TwinViewer publishes messages in the topic /VR/viewer_info/tooltip when the mouse is on an object and publishes its name. 
         On /VR/viewer_info/tooltip, a message can be published that contains "tooltiplines", an array with lines to be displayed in a box.
         In this example, the name of the selected object is published.'''
-        if "tooltip_request" in msg.topic:
-            client.publish("/VR/viewer_info/tooltip", json.dumps({"name": "A1", "tooltiplines": [
-                           "Object: <b>"+str(msg.payload.decode("utf-8"))+"</>"]}), 0)
-        else:
-            try:
-                # A Job Status was published. Check it out.
-                new_status = msg.payload.decode("utf-8")
+        try:
+            self.router.dispatch(msg.topic, msg)
+        except:
+            print("[" + self.name + "] Unrecognized: " + str(msg.payload))
 
-                # The topic should be something like this: ROOT_TOPIC/jobs/<job_id>/status
-                # Get the Job ID
-                topic_parts = msg.topic.split('/')
-                job_id = topic_parts[-2]
-                self.job_update_queue.append((job_id, new_status))
-            except:
-                print("[" + self.name + "] Unrecognized: " + str(msg.payload))
+    def handle_tooltip_request(self, msg):
+        self.publish(TOOLTIP_TOPIC, json.dumps({"name": "A1", "tooltiplines": [
+                       "Object: <b>"+str(msg.payload.decode("utf-8"))+"</>"]}), 0)
+
+    def handle_job_status(self, msg, job_id):
+        ''' A Job Status was published on ROOT_TOPIC/jobs/<job_id>/status. '''
+        new_status = msg.payload.decode("utf-8")
+        self.job_update_queue.append((job_id, new_status))
 
     def update_jobs(self, job_queue: list):
         ''' Search the Job Queue and update the Jobs with their new statuses.
@@ -294,7 +765,49 @@ class JobManager(MqttGeneric):
             self.job_update_queue = []
 
 
-class DTVMqttClient(MqttGeneric):
+class ControlLane(MqttGeneric):
+    ''' The control connection of a DTVMqttClient (see `control_connection`).
+
+        It makes the subscriptions of its owner and passes the received
+        messages to the owner's `on_message`, and it publishes the owner's
+        control messages. It isn't rate limited, and its queue never holds
+        telemetry, so control messages are never stuck behind a backlog of
+        poses.
+    '''
+
+    def __init__(self, owner, host, port, username, password, protocol):
+        super().__init__(host=host, port=port, username=username, password=password,
+                         run_event_check_sleep=owner.run_event_check_sleep, subscribed_topics=owner.subscribed_topics,
+                         name=owner.name + "-control", root_topic=owner.root_topic, loop=owner.loop, protocol=protocol,
+                         rate_limit=None, topic_rate_limits={})
+        self.owner = owner
+        self.connected = False
+
+    def on_connect(self, client, userdata, flags, rc, properties=None):
+        ''' (OVERRIDDEN) Subscribe, unless the owner is on standby (it subscribes once activated). '''
+        print("[#] " + self.name + " connected with result code " + str(rc))
+        self.connected = True
+        if self.owner.active.is_set():
+            self.subscribe_all()
+
+    def subscribe_all(self):
+        ''' Subscribe to the owner's topics. Before connecting, `on_connect` does it. '''
+        if not self.connected:
+            return
+        for topic in self.subscribed_topics:
+            self.subscribe(topic)
+            print("[#] " + self.name + " subscribed to: " + topic)
+
+    def on_message(self, client, userdata, msg):
+        ''' (OVERRIDDEN) Handled by the owner. '''
+        self.owner.on_message(client, userdata, msg)
+
+    def on_publish(self, client, userdata, mid):
+        ''' (OVERRIDDEN) Do nothing. '''
+        pass
+
+
+class DTVMqttClient(RetiredEntities, MqttGeneric):
     ''' 
         Handle MQTT communication for Digital Twin Viewer related scenarios.
 
@@ -302,85 +815,206 @@ class DTVMqttClient(MqttGeneric):
         main program. Be sure to always call client.loop_stop() to shut it down.
 
         If using the client in a publishing thread, calling thread.join() is enough.
+
+        Every namespace (topic subtree) can have its own payload encoding (see
+        `encodings`). Binary encodings are signaled by the Content Type
+        property with MQTT v5, and by a suffix on the namespace with v3.1.1,
+        e.g. `ROOT_TOPIC/metrics.msgpack/<id>`.
+
+        With `layout_snapshot` ("zlib" or "zstd"), the layout is also published
+        as one compressed, retained message (see `snapshot.py`).
+
+        The entities of the `frame_namespaces` are also published as frames:
+        every publishing loop, the payloads of the entities of a namespace that
+        changed go out as one message on `ROOT_TOPIC/frames/<namespace>`:
+
+            {"seq": 42, "keyframe": false, "entities": [payload, ...]}
+
+        `seq` counts the frames of the namespace, so consumers can detect lost
+        frames. The first frame is a keyframe with every entity; the next ones
+        only have the entities that changed. The per-entity topics are still
+        published for the consumers that don't read frames.
+
+        With a `dead_reckoning_tolerance`, moving Robots aren't published every
+        step. Their payload carries the motion segment of the move (see
+        `Robot.move_steps`), and consumers predict the pose from it (see
+        `entities.motion_position`). Until the Robot stops, its pose and
+        battery are only published again as a correction, when the actual
+        position is more than the tolerance away from the prediction; the
+        correction restarts the segment from the actual position. Changes to
+        other attributes are published right away.
+
+        `publish_filters` quantize numeric fields and hold back insignificant
+        changes before payloads are compared (see `publish_filter.py`).
+
+        With a `control_connection`, control traffic has its own connection
+        (see ControlLane): the subscriptions, i.e. the Scenario Manager's
+        properties, Job statuses and tooltip requests, and the messages on
+        `control_topics` (by default the tooltip replies and the Jobs) or on
+        subscribed topics. Telemetry keeps this connection and its rate limits.
+
+        A client created while the Scenario Manager prepares a standby
+        scenario (see `DigitalTwinViewerManager.prepare_standby`) connects,
+        but doesn't subscribe or publish anything until `activate()` is
+        called, so it doesn't interfere with the running scenario.
     '''
 
-    def __init__(self, scenario_manager, scenario, publishing_entities=[], host=MQTT_HOST, port=MQTT_PORT, username=MQTT_USERNAME, password=MQTT_PASSWORD, run_event_check_sleep=0.001, subscribed_topics=[], name='MQTT', root_topic=ROOT_TOPIC):
+    def __init__(self, scenario_manager, scenario, publishing_entities=None, host=MQTT_HOST, port=MQTT_PORT, username=MQTT_USERNAME, password=MQTT_PASSWORD, run_event_check_sleep=0.001, subscribed_topics=None, name='MQTT', root_topic=ROOT_TOPIC, loop=None, static_payloads=None, protocol=MQTT_VERSION, encodings=PAYLOAD_ENCODINGS, layout_snapshot=LAYOUT_SNAPSHOT, frame_namespaces=FRAME_NAMESPACES, dead_reckoning_tolerance=DEAD_RECKONING_TOLERANCE, publish_filters=PUBLISH_FILTERS, control_connection=MQTT_CONTROL_CONNECTION, control_topics=None):
         super().__init__(host=host, port=port, username=username, password=password,
-                         run_event_check_sleep=run_event_check_sleep, subscribed_topics=subscribed_topics, name=name, root_topic=root_topic)
+                         run_event_check_sleep=run_event_check_sleep, subscribed_topics=subscribed_topics, name=name, root_topic=root_topic, loop=loop, protocol=protocol)
 
         self.scenario_manager = scenario_manager  # A ref to the DTV Scenario Manager
         self.scenario = scenario  # A ref to the current scenario
-        self.publishing_entities = publishing_entities
+        self.publishing_entities = publishing_entities if publishing_entities is not None else []
         self.prev_payloads = {}
+        self.retired_entities = deque()  # (entity, retain) waiting for eviction
+        # Entity id -> payload of entities that never change (e.g. the layout)
+        self.static_payloads = static_payloads if static_payloads is not None else {}
+
+        # Namespace -> payload encoding. Other namespaces are sent as JSON.
+        self.json = JsonEncoding()
+        self.encodings = {namespace: get_encoding(name)
+                          for namespace, name in encodings.items() if name != self.json.name}
+
+        # Compression of the layout snapshot. Empty disables the snapshot.
+        self.layout_snapshot = layout_snapshot
+
+        # Namespaces also published as frames, and their frame counters
+        self.frame_namespaces = set(frame_namespaces)
+        self.frame_sequences = {namespace: itertools.count()
+                                for namespace in self.frame_namespaces}
+
+        # Dead reckoning: entity id -> (Robot's motion, published segment, published payload dict)
+        self.dead_reckoning_tolerance = dead_reckoning_tolerance
+        self.reckoned_motions = {}
+        if dead_reckoning_tolerance:
+            # Robots only keep (and serialize) their motion segment when it's used
+            Robot.track_motion = True
+
+        # Quantization and deadband of numeric fields. None publishes them as they are.
+        self.payload_filter = PayloadFilter(
+            publish_filters, self.metrics) if publish_filters else None
+
+        # Received messages are dispatched by topic (see `add_routes`)
+        self.router = TopicRouter()
+        self.add_routes()
+
+        # Standby handling (see `activate`)
+        self.active = th.Event()
+        self.connected = False
+        self.activation_lock = th.Lock()
+        if scenario_manager is not None and scenario_manager.is_preparing_standby():
+            scenario_manager.standby_clients.append(self)
+        else:
+            self.active.set()
+
+        # Control lane: topic filters of the control messages, and topic -> whether it's one
+        self.control = None
+        self.control_topics = control_topics if control_topics is not None else [
+            TOOLTIP_TOPIC, self.root_topic + "jobs/#"]
+        self.control_cache = {}
+        if control_connection:
+            self.control = ControlLane(self, host, port, username, password, protocol)
+            self.add_metrics(self.control.metrics)
+
+        # The scenario's command queue has its own metrics
+        commands = getattr(scenario, "commands", None)
+        if commands is not None:
+            self.add_metrics(commands.metrics)
+
+    def add_routes(self):
+        ''' Route the topics this client handles to their handlers (see TopicRouter). '''
+        manager_topic = self.root_topic + "scenario_manager/+/"
+        self.router.add(TOOLTIP_REQUEST_TOPIC, self.handle_tooltip_request)
+        self.router.add(self.root_topic + "jobs/{job_id}/status", self.handle_job_status)
+        self.router.add(manager_topic + "selected_flexibility", self.handle_selected_flexibility)
+        self.router.add(manager_topic + "is_enabled", self.handle_is_enabled)
+        self.router.add(manager_topic + "action_message", self.handle_action_message)
 
     def on_message(self, client, userdata, msg):
-        # The property name is the last subtopic, e.g.: ROOT_TOPIC/scenario_manager/<property>
-        property_name = msg.topic.split('/')[-1]
+        ''' (OVERRIDDEN) Dispatch the message to the handler of its topic.
 
+            Messages on other topics, e.g. the rest of the Scenario Manager's
+            properties, are ignored.
+        '''
         try:
-            # Tooltip request received
-            if property_name == "tooltip_request":
-                # Publish the name of the selected object to the tooltip topic.
-                tooltip_topic = "/VR/viewer_info/tooltip"
-                content = {
-                    "name": "A1",
-                    "tooltiplines": [
-                        "Object: <b>" +
-                            str(msg.payload.decode("utf-8")) + "</>"
-                    ]
-                }
-                client.publish(tooltip_topic, json.dumps(content), 0)
-
-            # New Job status received
-            elif property_name == "status":
-                # A Job Status was published. Check it out.
-                new_status = msg.payload.decode("utf-8")
-
-                # The topic should be something like this: ROOT_TOPIC/jobs/<job_id>/status
-                # Get the Job ID and append it to the update queue
-                topic_parts = msg.topic.split('/')
-                job_id = topic_parts[-2]
-                self.scenario.job_update_queue.append((job_id, new_status))
-
-            # New flexibility value for the Scenario Manager received
-            elif property_name == "selected_flexibility":
-                self.scenario_manager.selected_flexibility = int(
-                    float(msg.payload))
-
-            # Scenario Manager's is_enabled property
-            elif property_name == "is_enabled":
-                new_is_enabled = msg.payload.decode("utf-8")
-                if new_is_enabled == "false":
-                    self.scenario_manager.is_enabled = False
-                else:
-                    self.scenario_manager.is_enabled = True
-
-            elif property_name == "action_message":
-                action_message = msg.payload.decode("utf-8")
-                if action_message == "BREAKDOWN":
-                    # Signal breakdown
-                    print("Breakdown request received.")
-                    pass
-                elif action_message == "CREATE_JOB":
-                    # Signal creation of new Job.
-                    print("Create Job request received.")
-                    #! For now, create a new Job here with no PS
-                    self.scenario.create_job(
-                        self.scenario, "Porsche-Thingworx", [])
-
+            self.router.dispatch(msg.topic, msg)
         except:
             print("[!] " + self.name + " raised an Exception when processing a value from " +
                   msg.topic + ". Is it of the correct type? Payload: " + str(msg.payload))
 
-    def on_connect(self, client, userdata, flags, rc):
+        # Let the scenario react right away instead of after its current sleep.
+        # Only the blocking scenarios sleep through a Preemption.
+        preemption = getattr(self.scenario, "preemption", None)
+        if preemption is not None:
+            preemption.signal()
+
+    def handle_tooltip_request(self, msg):
+        ''' Publish the name of the selected object to the tooltip topic. '''
+        content = {
+            "name": "A1",
+            "tooltiplines": [
+                "Object: <b>" +
+                    str(msg.payload.decode("utf-8")) + "</>"
+            ]
+        }
+        self.publish(TOOLTIP_TOPIC, json.dumps(content), 0)
+
+    def handle_job_status(self, msg, job_id):
+        ''' A Job status was published. Queue it for the scenario. '''
+        new_status = msg.payload.decode("utf-8")
+        self.scenario.commands.put(JOB_STATUS, job_id, new_status)
+
+    def handle_selected_flexibility(self, msg):
+        ''' New flexibility value for the Scenario Manager received. '''
+        self.scenario_manager.selected_flexibility = int(float(msg.payload))
+
+    def handle_is_enabled(self, msg):
+        ''' Scenario Manager's is_enabled property. '''
+        new_is_enabled = msg.payload.decode("utf-8")
+        if new_is_enabled == "false":
+            self.scenario_manager.is_enabled = False
+        else:
+            self.scenario_manager.is_enabled = True
+
+    def handle_action_message(self, msg):
+        ''' Action requested from the DTV, e.g. creating a new Job. '''
+        action_message = msg.payload.decode("utf-8")
+        if action_message == "BREAKDOWN":
+            # Signal breakdown
+            print("Breakdown request received.")
+            pass
+        elif action_message == "CREATE_JOB":
+            # Signal creation of new Job.
+            print("Create Job request received.")
+            #! For now, create a new Job here with no PS
+            SimulatedScenario.create_job(
+                self.scenario, "Porsche-Thingworx", [])
+
+    def on_connect(self, client, userdata, flags, rc, properties=None):
         """
             For the DTV, it's necessary to initialize the Structure topic upon
             connection, so that the DTV knows which topics it needs to subscribe to.
         """
         print("[#] " + self.name + " connected with result code " + str(rc))
-        for topic in self.subscribed_topics:
-            client.subscribe(topic)
-            print("[#] " + self.name + " subscribed to: " + topic)
+        with self.activation_lock:
+            self.connected = True
+            active = self.active.is_set()
+            if active:
+                self.subscribe_and_initialize_structures()
+
+        # Delay so that the DTV subscribes to the topics. With asyncio, the
+        # publish task waits instead, since sleeping here would block the loop.
+        if active and self.loop is None:
+            sleep(DTV_SUBSCRIBE_DELAY)
+
+    def subscribe_and_initialize_structures(self):
+        if self.control is not None:
+            self.control.subscribe_all()
+        else:
+            for topic in self.subscribed_topics:
+                self.subscribe(topic)
+                print("[#] " + self.name + " subscribed to: " + topic)
 
         # Initialize structure topics
         structures = [
@@ -389,60 +1023,259 @@ class DTVMqttClient(MqttGeneric):
             self.initialize_single_topic(structure)
             print("[#] " + self.name + " initialized " +
                   structure.header.name + " data")
-        sleep(3)  # Delay so that the DTV subscribes to the topics
+
+        self.publish_layout_snapshot()
+
+    def publish_layout_snapshot(self):
+        ''' Publish the layout snapshot and its hash as retained messages.
+
+            Nothing is sent if this process already published a snapshot with
+            the same hash, e.g. when the next scenario has the same layout.
+        '''
+        if not self.layout_snapshot:
+            return
+        snapshot = LayoutSnapshot(
+            self.publishing_entities, self.static_payloads, self.layout_snapshot)
+        snapshot_topic = self.root_topic + SNAPSHOT_TOPIC
+        if snapshot.entity_count == 0 or published_hashes.get(snapshot_topic) == snapshot.hash:
+            return
+
+        # The snapshot goes first, so a viewer that sees the new hash finds the new snapshot
+        self.publish(snapshot_topic, snapshot.blob, 1, retain=True,
+                     user_properties={"hash": snapshot.hash,
+                                      "compression": snapshot.compression},
+                     content_type="application/json+" + snapshot.compression)
+        self.publish(self.root_topic + SNAPSHOT_HASH_TOPIC, snapshot.hash, 1, retain=True)
+        published_hashes[snapshot_topic] = snapshot.hash
+
+        self.metrics.set_gauge("layout_snapshot_bytes", len(snapshot.blob))
+        print("[#] " + self.name + " published the layout snapshot: " +
+              str(snapshot.entity_count) + " entities, " + str(snapshot.size) +
+              " bytes (" + str(len(snapshot.blob)) + " compressed).")
+
+    def activate(self):
+        ''' Start subscribing and publishing, e.g. when a standby scenario takes over.
+
+            The previous scenario already had the DTV subscribe to the layout's
+            topics, so there's no subscribe delay here.
+        '''
+        with self.activation_lock:
+            if self.active.is_set():
+                return
+            self.active.set()
+            if self.connected:
+                self.subscribe_and_initialize_structures()
+
+    def publish(self, topic, payload=None, qos=0, retain=False, user_properties=None, content_type=None):
+        ''' (OVERRIDDEN) Publish control messages on the control lane, if any, and the rest here. '''
+        if self.control is not None and self.is_control_topic(topic):
+            return self.control.publish(topic, payload, qos, retain, user_properties, content_type)
+        return super().publish(topic, payload, qos, retain, user_properties, content_type)
+
+    def is_control_topic(self, topic):
+        ''' True if `topic` matches a control topic or a subscribed one (so its echo is recognized). '''
+        control = self.control_cache.get(topic)
+        if control is None:
+            if len(self.control_cache) >= TOPIC_CACHE_SIZE:
+                self.control_cache = {}
+            control = self.control.is_subscribed(topic) or any(
+                mqtt.topic_matches_sub(sub, topic) for sub in self.control_topics)
+            self.control_cache[topic] = control
+        return control
+
+    def stop_control_lane(self):
+        if self.control is not None:
+            self.control.client.disconnect()
+            if self.loop is None:
+                self.control.client.loop_stop()
 
     def publish_thread(self, run_event):
         ''' Starts the MQTT communication. Updates and sends payloads every loop.'''
         self.client.loop_start()
-        self.initialize_topics()
+        if self.control is not None:
+            self.control.client.loop_start()
+
+        # A standby client waits until it's activated (or shut down)
+        while not self.active.wait(self.run_event_check_sleep):
+            if not run_event.is_set():
+                break
+        if self.active.is_set():
+            self.initialize_topics()
 
         # Publishing loop
         while run_event.is_set():
-            for entity in self.publishing_entities:
-                self.send_payload(entity)
+            self.release_retired_entities()
+            self.send_payloads()
+            self.flush_rate_limited()
+            self.publish_metrics()
             sleep(self.run_event_check_sleep)
 
         # Stop MQTT
+        self.stop_control_lane()
         self.client.loop_stop()
         print("[#] " + self.name + " shutting down.")
 
+    async def publish_task(self, stop_event):
+        ''' asyncio counterpart of `publish_thread`. Runs until `stop_event` (asyncio.Event) is set. '''
+        if self.active.is_set():
+            # Give the DTV time to subscribe to the topics of the Structure
+            await asyncio.sleep(DTV_SUBSCRIBE_DELAY)
+        else:
+            # A standby client waits until it's activated (or stopped)
+            while not self.active.is_set() and not stop_event.is_set():
+                await asyncio.sleep(self.run_event_check_sleep)
+        self.initialize_topics()
+
+        # Publishing loop
+        while not stop_event.is_set():
+            self.release_retired_entities()
+            self.send_payloads()
+            self.flush_rate_limited()
+            self.publish_metrics()
+            await asyncio.sleep(self.run_event_check_sleep)
+
+        # Stop MQTT
+        self.stop_control_lane()
+        self.client.disconnect()
+        print("[#] " + self.name + " shutting down.")
+
     def initialize_topics(self):
-        ''' Publish all publishing_entities's payloads to their topics. '''
+        ''' Publish all publishing_entities's payloads to their topics, and the keyframes. '''
+        frames = {}  # Namespace -> payloads
         for entity in self.publishing_entities:
-            self.initialize_single_topic(entity)
+            payload = self.initialize_single_topic(entity)
+            if payload is not None and entity.header._namespace in self.frame_namespaces:
+                frames.setdefault(entity.header._namespace, []).append(payload)
+
+        for namespace, payloads in frames.items():
+            self.send_frame(namespace, payloads, keyframe=True)
 
     def initialize_single_topic(self, entity):
-        ''' Publish a single entity's payload to its topic. '''
-        # Encode the entity object to a JSON string
-        payload = jsonpickle.encode(entity, unpicklable=False)
+        ''' Publish a single entity's payload to its topic. Returns the payload. '''
+        # A standby client publishes nothing. Once activated, all topics are initialized.
+        if not self.active.is_set():
+            return None
+
+        # Encode the entity object, unless it's pre-serialized
+        encoding = self.encoding_of(entity)
+        payload = self.encode_entity(entity, encoding)
 
         # Decode the payload to a Python dict
-        payload_dict = jsonpickle.decode(payload)
+        payload_dict = encoding.decode(payload)
 
         # Initialize the head topic with the entire payload
-        mqtt_topic = self.root_topic + \
-            entity.header._namespace + "/" + entity.header._id
-        self.client.publish(mqtt_topic, payload, 0)
+        mqtt_topic = self.entity_topic(entity, encoding)
+        self.publish(mqtt_topic, payload, 0, content_type=self.content_type(encoding))
 
         # Initialize the atomic topics (sub-topics) with the payload items
         for key, value in payload_dict.items():
             atomic_topic = mqtt_topic + '/' + key
-            if type(value) is not str:  # Avoid escaping characters
-                value = jsonpickle.encode(value)
-            self.client.publish(atomic_topic, value, 0)
+            self.publish(atomic_topic, encoding.encode_value(value), 0,
+                         content_type=self.content_type(encoding))
+
+        return payload
+
+    def encoding_of(self, entity):
+        ''' The payload encoding of the entity's namespace. '''
+        return self.encodings.get(entity.header._namespace, self.json)
+
+    def encode_entity(self, entity, encoding):
+        ''' Encode the (filtered) entity, or return its pre-serialized JSON payload. '''
+        if encoding is self.json:
+            payload = self.static_payloads.get(entity.header._id)
+            if payload is not None:
+                return payload
+        if self.payload_filter is not None:
+            return encoding.encode_value(self.payload_dict(entity, encoding))
+        return encoding.encode(entity)
+
+    def payload_dict(self, entity, encoding):
+        ''' The entity's payload as it's encoded on the wire, decoded back and filtered.
+
+            The filter works on the payload itself rather than on a separate
+            serialization, so the published payload only differs in the
+            filtered fields.
+        '''
+        payload_dict = encoding.decode(encoding.encode(entity))
+        if self.payload_filter is not None:
+            self.payload_filter.apply(id(entity), payload_dict)
+        return payload_dict
+
+    def entity_topic(self, entity, encoding):
+        ''' The entity's topic. '''
+        return self.root_topic + self.namespace_level(entity.header._namespace, encoding) + \
+            "/" + entity.header._id
+
+    def namespace_level(self, namespace, encoding):
+        ''' The namespace's topic level. With v3.1.1, binary encodings add a suffix. '''
+        if encoding is not self.json and self.protocol != mqtt.MQTTv5:
+            return namespace + "." + encoding.name
+        return namespace
+
+    def content_type(self, encoding):
+        ''' The Content Type property of binary payloads. JSON is left implicit. '''
+        return None if encoding is self.json else encoding.content_type
+
+    def send_metrics(self, metrics):
+        ''' (OVERRIDDEN) Publish `metrics` with the payload encoding of their namespace. '''
+        encoding = self.encodings.get(metrics.header._namespace, self.json)
+        self.publish(self.entity_topic(metrics, encoding), encoding.encode_value(metrics.snapshot()),
+                     0, content_type=self.content_type(encoding))
+
+    def send_payloads(self):
+        ''' Send the payloads of the publishing entities that changed, and the frames. '''
+        frames = {}  # Namespace -> payloads that changed
+        for entity in self.publishing_entities:
+            payload = self.send_payload(entity)
+            if payload is not None and entity.header._namespace in self.frame_namespaces:
+                frames.setdefault(entity.header._namespace, []).append(payload)
+
+        for namespace, payloads in frames.items():
+            self.send_frame(namespace, payloads)
+
+    def send_frame(self, namespace, payloads, keyframe=False):
+        ''' Publish the payloads of a namespace as one frame (see the class docstring). '''
+        sequence = next(self.frame_sequences[namespace])
+        encoding = self.encodings.get(namespace, self.json)
+        if encoding is self.json:
+            # The payloads are JSON already, so they're joined instead of encoded again
+            frame = '{"seq": ' + str(sequence) + ', "keyframe": ' + \
+                ("true" if keyframe else "false") + \
+                ', "entities": [' + ", ".join(payloads) + ']}'
+        else:
+            frame = encoding.encode_value({
+                "seq": sequence, "keyframe": keyframe,
+                "entities": [encoding.decode(payload) for payload in payloads]})
+
+        frame_topic = self.root_topic + "frames/" + self.namespace_level(namespace, encoding)
+        self.publish(frame_topic, frame, 0, content_type=self.content_type(encoding))
+        self.metrics.increment("frames")
 
     def send_payload(self, entity):
         ''' Publish the entity's attributes as a JSON payload. 
 
         If the payload is the same as the previous one, it will be ignored.
         This function also publishes to sub-topics (called atomic topics).        
+        Returns the payload if it was published, None otherwise.
         '''
 
-        # Encode the entity object to JSON format
-        payload = jsonpickle.encode(entity, unpicklable=False)
-
         # The payload id is used to verify if the new payload is different from its previous instance.
-        payload_id = entity.header._id
+        payload_id = id(entity)
+
+        # Static payloads never change, so there's nothing to encode or compare
+        if entity.header._id in self.static_payloads and payload_id in self.prev_payloads:
+            return None
+
+        # Encode the entity object. Moving entities may not need to be published.
+        encoding = self.encoding_of(entity)
+        motion = getattr(entity, "motion", None)
+        if self.dead_reckoning_tolerance and motion is not None:
+            payload = self.reckon_payload(entity, motion, encoding)
+            if payload is None:
+                return None
+        else:
+            self.reckoned_motions.pop(payload_id, None)
+            payload = self.encode_entity(entity, encoding)
 
         # Verify if the payload exists in the prev_payload dict. If it does, check if the new and the prev are different.
         if payload_id not in self.prev_payloads:
@@ -453,41 +1286,86 @@ class DTVMqttClient(MqttGeneric):
             prev_payload = self.prev_payloads[payload_id]
             if payload == prev_payload:
                 # The new payload is the same as its previous instance. Do nothing and return.
-                return
+                return None
 
         # Publish the new payload.
-        mqtt_topic = self.root_topic + \
-            entity.header._namespace + "/" + entity.header._id
-        self.client.publish(mqtt_topic, payload, 0)
+        mqtt_topic = self.entity_topic(entity, encoding)
+        self.publish(mqtt_topic, payload, 0, content_type=self.content_type(encoding))
 
         # Update the atomic topics as well
         self.send_payload_atomic(
-            self.prev_payloads[payload_id], payload, mqtt_topic)
+            self.prev_payloads[payload_id], payload, mqtt_topic, encoding)
 
         # Update prev_payloads.
         self.prev_payloads[payload_id] = copy.deepcopy(payload)
+        return payload
 
-    def send_payload_atomic(self, prev_payload, payload, mqtt_topic):
+    def reckon_payload(self, entity, motion, encoding):
+        ''' The payload of a moving entity, or None while consumers can predict it (dead reckoning). '''
+        payload_dict = self.payload_dict(entity, encoding)
+        reckoned = self.reckoned_motions.get(id(entity))
+
+        if reckoned is None or reckoned[0] is not motion:
+            # A new move: publish its segment
+            segment = motion
+        else:
+            _, segment, published = reckoned
+            position = payload_dict["pose"]["position"]
+            now = time()
+            deviation = max(abs(actual - predicted) for actual, predicted
+                            in zip(position, motion_position(segment, now)))
+            unchanged = all(value == published.get(key) for key, value in payload_dict.items()
+                            if key not in DEAD_RECKONED_ATTRIBUTES and key != "motion")
+            if deviation <= self.dead_reckoning_tolerance and unchanged:
+                self.metrics.increment("poses_reckoned")
+                return None
+            if deviation > self.dead_reckoning_tolerance:
+                # Correction: continue the move from the actual position
+                segment = dict(segment, start=position, start_time=now)
+                self.metrics.increment("pose_corrections")
+
+        payload_dict["motion"] = segment
+        self.reckoned_motions[id(entity)] = (motion, segment, payload_dict)
+        return encoding.encode_value(payload_dict)
+
+    def send_payload_atomic(self, prev_payload, payload, mqtt_topic, encoding=None):
         ''' Split the payload into multiple atomic payloads with their own topics. 
 
             `prev_payload`: the previous instance of the payload.
 
-            `payload`: the jsonpickle encoded entity (Python object).
+            `payload`: the encoded entity (Python object).
 
             `mqtt_topic`: the publishing entity's topic.
+
+            `encoding`: the encoding of the payloads. JSON by default.
         '''
+        if encoding is None:
+            encoding = self.json
+
         # Decode payloads to dict
-        prev_payload_dict = jsonpickle.decode(prev_payload)
-        payload_dict = jsonpickle.decode(payload)
+        prev_payload_dict = encoding.decode(prev_payload)
+        payload_dict = encoding.decode(payload)
 
         # Search for updates to publish
         for key, new_value in payload_dict.items():
             if prev_payload_dict[key] != new_value:
                 # Previous value is different from current. Publish the update.
                 atomic_topic = mqtt_topic + '/' + key
-                if type(new_value) is not str:  # Avoid escaping characters
-                    new_value = jsonpickle.encode(new_value)
-                self.client.publish(atomic_topic, new_value, 0)
+                self.publish(atomic_topic, encoding.encode_value(new_value), 0,
+                             content_type=self.content_type(encoding))
+
+    def publish_retained(self, entity):
+        ''' (OVERRIDDEN) Publish the entity's full payload, in its encoding, as a retained message. '''
+        encoding = self.encoding_of(entity)
+        self.publish(self.entity_topic(entity, encoding), encoding.encode(entity), 0,
+                     retain=True, content_type=self.content_type(encoding))
+
+    def forget_entity(self, entity):
+        ''' (OVERRIDDEN) Also drop the dead reckoning and filter state of the entity. '''
+        super().forget_entity(entity)
+        self.reckoned_motions.pop(id(entity), None)
+        if self.payload_filter is not None:
+            self.payload_filter.forget(id(entity))
 
     def on_publish(self, client, userdata, mid):
         '''The callback for when a message is published. Do nothing.'''
@@ -0,0 +1,261 @@
+import asyncio
+from collections import deque
+
+from shopfloor_simulation.entities import MOVEMENT_SLEEP
+from shopfloor_simulation.state_machine import AsyncState, AsyncStateMachine
+
+HOLD_CHECK_TIME = 0.1  # Simulated time between checks of an ON_HOLD Job's status
+
+
+class ProductionLine:
+    ''' The stations of a pipelined scenario, their capacity and their robots.
+
+        `capacities`: station id -> how many Jobs the station can work on at
+        once. Stations not in the dict use `default_capacity`.
+
+        `station_robots`: station id -> Robots that are `BUSY` while a Job is
+        being worked on at that station, and are assigned to it
+        (`current_station`), like in the OPxx States of the serial flow. A
+        Robot can work at several stations; it's `IDLE` once none of them
+        needs it anymore.
+
+        `station_positions`: station id -> xyz coordinates a product is moved
+        to before it's worked on at that station.
+
+        `products`: Robots that represent the products (e.g. the cars). Every
+        Job in the pipeline takes one while it's running (see
+        `take_product`), and moves it from station to station.
+    '''
+
+    def __init__(self, capacities=None, default_capacity=1, station_robots=None,
+                 station_positions=None, products=None):
+        self.capacities = capacities if capacities is not None else {}
+        self.default_capacity = default_capacity
+        self.station_robots = station_robots if station_robots is not None else {}
+        self.station_positions = station_positions if station_positions is not None else {}
+        self.products = list(products) if products is not None else []
+        self.free_products = deque(self.products)  # Products no Job is using
+        self.semaphores = {}  # station id -> asyncio.Semaphore, created on first use
+        self.occupancy = {}  # station id -> amount of Jobs at the station
+        self.robot_jobs = {}  # id(Robot) -> amount of Jobs the Robot is working on
+        self.finished_jobs = deque()  # Jobs that went through all their steps
+
+    def reset(self):
+        ''' Forget the Jobs and semaphores of a previous run (e.g. a previous event loop). '''
+        self.semaphores = {}
+        self.occupancy = {}
+        self.robot_jobs = {}
+        self.free_products = deque(self.products)
+        self.finished_jobs.clear()
+
+    def take_product(self):
+        ''' A product for a new Job, or None if they're all in use. '''
+        if self.free_products:
+            return self.free_products.popleft()
+        return None
+
+    def return_product(self, product):
+        ''' Give back the product of a finished Job. '''
+        if product is not None:
+            self.free_products.append(product)
+
+    async def acquire(self, station):
+        ''' Wait until `station` (a Header) has room for another Job, then take it. '''
+        semaphore = self.semaphores.get(station._id)
+        if semaphore is None:
+            semaphore = self.semaphores[station._id] = asyncio.Semaphore(
+                self.capacities.get(station._id, self.default_capacity))
+        await semaphore.acquire()
+        self.occupancy[station._id] = self.occupancy.get(station._id, 0) + 1
+        for robot in self.station_robots.get(station._id, []):
+            self.robot_jobs[id(robot)] = self.robot_jobs.get(id(robot), 0) + 1
+            robot.status = "BUSY"
+            robot.current_station = station
+
+    def release(self, station):
+        ''' Give the room taken by `acquire` back to the station. '''
+        self.occupancy[station._id] -= 1
+        for robot in self.station_robots.get(station._id, []):
+            self.robot_jobs[id(robot)] -= 1
+            if self.robot_jobs[id(robot)] == 0:
+                robot.status = "IDLE"
+        self.semaphores[station._id].release()
+
+
+class ProcessStepGraph:
+    ''' Dependency graph (DAG) of a Job's ProcessSteps.
+
+        Built from every PS's `prevProcessStep` and `nextProcessStep`, which can
+        hold several ids. Links to PSs that aren't part of the Job (e.g. a Job
+        that starts halfway through the line) count as already satisfied.
+
+        Steps are released through a ready-queue: `pop_ready()` hands out steps
+        whose predecessors are all done, and `done()` releases the successors
+        of a finished step. Steps are referred to by their index in the Job's
+        `process_steps`, like in `Job.begin_process_step`.
+    '''
+
+    def __init__(self, process_steps):
+        index_by_id = {ps.header._id: i for i, ps in enumerate(process_steps)}
+        self.successors = [set() for _ in process_steps]
+        for i, ps in enumerate(process_steps):
+            for prev_id in ps.predecessors():
+                if prev_id in index_by_id:
+                    self.successors[index_by_id[prev_id]].add(i)
+            for next_id in ps.successors():
+                if next_id in index_by_id:
+                    self.successors[i].add(index_by_id[next_id])
+
+        self.pending = [0] * len(process_steps)  # Unfinished predecessors per step
+        for successors in self.successors:
+            for i in successors:
+                self.pending[i] += 1
+
+        # Steps without predecessors in the Job can start right away
+        self.ready = deque(i for i, count in enumerate(self.pending) if count == 0)
+        self.remaining = len(process_steps)
+        self.check_acyclic()
+
+    def check_acyclic(self):
+        ''' Raise a ValueError if the ProcessSteps depend on each other in a cycle. '''
+        pending = list(self.pending)
+        queue = deque(self.ready)
+        visited = 0
+        while queue:
+            i = queue.popleft()
+            visited += 1
+            for j in self.successors[i]:
+                pending[j] -= 1
+                if pending[j] == 0:
+                    queue.append(j)
+        if visited != len(pending):
+            raise ValueError("ProcessSteps have cyclic dependencies.")
+
+    def pop_ready(self):
+        ''' Index of a step that can be started, or None if there's none right now. '''
+        if self.ready:
+            return self.ready.popleft()
+        return None
+
+    def done(self, index):
+        ''' Mark a step as finished and release the successors that became ready. '''
+        self.remaining -= 1
+        for i in self.successors[index]:
+            self.pending[i] -= 1
+            if self.pending[i] == 0:
+                self.ready.append(i)
+
+    def is_finished(self):
+        return self.remaining == 0
+
+
+class JobMachine(AsyncStateMachine):
+    ''' Runs a single Job through its ProcessSteps, following their dependencies.
+
+        Steps are dispatched from the Job's ProcessStepGraph: every step whose
+        predecessors are done starts right away, so independent steps run in
+        parallel. Every step waits for room at its station, so several
+        JobMachines sharing a ProductionLine work like a pipeline: while one
+        Job is at a station, the others can be at the other stations. A Job
+        that is `ON_HOLD` stops only itself. Once done, the Job is appended to
+        the line's `finished_jobs` for the scenario to retire.
+
+        Like the Transition States of the serial flow, the Job's product (see
+        `ProductionLine.take_product`) is moved to the station of every step
+        before the step begins.
+    '''
+
+    def __init__(self, job, line, step_time, clock=None):
+        self.job = job
+        self.line = line
+        self.step_time = step_time  # Simulated time a ProcessStep takes
+        self.graph = ProcessStepGraph(job.process_steps)
+        self.product = None  # Robot moved along with the Job, taken in RunSteps
+        self.product_lock = None  # Parallel steps move the product one at a time
+        AsyncStateMachine.__init__(self, run_steps, clock)
+
+    async def wait_while_on_hold(self):
+        while self.job.status == "ON_HOLD":
+            await self.clock.sleep(HOLD_CHECK_TIME)
+
+    async def work(self, seconds):
+        ''' Wait for `seconds` of simulated time. Time spent ON_HOLD doesn't count. '''
+        remaining = seconds
+        while remaining > 0:
+            await self.wait_while_on_hold()
+            tick = min(remaining, HOLD_CHECK_TIME)
+            await self.clock.sleep(tick)
+            remaining -= tick
+
+    async def move_product(self, station):
+        ''' Move the Job's product to `station`. The move pauses while the Job is ON_HOLD. '''
+        target = self.line.station_positions.get(station._id)
+        if self.product is None or target is None:
+            return
+        async with self.product_lock:
+            steps = self.product.move_steps(target)
+            try:
+                for _ in steps:
+                    await self.wait_while_on_hold()
+                    await self.clock.sleep(MOVEMENT_SLEEP)
+            finally:
+                steps.close()
+
+    async def run_step(self, index):
+        ''' Wait for room at the step's station, move the product there, then
+            work on the step. Returns `index`.
+        '''
+        station = self.job.process_steps[index].station
+        await self.wait_while_on_hold()
+        await self.line.acquire(station)
+        try:
+            await self.move_product(station)
+            self.job.begin_process_step(index)
+            await self.work(self.step_time)
+            self.job.finish_process_step(index)
+        finally:
+            self.line.release(station)
+        return index
+
+
+class RunSteps(AsyncState):
+    ''' Dispatch ready steps as they're released and wait until all of them are done. '''
+
+    async def run(self, machine):
+        machine.product = machine.line.take_product()
+        machine.product_lock = asyncio.Lock()
+        running = set()
+        try:
+            while True:
+                index = machine.graph.pop_ready()
+                while index is not None:
+                    running.add(asyncio.ensure_future(machine.run_step(index)))
+                    index = machine.graph.pop_ready()
+                if not running:
+                    break
+                done, running = await asyncio.wait(
+                    running, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    machine.graph.done(task.result())
+        finally:
+            for task in running:
+                task.cancel()
+
+    def next(self, machine):
+        return finish_job
+
+
+class FinishJob(AsyncState):
+    async def run(self, machine):
+        machine.line.return_product(machine.product)
+        machine.product = None
+        machine.line.finished_jobs.append(machine.job)
+        machine.is_active = False
+
+    def next(self, machine):
+        return finish_job
+
+
+# State definition (shared by every JobMachine)
+run_steps = RunSteps()
+finish_job = FinishJob()
@@ -0,0 +1,131 @@
+import math
+
+from shopfloor_simulation.metrics import Metrics
+
+''' Quantization and deadband of numeric fields before they're published.
+
+    Many updates are insignificant: the battery drains by 0.0001 every step,
+    positions change by fractions of a millimeter. Each one still changes the
+    payload, so the whole payload and its atomic topics are published again.
+    A PayloadFilter rounds such fields and holds them back until they changed
+    enough, before the payloads are compared.
+
+    Rules are field path -> {"quantum": q, "deadband": d}, where the path is
+    dotted (e.g. "pose.position") and both keys are optional:
+    - quantum: the value is rounded to a multiple of q (e.g. 0.001 for 0.1% of
+      the battery, 1 for millimeters).
+    - deadband: the last published value is kept until the value moves more
+      than d away from it.
+
+    Fields can be numbers, lists of numbers (e.g. positions) or comma separated
+    strings with numbers (e.g. pose2, "PE,x,y,z,a,b,c"), whose numeric parts
+    are filtered.
+'''
+
+
+def decimals_of(quantum):
+    ''' Decimal places of `quantum`, to drop the float noise of rounding. '''
+    return max(0, -math.floor(math.log10(quantum))) if quantum < 1 else 0
+
+
+class FieldRule:
+    ''' Quantization and deadband of one field. '''
+
+    def __init__(self, path, quantum=None, deadband=None):
+        if quantum is not None and quantum <= 0:
+            raise ValueError("The quantum of " + path + " must be positive.")
+        if deadband is not None and deadband < 0:
+            raise ValueError("The deadband of " + path + " can't be negative.")
+        self.path = path
+        self.keys = path.split(".")
+        self.quantum = quantum
+        self.deadband = deadband
+        self.decimals = decimals_of(quantum) if quantum is not None else 0
+
+    def quantize(self, value):
+        ''' Round a number, the numbers of a list or the numeric parts of a string. '''
+        if self.quantum is None:
+            return value
+        if isinstance(value, bool):
+            return value
+        if isinstance(value, (int, float)):
+            rounded = round(value / self.quantum) * self.quantum
+            if float(self.quantum).is_integer():
+                return int(rounded)
+            return round(rounded, self.decimals)
+        if isinstance(value, list):
+            return [self.quantize(x) for x in value]
+        if isinstance(value, str):
+            return ",".join(self.quantize_part(part) for part in value.split(","))
+        return value
+
+    def quantize_part(self, part):
+        try:
+            number = float(part)
+        except ValueError:
+            return part
+        return str(self.quantize(number))
+
+    def within_deadband(self, value, published):
+        ''' Whether `value` is close enough to the `published` one to keep the latter. '''
+        if self.deadband is None or published is None:
+            return False
+        return distance(value, published) <= self.deadband
+
+
+def distance(a, b):
+    ''' Largest difference between the numbers of two values of the same shape. '''
+    if isinstance(a, str) and isinstance(b, str):
+        a, b = a.split(","), b.split(",")
+    if isinstance(a, list) and isinstance(b, list):
+        if len(a) != len(b):
+            return math.inf
+        return max((distance(x, y) for x, y in zip(a, b)), default=0)
+    try:
+        return abs(float(a) - float(b))
+    except (TypeError, ValueError):
+        return 0 if a == b else math.inf
+
+
+class PayloadFilter:
+    ''' Apply FieldRules to the payload dicts of entities (see the module docstring).
+
+        `rules`: field path -> {"quantum": q, "deadband": d}.
+
+        The metrics count the changes that were filtered out, per field
+        (`filtered.<path>`) and in total (`filtered`).
+    '''
+
+    def __init__(self, rules, metrics=None):
+        self.rules = [FieldRule(path, **rule) for path, rule in rules.items()]
+        self.published = {}  # (entity id, path) -> (last raw value, last filtered value)
+        self.metrics = metrics if metrics is not None else Metrics(
+            "publish_filter", "Fields filtered before publishing")
+
+    def apply(self, entity_id, payload_dict):
+        ''' Filter the fields of `payload_dict` in place. '''
+        for rule in self.rules:
+            parent = payload_dict
+            for key in rule.keys[:-1]:
+                parent = parent.get(key) if isinstance(parent, dict) else None
+            if not isinstance(parent, dict) or rule.keys[-1] not in parent:
+                continue
+
+            raw = parent[rule.keys[-1]]
+            value = rule.quantize(raw)
+            last_raw, last_value = self.published.get((entity_id, rule.path), (None, None))
+            if rule.within_deadband(value, last_value):
+                value = last_value
+
+            # A change that doesn't reach the payload was filtered out
+            if raw != last_raw and value == last_value:
+                self.metrics.increment("filtered")
+                self.metrics.increment("filtered." + rule.path)
+
+            parent[rule.keys[-1]] = value
+            self.published[(entity_id, rule.path)] = (raw, value)
+
+    def forget(self, entity_id):
+        ''' Drop the values kept for an entity, e.g. once it's retired. '''
+        for rule in self.rules:
+            self.published.pop((entity_id, rule.path), None)
@@ -0,0 +1,138 @@
+import threading as th
+from collections import OrderedDict
+from time import perf_counter
+
+from shopfloor_simulation.metrics import Metrics
+from shopfloor_simulation.topic_router import TopicRouter
+
+''' Token-bucket rate limiting of published messages.
+
+    A shared broker throttles (or disconnects) clients that publish too fast.
+    A RateLimiter keeps a client under a global message rate and under per
+    topic rates set by topic pattern. Messages over the limit aren't dropped
+    outright: the latest one of every topic waits until there are tokens
+    again, so a limited topic always ends up with its freshest value while
+    the intermediate ones are skipped.
+'''
+
+
+class TokenBucket:
+    ''' `rate` tokens per second, up to `burst` tokens. Every message takes one. '''
+
+    def __init__(self, rate, burst=None):
+        if rate <= 0:
+            raise ValueError("Rate limits must be positive.")
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1.0, rate)
+        self.tokens = self.burst
+        self.updated = perf_counter()
+
+    def available(self, now):
+        ''' Whether a token can be taken at `now` (perf_counter()). '''
+        # `now` can predate the bucket, e.g. when a topic's bucket is created in `admit`
+        self.tokens = min(self.burst, self.tokens + max(0.0, now - self.updated) * self.rate)
+        self.updated = max(self.updated, now)
+        return self.tokens >= 1
+
+    def take(self):
+        self.tokens -= 1
+
+
+class RateLimiter:
+    ''' Decide which messages of a client are published now and which wait.
+
+        `rate`, `burst`: global limit of the client (messages/s), or None.
+
+        `topic_limits`: topic pattern -> messages/s, or (messages/s, burst).
+        Patterns support the MQTT wildcards (see TopicRouter) and every topic
+        that matches gets its own bucket. Topics that match no pattern only
+        count towards the global limit.
+
+        `admit()` takes the tokens of a message, or keeps it as the pending
+        message of its topic. `release()` returns the pending messages that
+        can go out now, oldest topic first. Messages are kept as they are
+        given, e.g. the arguments of a publish. `coalesce(held, newer)`
+        returns the message that replaces a held one (the newer one by
+        default), e.g. to keep the retain flag of the held one.
+
+        `cache_size`: topics whose bucket (or lack of one) is remembered
+        before starting over, so one-off topics don't pile up.
+
+        The metrics count the messages that were held back (`rate_limited`),
+        replaced by a newer one before going out (`rate_limited_coalesced`)
+        and released later (`rate_limited_released`), and keep the amount of
+        pending topics and how long messages waited (`rate_limit_delay`).
+    '''
+
+    def __init__(self, rate=None, burst=None, topic_limits=None, metrics=None, coalesce=None, cache_size=10000):
+        self.bucket = TokenBucket(rate, burst) if rate is not None else None
+        self.router = TopicRouter()
+        for pattern, limit in (topic_limits or {}).items():
+            self.router.add(pattern, limit if isinstance(limit, tuple) else (limit, None))
+        self.topic_buckets = {}  # Topic -> TokenBucket, or None if it has no limit
+        self.pending = OrderedDict()  # Topic -> (message, perf_counter() when first held back)
+        self.coalesce = coalesce
+        self.cache_size = cache_size
+        self.lock = th.Lock()
+        self.metrics = metrics if metrics is not None else Metrics(
+            "rate_limiter", "Messages held back by the rate limits")
+
+    def topic_bucket(self, topic):
+        if topic not in self.topic_buckets:
+            if len(self.topic_buckets) >= self.cache_size:
+                self.topic_buckets.clear()
+            route, _ = self.router.match(topic)
+            self.topic_buckets[topic] = TokenBucket(*route.handler) if route is not None else None
+        return self.topic_buckets[topic]
+
+    def try_take(self, topic, now):
+        ''' Take a token for `topic` and a global one, if both are available. '''
+        topic_bucket = self.topic_bucket(topic)
+        if topic_bucket is not None and not topic_bucket.available(now):
+            return False
+        if self.bucket is not None and not self.bucket.available(now):
+            return False
+        if topic_bucket is not None:
+            topic_bucket.take()
+        if self.bucket is not None:
+            self.bucket.take()
+        return True
+
+    def admit(self, topic, message):
+        ''' Whether `message` can be published now. Otherwise it waits for `release()`. '''
+        with self.lock:
+            now = perf_counter()
+            # A topic with a message waiting can't overtake it: the new message replaces it
+            if topic in self.pending:
+                held, held_since = self.pending[topic]
+                if self.coalesce is not None:
+                    message = self.coalesce(held, message)
+                self.pending[topic] = (message, held_since)
+                self.metrics.increment("rate_limited_coalesced")
+                return False
+            if self.try_take(topic, now):
+                return True
+            self.pending[topic] = (message, now)
+            self.metrics.increment("rate_limited")
+            self.metrics.set_gauge("rate_limited_pending", len(self.pending))
+            return False
+
+    def release(self):
+        ''' Return the (topic, message) pairs that can be published now. '''
+        if not self.pending:
+            return []
+        released = []
+        with self.lock:
+            now = perf_counter()
+            for topic in list(self.pending):
+                if self.bucket is not None and not self.bucket.available(now):
+                    break
+                if not self.try_take(topic, now):
+                    continue
+                message, held_since = self.pending.pop(topic)
+                released.append((topic, message))
+                self.metrics.add_latency("rate_limit_delay", now - held_since)
+            if released:
+                self.metrics.increment("rate_limited_released", len(released))
+                self.metrics.set_gauge("rate_limited_pending", len(self.pending))
+        return released
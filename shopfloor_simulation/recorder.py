@@ -0,0 +1,154 @@
+import os
+import threading as th
+from queue import SimpleQueue
+from time import time
+
+try:
+    import numpy as np
+except ImportError:  # numpy is only needed when recording
+    np = None
+
+from shopfloor_simulation.entities import Observable
+
+# Codes stored in the `field` column of a chunk
+FIELDS = ("pose2", "status", "battery_status", "progress")
+FIELD_CODES = {name: code for code, name in enumerate(FIELDS)}
+
+
+class TimeSeriesRecorder:
+    ''' Records entity changes in memory and writes them as compressed chunks.
+
+        The recorder is registered as an `Observable` observer, so it receives
+        every change of a Robot's `pose2`, `status` and `battery_status`, and of
+        a Job's `status` and `progress`. Changes are written into preallocated
+        NumPy arrays; nothing is written to disk from the thread that made the
+        change. When the arrays are full they're handed to a writer thread that
+        saves them as `chunk-<n>.npz` inside `directory`.
+
+        Every chunk has the same columns:
+        - `time`: UNIX timestamp of the change.
+        - `entity`: index into the chunk's `entity_ids` array.
+        - `field`: index into `FIELDS`.
+        - `x`, `y`, `z`: the Robot's position (for `pose2` changes).
+        - `value`: the new value. Status strings are stored as an index into the
+        chunk's `status_names` array.
+
+        Example:
+
+            recorder = TimeSeriesRecorder("recordings/run-01")
+            recorder.start()
+            Scenario(manager).runAll()
+            recorder.stop()
+    '''
+
+    def __init__(self, directory, chunk_size=65536):
+        if np is None:
+            raise ImportError("TimeSeriesRecorder requires numpy.")
+        self.directory = directory
+        self.chunk_size = chunk_size  # Amount of changes per chunk
+        self.entity_codes = {}  # Entity id -> code
+        self.status_codes = {}  # Status string -> code
+        self.free_buffers = SimpleQueue()  # Buffers that can be filled again
+        self.full_buffers = SimpleQueue()  # (buffer, length) waiting to be saved
+        self.buffer = self.new_buffer()
+        self.length = 0  # Amount of changes in the current buffer
+        self.chunk_count = 0
+        self.lock = th.Lock()
+        self.writer_thread = None
+
+    def new_buffer(self):
+        return {
+            "time": np.empty(self.chunk_size, dtype=np.float64),
+            "entity": np.empty(self.chunk_size, dtype=np.int32),
+            "field": np.empty(self.chunk_size, dtype=np.int8),
+            "x": np.full(self.chunk_size, np.nan, dtype=np.float64),
+            "y": np.full(self.chunk_size, np.nan, dtype=np.float64),
+            "z": np.full(self.chunk_size, np.nan, dtype=np.float64),
+            "value": np.full(self.chunk_size, np.nan, dtype=np.float64),
+        }
+
+    def start(self):
+        ''' Start the writer thread and begin receiving entity changes. '''
+        os.makedirs(self.directory, exist_ok=True)
+        self.writer_thread = th.Thread(
+            target=self.writer_loop, name="TimeSeriesRecorder-writer", daemon=True)
+        self.writer_thread.start()
+        Observable.add_observer(self.record)
+
+    def stop(self):
+        ''' Stop receiving changes, save the partial chunk and stop the writer. '''
+        Observable.remove_observer(self.record)
+        with self.lock:
+            if self.length > 0:
+                self.full_buffers.put((self.buffer, self.length))
+                self.buffer = self.new_buffer()
+                self.length = 0
+        self.full_buffers.put(None)  # Shutdown sentinel
+        self.writer_thread.join()
+
+    def record(self, entity, name, value):
+        ''' (Observer) Store a single change. Called from the changing thread. '''
+        field = FIELD_CODES.get(name)
+        if field is None:
+            return
+
+        with self.lock:
+            entity_code = self.entity_codes.setdefault(
+                entity.header._id, len(self.entity_codes))
+
+            i = self.length
+            buffer = self.buffer
+            buffer["time"][i] = time()
+            buffer["entity"][i] = entity_code
+            buffer["field"][i] = field
+            if name == "pose2":
+                position = entity.pose["position"]
+                buffer["x"][i] = position[0]
+                buffer["y"][i] = position[1]
+                buffer["z"][i] = position[2]
+            elif name == "status":
+                buffer["value"][i] = self.status_codes.setdefault(
+                    value, len(self.status_codes))
+            else:
+                buffer["value"][i] = value
+            self.length += 1
+
+            # Chunk is full. Swap to a free buffer and let the writer save it.
+            if self.length == self.chunk_size:
+                self.full_buffers.put((buffer, self.length))
+                if self.free_buffers.empty():
+                    self.buffer = self.new_buffer()
+                else:
+                    self.buffer = self.free_buffers.get()
+                self.length = 0
+
+    def writer_loop(self):
+        ''' Save full buffers as compressed chunks until stopped. '''
+        while True:
+            item = self.full_buffers.get()
+            if item is None:
+                break
+            buffer, length = item
+            self.save_chunk(buffer, length)
+
+            # Clear the buffer's optional columns and make it available again
+            for column in ("x", "y", "z", "value"):
+                buffer[column].fill(np.nan)
+            self.free_buffers.put(buffer)
+
+        print("[#] Time-series recorder saved " +
+              str(self.chunk_count) + " chunks to " + self.directory)
+
+    def save_chunk(self, buffer, length):
+        with self.lock:
+            entity_ids = sorted(self.entity_codes, key=self.entity_codes.get)
+            status_names = sorted(self.status_codes, key=self.status_codes.get)
+        path = os.path.join(self.directory, "chunk-{:05d}.npz".format(
+            self.chunk_count))
+        np.savez_compressed(
+            path,
+            entity_ids=np.array(entity_ids),
+            status_names=np.array(status_names),
+            fields=np.array(FIELDS),
+            **{column: values[:length] for column, values in buffer.items()})
+        self.chunk_count += 1
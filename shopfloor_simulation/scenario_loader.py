@@ -0,0 +1,720 @@
+"""
+    Declarative scenarios: load a scenario definition (JSON or TOML) and
+    compile it into entities and a transition table.
+
+    A definition describes the layout, the entities, the process steps and the
+    states of a DTV scenario, e.g. `scenarios/dtv/flexibility0.json`. It's
+    validated and compiled once; the compiled scenario can then be used like a
+    scenario class, e.g. in the DigitalTwinViewerManager's scenario list:
+
+        flexibility0 = load_scenario("scenarios/dtv/flexibility0.json")
+        flexibility0(scenario_manager).runAll()
+
+    Every state has a list of actions, run in order, and a transition:
+
+        {"name": "op00",
+         "actions": [["begin_step", 0], ["sleep"], ["finish_step", 0]],
+         "guard": "job", "next": "transition_to_op10"}
+
+    Actions (see ACTIONS), where `entities` is a ref or a list of refs:
+    - ["sleep", seconds]: seconds default to the definition's `state_sleep`.
+    - ["hold", seconds]: wait while the current Job is ON_HOLD, then sleep.
+    - ["begin_step", index], ["finish_step", index]: of the current Job.
+    - ["set_status", entities, status]
+    - ["set_station", entities, zone]
+    - ["reset", entities]: entities default to the resettable entities.
+    - ["move", {robot: position, ...}, robot]: move the robots at once and
+      wait for the given one. Positions are a name from `positions` or [x, y, z].
+    - ["create_job", name, [process step, ...]]
+    - ["update_current_job"], ["finish_job"]
+    - ["start"], ["stop"]: connect/disconnect MQTT and the Job archive.
+
+    A definition without `flexibility` (e.g. `scenarios/scenarioTwinViewer1.json`)
+    runs on its own, without a Scenario Manager:
+
+        load_scenario("scenarios/scenarioTwinViewer1.json")(None).runAll()
+
+    Its guards never go to the shutdown state, so it doesn't need one.
+
+    Guards (see GUARDS) decide between `next` and the fixed transitions:
+    - "none": always go to `next`.
+    - "job": like `check_job_status_then_change_state`. Go to the shutdown
+      state if the selected flexibility changed, to the on hold state if the
+      current Job is ON_HOLD, otherwise to `next`.
+    - "wait_for_job": shutdown if the flexibility changed, stay in the state
+      while there's no current Job, otherwise `next`.
+    - "on_hold": shutdown if the flexibility changed, back to the state that
+      was put on hold if the current Job is IN_PROGRESS, otherwise stay.
+"""
+
+import copy
+import hashlib
+import hmac
+import json
+import os
+import pickle
+import threading as th
+from time import perf_counter, sleep
+
+import jsonpickle
+
+try:
+    import toml
+except ImportError:  # toml is only needed for .toml definitions
+    toml = None
+
+from shopfloor_simulation.archive import JobArchive
+from shopfloor_simulation.commands import CommandQueue
+from shopfloor_simulation.entities import (Agv, EntityRegistry, MobileRobot,
+                                           Operation, ProcessStep,
+                                           StationaryRobot, Structure,
+                                           TwinAgv, Zone, area, facility)
+from shopfloor_simulation.mqtt_utils import DTVMqttClient
+from shopfloor_simulation.settings import ROOT_TOPIC, SCENARIO_CACHE_PATH
+from shopfloor_simulation.state_machine import SimulatedScenario, State
+from shopfloor_simulation.version import __version__
+
+# Transition guards, stored in the transition table
+GUARD_NONE = 0
+GUARD_JOB = 1
+GUARD_WAIT_FOR_JOB = 2
+GUARD_ON_HOLD = 3
+GUARDS = {"none": GUARD_NONE, "job": GUARD_JOB,
+          "wait_for_job": GUARD_WAIT_FOR_JOB, "on_hold": GUARD_ON_HOLD}
+
+# Bump when the compiled format changes, to invalidate cached scenarios.
+# Edits to this module or to the entities invalidate them too (see cache_file).
+CACHE_FORMAT = "2"
+CODE_DIGEST = None  # See code_digest()
+
+# Robot kinds and their classes
+ROBOT_KINDS = {"twin_agv": TwinAgv, "agv": Agv,
+               "stationary": StationaryRobot, "mobile": MobileRobot}
+
+
+class ScenarioDefinitionError(ValueError):
+    ''' The scenario definition is invalid. The message says where. '''
+
+
+''' Actions. Every action receives the running scenario first. '''
+
+
+def action_sleep(scenario, seconds):
+    ''' Sleep, but pause while the Job is ON_HOLD and stop if the flexibility changes. '''
+    scenario.preemption.wait(seconds)
+
+
+def action_delay(scenario, seconds):
+    ''' Sleep no matter what, e.g. while starting or stopping the scenario. '''
+    sleep(seconds)
+
+
+def action_hold(scenario, seconds):
+    ''' Wait until the current Job isn't ON_HOLD anymore, or the flexibility changes.
+        Sleeps `seconds` otherwise, so the state doesn't loop on itself without a pause.
+    '''
+    scenario.preemption.wait(seconds)
+
+
+def action_begin_step(scenario, index):
+    scenario.current_job.begin_process_step(index)
+
+
+def action_finish_step(scenario, index):
+    scenario.current_job.finish_process_step(index)
+
+
+def action_set_status(scenario, entities, status):
+    for entity in entities:
+        entity.status = status
+
+
+def action_set_station(scenario, entities, zone):
+    for entity in entities:
+        entity.current_station = zone.header
+
+
+def action_reset(scenario, entities):
+    for entity in entities:
+        entity.reset()
+
+
+def action_move(scenario, moves, wait_for):
+    ''' Move every robot in its own thread, then wait for `wait_for` to arrive. '''
+    waiting = None
+    for robot, target in moves:
+        thread = th.Thread(target=robot.move_robot_thread,
+                           args=[target, scenario.preemption])
+        thread.start()
+        if robot is wait_for:
+            waiting = thread
+    scenario.preemption.join(waiting)
+
+
+def action_create_job(scenario, name, process_steps):
+    scenario.create_job(name, process_steps)
+
+
+def action_update_current_job(scenario):
+    scenario.update_current_job()
+
+
+def action_finish_job(scenario):
+    ''' Set the current Job to DONE and release it, its PS and OPs from the simulation. '''
+    scenario.retire_job(scenario.current_job)
+    scenario.current_job = None
+
+
+def action_start(scenario):
+    ''' Reset the Job related properties and start publishing via MQTT. '''
+    compiled = scenario.compiled
+    scenario.job_queue = EntityRegistry()
+    scenario.commands = CommandQueue(scenario.command_handlers)
+    scenario.job_count = 0
+    scenario.current_job = None
+    scenario.job_start_times = {}
+
+    # Start writing finished Jobs to the Job history
+    scenario.archive.start()
+
+    scenario.mqtt = DTVMqttClient(
+        name="MQTT-" + compiled.name,
+        subscribed_topics=compiled.subscribed_topics,
+        publishing_entities=scenario.publishing_entities,
+        scenario_manager=scenario.manager,
+        scenario=scenario,
+        run_event_check_sleep=compiled.event_sleep,
+        static_payloads=compiled.static_payloads
+    )
+    scenario.mqtt_thread = th.Thread(
+        target=scenario.mqtt.publish_thread,
+        args=[scenario.run_event],
+        daemon=True
+    )
+    scenario.run_event.set()
+    scenario.mqtt_thread.start()
+
+
+def action_stop(scenario):
+    ''' Disable the scenario and wait for the MQTT thread to finish. '''
+    scenario.is_active = False
+    scenario.run_event.clear()
+    scenario.mqtt_thread.join()
+
+    # Write the remaining finished Jobs to the Job history.
+    scenario.archive.stop()
+
+
+# Action name -> (function, argument kinds). Kinds ending with "?" are optional.
+ACTIONS = {
+    "sleep": (action_sleep, ("seconds?",)),
+    "delay": (action_delay, ("seconds?",)),
+    "hold": (action_hold, ("seconds?",)),
+    "begin_step": (action_begin_step, ("index",)),
+    "finish_step": (action_finish_step, ("index",)),
+    "set_status": (action_set_status, ("entities", "string")),
+    "set_station": (action_set_station, ("entities", "zone")),
+    "reset": (action_reset, ("entities?",)),
+    "move": (action_move, ("moves", "entity")),
+    "create_job": (action_create_job, ("string", "process_steps")),
+    "update_current_job": (action_update_current_job, ()),
+    "finish_job": (action_finish_job, ()),
+    "start": (action_start, ()),
+    "stop": (action_stop, ()),
+}
+
+
+''' Compiled scenario. '''
+
+
+class CompiledState(State):
+    ''' A State of a compiled scenario: a list of actions and a row of the transition table. '''
+
+    def __init__(self, compiled, index, name):
+        self.compiled = compiled
+        self.index = index  # Row in the transition table
+        self.name = name
+        self.actions = ()  # (function, args) tuples, set once every state exists
+
+    def run(self):
+        scenario = self.compiled.scenario
+        for action, args in self.actions:
+            action(scenario, *args)
+
+    def next(self):
+        return self.compiled.scenario.transition(self)
+
+
+class CompiledScenario:
+    ''' A validated scenario definition, with its entities and transition table.
+
+        The entities are built once and shared by every run of the scenario,
+        like the module-level entities of a hand-written scenario. Calling the
+        compiled scenario with a scenario manager creates a TableScenario.
+
+        Compiled scenarios can be pickled, which is how `load_scenario` caches
+        them. The payloads of the layout are stored pre-serialized.
+    '''
+
+    def __init__(self, definition, name=""):
+        self.definition = definition
+        self.name = definition.get("name", name)
+        self.flexibility = definition.get("flexibility")  # None runs without a Scenario Manager
+        self.state_sleep = definition.get("state_sleep", 2)
+        self.event_sleep = definition.get("event_sleep", 0.01)
+        self.subscribed_topics = [topic.replace("{root_topic}", ROOT_TOPIC)
+                                  for topic in definition.get("subscribed_topics", [])]
+        self.scenario = None  # The running TableScenario
+
+        self.entities = {}  # Ref -> entity
+        self.zones = {}  # Ref -> Zone
+        self.operations = {}  # Ref -> Operation
+        self.process_steps = {}  # Ref -> ProcessStep
+        self.positions = {name: list(position) for name, position
+                          in definition.get("positions", {}).items()}
+        self.build_entities()
+
+        self.resettable_entities = self.resolve_entities(
+            definition.get("resettable", []), "resettable")
+        self.publishing_entities = EntityRegistry(self.resolve_entities(
+            definition.get("publishing", []), "publishing"))
+        self.archive = JobArchive(scenario=self.name)
+
+        # The layout (Structures and Zones) doesn't change while the scenario
+        # runs, so its payloads are serialized once, here.
+        self.static_payloads = {
+            entity.header._id: jsonpickle.encode(entity, unpicklable=False)
+            for entity in self.entities.values() if isinstance(entity, (Structure, Zone))}
+
+        self.build_states()
+
+    def __call__(self, scenario_manager):
+        return TableScenario(self, scenario_manager)
+
+    def __getstate__(self):
+        ''' Pickle everything but the running scenario and the Job archive (it owns a thread). '''
+        state = self.__dict__.copy()
+        state["scenario"] = None
+        del state["archive"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.archive = JobArchive(scenario=self.name)
+
+
+    ''' Validation helpers. '''
+
+    def error(self, where, message):
+        return ScenarioDefinitionError(
+            "Scenario " + str(self.name) + ", " + where + ": " + message)
+
+    def require(self, spec, key, where):
+        if key not in spec:
+            raise self.error(where, "missing '" + key + "'.")
+        return spec[key]
+
+    def resolve(self, table, ref, where, kind):
+        if ref not in table:
+            raise self.error(where, "unknown " + kind + " '" + str(ref) + "'.")
+        return table[ref]
+
+    def resolve_entities(self, refs, where):
+        if isinstance(refs, str):
+            refs = [refs]
+        return [self.resolve(self.entities, ref, where, "entity") for ref in refs]
+
+    def resolve_position(self, position, where):
+        if isinstance(position, str):
+            return self.resolve(self.positions, position, where, "position")
+        if len(position) != 3:
+            raise self.error(where, "positions must have 3 coordinates.")
+        return list(position)
+
+    ''' Entities. '''
+
+    def build_entities(self):
+        definition = self.definition
+
+        for ref, spec in definition.get("structures", {}).items():
+            where = "structure " + ref
+            self.entities[ref] = Structure(
+                self.require(spec, "id", where), spec.get("name", ref),
+                spec.get("namespace", "structure"), spec.get("description", ""))
+
+        for ref, spec in definition.get("zones", {}).items():
+            where = "zone " + ref
+            structure = self.resolve(self.entities, self.require(
+                spec, "structure", where), where, "structure")
+            zone = Zone(self.require(spec, "id", where), spec.get("name", ref),
+                        self.require(spec, "namespace", where),
+                        spec.get("description", ""), structure)
+            self.entities[ref] = self.zones[ref] = zone
+
+        for ref, spec in definition.get("robots", {}).items():
+            self.entities[ref] = self.build_robot(ref, spec)
+
+        for i, spec in enumerate(definition.get("areas", [])):
+            where = "area " + str(i)
+            area(self.resolve_position(self.require(spec, "position", where), where),
+                 self.require(spec, "area_type", where),
+                 self.require(spec, "width", where), self.require(spec, "depth", where),
+                 self.resolve(self.zones, self.require(spec, "zone", where), where, "zone"))
+
+        for i, spec in enumerate(definition.get("facilities", [])):
+            where = "facility " + str(i)
+            if "jtpath" not in spec and "facility_type" not in spec:
+                raise self.error(where, "either 'jtpath' or 'facility_type' is required.")
+            facility(self.require(spec, "name", where),
+                     self.resolve_position(self.require(spec, "position", where), where),
+                     spec.get("euler", [0, 0, 0]),
+                     self.resolve(self.zones, self.require(spec, "zone", where), where, "zone"),
+                     jtpath=spec.get("jtpath", ""), facility_type=spec.get("facility_type", ""))
+
+        for ref, spec in definition.get("operations", {}).items():
+            where = "operation " + ref
+            self.operations[ref] = Operation(
+                self.require(spec, "id", where), spec.get("name", ref),
+                "operations", spec.get("description", ""))
+
+        for ref, spec in definition.get("process_steps", {}).items():
+            where = "process step " + ref
+            operations = [copy.deepcopy(self.resolve(self.operations, op, where, "operation"))
+                          for op in self.require(spec, "operations", where)]
+            station = self.resolve(self.zones, self.require(
+                spec, "station", where), where, "zone")
+            self.process_steps[ref] = ProcessStep(
+                self.require(spec, "id", where), spec.get("name", ref),
+                "process_steps", spec.get("description", ""), operations,
+                station.header, nextPs=spec.get("next", ""), prevPs=spec.get("prev", ""))
+
+    def build_robot(self, ref, spec):
+        where = "robot " + ref
+        kind = self.require(spec, "kind", where)
+        if kind not in ROBOT_KINDS:
+            raise self.error(where, "unknown kind '" + str(kind) + "'.")
+
+        kwargs = {
+            "initial_position": self.resolve_position(spec.get("initial_position", [0, 0, 0]), where),
+            "initial_orientation": spec.get("initial_orientation", [0, 0, 0, 0]),
+        }
+        if "current_station" in spec:
+            kwargs["current_station"] = self.resolve(
+                self.zones, spec["current_station"], where, "zone").header
+        if kind == "twin_agv":
+            kwargs["Zone"] = self.resolve(self.zones, self.require(
+                spec, "zone", where), where, "zone")
+            kwargs["initial_euler"] = spec.get("initial_euler", [0, 0, 0])
+            kwargs["facility_type"] = spec.get("facility_type", "")
+            kwargs["jtpath"] = spec.get("jtpath", "")
+
+        return ROBOT_KINDS[kind](
+            self.require(spec, "id", where), spec.get("name", ref),
+            self.require(spec, "namespace", where), spec.get("description", ""),
+            spec.get("type", kind), **kwargs)
+
+    ''' States and transition table. '''
+
+    def build_states(self):
+        specs = self.require(self.definition, "states", "definition")
+        self.states = {}  # Name -> CompiledState
+        for spec in specs:
+            name = self.require(spec, "name", "state")
+            if name in self.states:
+                raise self.error("state " + name, "defined twice.")
+            self.states[name] = CompiledState(self, len(self.states), name)
+
+        def state_ref(key, where):
+            return self.resolve(self.states, self.require(self.definition, key, where), where, "state")
+
+        self.initial_state = state_ref("initial_state", "definition")
+
+        # Dense transition table: row = state index, (guard, next State)
+        self.transitions = []
+        for spec in specs:
+            state = self.states[spec["name"]]
+            where = "state " + state.name
+            guard = spec.get("guard", "none")
+            if guard not in GUARDS:
+                raise self.error(where, "unknown guard '" + str(guard) + "'.")
+            next_state = self.resolve(self.states, self.require(
+                spec, "next", where), where, "state")
+            self.transitions.append((GUARDS[guard], next_state))
+            state.actions = tuple(self.compile_action(action, where + ", action " + str(i))
+                                  for i, action in enumerate(spec.get("actions", [])))
+
+        # Guards other than "none" need the fixed shutdown and on hold states
+        guards = set(guard for guard, _ in self.transitions)
+        self.shutdown_state = self.on_hold_state = None
+        if guards - {GUARD_NONE} and self.flexibility is not None:
+            self.shutdown_state = state_ref("shutdown_state", "definition")
+        if GUARD_JOB in guards:
+            self.on_hold_state = state_ref("on_hold_state", "definition")
+
+    def compile_action(self, action, where):
+        ''' Turn ["name", args...] into (function, resolved args). '''
+        if not isinstance(action, list) or not action:
+            raise self.error(where, "actions must be non-empty lists.")
+        name, args = action[0], action[1:]
+        if name not in ACTIONS:
+            raise self.error(where, "unknown action '" + str(name) + "'.")
+        function, kinds = ACTIONS[name]
+        required = len([kind for kind in kinds if not kind.endswith("?")])
+        if not required <= len(args) <= len(kinds):
+            raise self.error(where, "'" + name + "' takes " + str(len(kinds)) + " argument(s).")
+
+        resolved = []
+        for i, kind in enumerate(kinds):
+            value = args[i] if i < len(args) else None
+            resolved.append(self.compile_argument(kind.rstrip("?"), value, where))
+        if function is action_move and resolved[1] not in [robot for robot, _ in resolved[0]]:
+            raise self.error(where, "'move' must wait for one of the moved robots.")
+        return function, tuple(resolved)
+
+    def compile_argument(self, kind, value, where):
+        if kind == "seconds":
+            return self.state_sleep if value is None else float(value)
+        if kind == "index":
+            if not isinstance(value, int) or value < 0:
+                raise self.error(where, "step indexes must be non-negative integers.")
+            return value
+        if kind == "string":
+            return str(value)
+        if kind == "entity":
+            return self.resolve(self.entities, value, where, "entity")
+        if kind == "entities":
+            if value is None:
+                return self.resettable_entities
+            return self.resolve_entities(value, where)
+        if kind == "zone":
+            return self.resolve(self.zones, value, where, "zone")
+        if kind == "process_steps":
+            return [self.resolve(self.process_steps, ps, where, "process step") for ps in value]
+        if kind == "moves":
+            return tuple((self.resolve(self.entities, ref, where, "entity"),
+                          self.resolve_position(target, where))
+                         for ref, target in value.items())
+        raise self.error(where, "unknown argument kind '" + kind + "'.")
+
+
+class CompiledScenarioHandler(jsonpickle.handlers.BaseHandler):
+    ''' Publish only the name and flexibility of a compiled scenario, e.g.
+        inside the Scenario Manager's payload, instead of all its entities.
+    '''
+
+    def flatten(self, obj, data):
+        data["name"] = obj.name
+        data["flexibility"] = obj.flexibility
+        return data
+
+
+jsonpickle.handlers.register(CompiledScenario, CompiledScenarioHandler)
+
+
+class TableScenario(SimulatedScenario):
+    ''' Runs a CompiledScenario. States are dispatched from its transition table. '''
+
+    def __init__(self, compiled, scenario_manager):
+        print("[#] Initializing Scenario " + compiled.name)
+        self.compiled = compiled
+        compiled.scenario = self
+
+        # Add the Scenario Manager to the publishing entities list
+        if scenario_manager is not None:
+            compiled.publishing_entities.add(scenario_manager)
+
+        SimulatedScenario.__init__(
+            self, compiled.initial_state,
+            manager=scenario_manager,
+            flexibility=compiled.flexibility,
+            resettable_entities=compiled.resettable_entities,
+            publishing_entities=compiled.publishing_entities,
+            archive=compiled.archive,
+            run_event=th.Event(),
+            shutdown=compiled.shutdown_state,
+        )
+
+    def runAll(self):
+        self.is_active = True
+
+        # State flow logging variables
+        prev_state_info = ""
+        state_info = ""
+        repeats = 0  # How many times has the same state_info been repeated
+
+        while self.is_active:
+            # Update the Jobs' statuses
+            self.update_jobs()
+
+            # Transition to the next state
+            self.current_state = self.transition(self.current_state)
+
+            # Print state log and update values
+            prev_state_info, state_info, repeats = self.log_state_flow(
+                prev_state_info, state_info, repeats)
+
+            # Run the current state
+            self.current_state.run()
+
+        print("[#] Scenario " + self.compiled.name + " has been shut down.")
+
+    def transition(self, state):
+        ''' Look up the state's row in the transition table and apply its guard. '''
+        guard, next_state = self.compiled.transitions[state.index]
+        if guard == GUARD_NONE:
+            return next_state
+
+        # Selected flexibility was changed. Transition to shutdown to allow Scenario change.
+        if self.manager is not None and self.flexibility != self.manager.selected_flexibility:
+            return self.compiled.shutdown_state
+
+        if guard == GUARD_WAIT_FOR_JOB:
+            return state if self.current_job is None else next_state
+
+        if guard == GUARD_ON_HOLD:
+            return self.prev_state if self.current_job.status == "IN_PROGRESS" else state
+
+        # GUARD_JOB
+        if self.current_job.status == "ON_HOLD":
+            self.prev_state = state
+            return self.compiled.on_hold_state
+        return next_state
+
+
+def parse_definition(text, path):
+    ''' Parse the text of a .json or .toml scenario definition. '''
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".json":
+        return json.loads(text)
+    if extension == ".toml":
+        if toml is None:
+            raise ImportError("TOML scenario definitions require the toml package.")
+        return toml.loads(text)
+    raise ScenarioDefinitionError("Unknown scenario definition format: " + path)
+
+
+def load_definition(path):
+    ''' Read a scenario definition from a .json or .toml file. '''
+    with open(path, encoding="utf-8") as f:
+        return parse_definition(f.read(), path)
+
+
+def code_digest():
+    ''' Hash of the source of the package's modules, which is where every class
+        a compiled scenario pickles (entities, states, Jobs, metrics...) comes from.
+    '''
+    global CODE_DIGEST
+    if CODE_DIGEST is None:
+        digest = hashlib.sha256()
+        package_dir = os.path.dirname(os.path.abspath(__file__))
+        for file_name in sorted(os.listdir(package_dir)):
+            if file_name.endswith(".py"):
+                digest.update(file_name.encode("utf-8"))
+                with open(os.path.join(package_dir, file_name), "rb") as module_file:
+                    digest.update(module_file.read())
+        CODE_DIGEST = digest.digest()
+    return CODE_DIGEST
+
+
+def cache_secret(cache_dir):
+    ''' The secret that signs the cached scenarios of `cache_dir`, created with it.
+
+        Returns None if the folder can't be trusted: on POSIX systems it must
+        belong to the current user and not be writable by anyone else.
+    '''
+    os.makedirs(cache_dir, mode=0o700, exist_ok=True)
+    if hasattr(os, "getuid"):
+        status = os.stat(cache_dir)
+        if status.st_uid != os.getuid() or status.st_mode & 0o022:
+            print("[W] Scenario cache " + cache_dir + " is writable by other users. Not using it.")
+            return None
+
+    secret_path = os.path.join(cache_dir, "secret")
+    try:
+        descriptor = os.open(secret_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        with open(secret_path, "rb") as f:
+            return f.read()
+    secret = os.urandom(32)
+    with os.fdopen(descriptor, "wb") as f:
+        f.write(secret)
+    return secret
+
+
+def cache_file(cache_dir, name, source):
+    ''' Path of the cached compilation of `source`.
+
+        The key covers the source, the versions of the package and the cache
+        format, and the code of the package's modules, so editing the
+        definition or any of the classes that get pickled invalidates it.
+    '''
+    key = hashlib.sha256()
+    key.update((CACHE_FORMAT + __version__).encode("utf-8"))
+    key.update(code_digest())
+    key.update(source)
+    return os.path.join(cache_dir, name + "-" + key.hexdigest()[:16] + ".pickle")
+
+
+def load_scenario(path, cache_dir=SCENARIO_CACHE_PATH):
+    ''' Load, validate and compile a scenario definition.
+
+        The compiled scenario is cached in `cache_dir` (empty to disable). As
+        long as the definition doesn't change, later loads unpickle the cached
+        entities, transition table and static payloads instead of compiling.
+        Cache files are signed (HMAC-SHA256 with the folder's secret, see
+        `cache_secret`), and only unpickled if the signature matches.
+    '''
+    start = perf_counter()
+    name = os.path.splitext(os.path.basename(path))[0]
+    with open(path, "rb") as f:
+        source = f.read()
+
+    secret = cache_secret(cache_dir) if cache_dir else None
+    cached = cache_file(cache_dir, name, source) if secret is not None else None
+    if cached is not None and os.path.exists(cached):
+        try:
+            with open(cached, "rb") as f:
+                signature = f.read(hashlib.sha256().digest_size)
+                data = f.read()
+            if not hmac.compare_digest(signature, hmac.new(secret, data, hashlib.sha256).digest()):
+                raise ValueError("Bad signature")
+            compiled = pickle.loads(data)
+            print("[#] Loaded compiled scenario " + compiled.name + " from cache in " +
+                  str(round((perf_counter() - start) * 1000, 1)) + "ms.")
+            return compiled
+        except Exception:
+            print("[W] Cached scenario " + cached + " is unreadable. Compiling it again.")
+
+    compiled = CompiledScenario(parse_definition(source.decode("utf-8"), path), name)
+    print("[#] Compiled scenario " + compiled.name + " (" + str(len(compiled.states)) +
+          " states) in " + str(round((perf_counter() - start) * 1000, 1)) + "ms.")
+
+    if cached is not None:
+        data = pickle.dumps(compiled, pickle.HIGHEST_PROTOCOL)
+        # Write to a temporary file first, so a crash never leaves half a cache file
+        temporary = cached + ".tmp"
+        with open(temporary, "wb") as f:
+            f.write(hmac.new(secret, data, hashlib.sha256).digest())
+            f.write(data)
+        os.replace(temporary, cached)
+    return compiled
+
+
+class LazyScenario:
+    ''' A scenario definition that's only loaded (and compiled, if it isn't
+        cached) the first time the scenario is created. Can be used in the
+        DigitalTwinViewerManager's scenario list like a scenario class.
+    '''
+
+    def __init__(self, path, cache_dir=SCENARIO_CACHE_PATH):
+        self.path = path
+        self.cache_dir = cache_dir
+        self.compiled = None
+
+    def load(self):
+        if self.compiled is None:
+            self.compiled = load_scenario(self.path, self.cache_dir)
+        return self.compiled
+
+    def __call__(self, scenario_manager):
+        return self.load()(scenario_manager)
@@ -0,0 +1,796 @@
+"""
+    The DTV assembly line scenario, shared by the flexibility scenarios
+    (`flexibility0.py`, `flexibility1.py`).
+
+    Its State Machine keeps its state on the class, so `build_scenario` creates
+    a new Shopfloor class, with its own entities and States, for every
+    flexibility. A flexibility module only sets what's specific to it.
+"""
+
+import copy
+import threading as th
+from time import sleep, time
+
+from shopfloor_simulation.archive import JobArchive
+from shopfloor_simulation.commands import CommandQueue
+from shopfloor_simulation.entities import (Agv, EntityRegistry, Job,
+                                           MobileRobot, Operation, ProcessStep,
+                                           Station, StationaryRobot, Structure,
+                                           TwinAgv, Zone, area, facility)
+from shopfloor_simulation.mqtt_utils import DTVMqttClient
+from shopfloor_simulation.pipeline import JobMachine, ProductionLine
+from shopfloor_simulation.settings import ROOT_TOPIC
+from shopfloor_simulation.state_machine import (Preemption, SimClock,
+                                                SimulatedScenario, State)
+
+# Path to CAD files folder
+CAD_PATH = "C:\Git\WZL\2020_Team_Visualization\Visualization\ThingWorx\shopfloor_simulation\shopfloor_simulation\twin_scripts\CAD"
+
+STATE_SLEEP = 2  # Amount of time to wait between states.
+EVENT_SLEEP = 0.01
+
+
+def build_scenario(scenario_name, flexibility, initialize_sleep=STATE_SLEEP, pipelined=False):
+    ''' Create the Shopfloor scenario class of one flexibility.
+
+        `scenario_name`: used in the logs, the MQTT client name and the Job history.
+        `flexibility`: the flexibility of the scenario (similar to its id).
+        `initialize_sleep`: time to wait after the Initialize State.
+        `pipelined`: run several Jobs at once, each at a different station.
+    '''
+
+    ''' State Machine and States setup. '''
+
+
+    class Shopfloor(SimulatedScenario):
+        def __init__(self, scenario_manager):
+            print("[#] Initializing Scenario " + scenario_name)
+
+            # The reference to the Scenario Manager
+            Shopfloor.manager = scenario_manager
+
+            # Add the Scenario Manager to the publishing entities list
+            Shopfloor.publishing_entities.add(scenario_manager)
+
+            # Start the State Machine
+            SimulatedScenario.__init__(self, Shopfloor.initialize)
+
+        def runAll(self):
+            # Boolean to control state machine shutdown
+            Shopfloor.is_active = True
+
+            # State flow logging variables
+            prev_state_info = ""
+            state_info = ""
+            repeats = 0  # How many times has the same state_info been repeated
+
+            while Shopfloor.is_active:
+                # Update the Shopfloor Jobs' statuses
+                Shopfloor.update_jobs(self=Shopfloor)
+
+                # Transition to the next state
+                self.current_state = self.current_state.next()
+
+                # Print state log and update values
+                prev_state_info, state_info, repeats = self.log_state_flow(
+                    prev_state_info, state_info, repeats)
+
+                # Run the current state
+                self.current_state.run()
+
+            print("[#] Scenario " + scenario_name + " has been shut down.")
+
+
+    class Initialize(State):
+        def run(self):
+            # Initialize Job management related variables
+            Shopfloor.job_queue = EntityRegistry()  # Queue with incoming Jobs, in arrival order
+            Shopfloor.commands = CommandQueue(Shopfloor.command_handlers)  # Received commands
+            Shopfloor.job_count = 0  # How many Jobs have been created
+            Shopfloor.current_job = None  # Will store ref to Job objects
+            Shopfloor.job_start_times = {}  # Job id -> time the Job was picked up
+
+            # Initialize pipelined execution related variables
+            Shopfloor.clock = SimClock()  # Shared by the JobMachines
+            Shopfloor.children = []  # One JobMachine per Job in the pipeline
+            Shopfloor.children_loop = None
+            Shopfloor.children_thread = None
+            Shopfloor.pipelined_jobs = set()  # Ids of the Jobs in the pipeline
+            Shopfloor.line.reset()
+
+            # Start writing finished Jobs to the Job history
+            Shopfloor.archive.start()
+
+            # Initialize MQTT client object
+            Shopfloor.mqtt = DTVMqttClient(
+                name="MQTT-" + scenario_name,
+                subscribed_topics=[
+                    ROOT_TOPIC + "scenario_manager/DTV-000/+",
+                    ROOT_TOPIC + "jobs/+/status",
+                    "/VR/viewer_info/tooltip_request"
+                ],
+                publishing_entities=Shopfloor.publishing_entities,
+                scenario_manager=Shopfloor.manager,
+                scenario=Shopfloor,
+                run_event_check_sleep=EVENT_SLEEP
+            )
+
+            # Thread for parallel continuous publishing
+            Shopfloor.mqtt_thread = th.Thread(
+                target=Shopfloor.mqtt.publish_thread,
+                args=[Shopfloor.run_event],
+                daemon=True
+            )
+
+            # Enable the run_event
+            Shopfloor.run_event.set()
+
+            # Start the MQTT thread
+            Shopfloor.mqtt_thread.start()
+
+            # Create 3 Jobs
+            Shopfloor.create_job(Shopfloor, "Porsche1", [
+                                 Ps00, Ps01, Ps02, Ps03, Ps04, Ps05, Ps06])
+            Shopfloor.create_job(Shopfloor, "Porsche2", [Ps03, Ps04, Ps05, Ps06])
+            Shopfloor.create_job(Shopfloor, "Porsche3", [Ps05, Ps06])
+
+            sleep(initialize_sleep)
+
+        def next(self):
+            return Shopfloor.idle
+
+
+    class Shutdown(State):
+        def run(self):
+            # Stop the Jobs in the pipeline, if any.
+            Shopfloor.stop_children(Shopfloor)
+
+            # Disable the scenario.
+            Shopfloor.is_active = False
+
+            # Clear the run_event to shutdown threads.
+            Shopfloor.run_event.clear()
+
+            # Wait for the MQTT thread to finish.
+            Shopfloor.mqtt_thread.join()
+
+            # Write the remaining finished Jobs to the Job history.
+            Shopfloor.archive.stop()
+
+            sleep(STATE_SLEEP)
+
+        def next(self):
+            return Shopfloor.initialize
+
+
+    class OnHold(State):
+        ''' Stop the simulation by doing nothing and loop on itself.
+
+            This State will be triggered if the current Job has status `ON_HOLD`.
+            It'll go back to the previous state if the current Job status goes back
+            to `IN_PROGRESS`.
+        '''
+
+        def run(self):
+            # Wakes up as soon as the Job is resumed or the flexibility changes
+            Shopfloor.preemption.wait(STATE_SLEEP)
+
+        def next(self):
+            if Shopfloor.manager.selected_flexibility != Shopfloor.flexibility:
+                return Shopfloor.shutdown
+            elif Shopfloor.current_job.status == "IN_PROGRESS":
+                return Shopfloor.prev_state
+            elif Shopfloor.current_job.status == "ON_HOLD":
+                return Shopfloor.on_hold
+            else:
+                # Keep looping on_hold if the status is not recognized.
+                # TODO: proper state for unknown status and other variants.
+                return Shopfloor.on_hold
+
+
+    class Idle(State):
+        ''' Check the Job Queue and its Jobs.
+
+        If there are Jobs and at least one of them has the `IN_PROGRESS` status,
+        transition to the `BeginJob` State after assigning the Job to
+        `Shopfloor.current_job`. Otherwise, loop back to this state.
+        '''
+
+        def run(self):
+            Shopfloor.update_current_job(self=Shopfloor)
+            Shopfloor.preemption.wait(STATE_SLEEP)
+
+        def next(self):
+            if Shopfloor.manager.selected_flexibility != Shopfloor.flexibility:
+                return Shopfloor.shutdown
+            elif Shopfloor.current_job == None:
+                return Shopfloor.idle
+            elif pipelined:
+                return Shopfloor.pipeline
+            else:
+                return Shopfloor.begin_job
+
+
+    class Pipeline(State):
+        ''' Work on every `IN_PROGRESS` Job at once.
+
+            Every Job gets its own JobMachine, which moves it to the station of its
+            next ProcessStep as soon as that station has room. Jobs therefore
+            advance like in a real line, several of them at different stations,
+            and each one can be put ON_HOLD on its own. Finished Jobs are retired
+            and replaced by a new Job, like in the Reset State.
+        '''
+
+        def run(self):
+            Shopfloor.current_job = None
+            Shopfloor.start_children(Shopfloor)
+
+            # Start a JobMachine for every new IN_PROGRESS Job
+            for job in Shopfloor.job_queue:
+                if job.status == "IN_PROGRESS" and job.header._id not in Shopfloor.pipelined_jobs:
+                    Shopfloor.pipelined_jobs.add(job.header._id)
+                    Shopfloor.job_start_times.setdefault(job.header._id, time())
+                    Shopfloor.add_child(Shopfloor, JobMachine(
+                        job, Shopfloor.line, STATE_SLEEP))
+
+            # Retire the finished Jobs
+            while Shopfloor.line.finished_jobs:
+                job = Shopfloor.line.finished_jobs.popleft()
+                Shopfloor.pipelined_jobs.discard(job.header._id)
+                Shopfloor.retire_job(Shopfloor, job)
+                Shopfloor.create_job(Shopfloor, "Porsche1", [
+                                     Ps00, Ps01, Ps02, Ps03, Ps04, Ps05, Ps06])
+
+            Shopfloor.preemption.wait(EVENT_SLEEP * 10)
+
+        def next(self):
+            if Shopfloor.manager.selected_flexibility != Shopfloor.flexibility:
+                return Shopfloor.shutdown
+            return Shopfloor.pipeline
+
+
+    class BeginJob(State):
+        ''' Begin work on the current Job by first moving the Robots into position. '''
+
+        def run(self):
+            ''' A note about the BeginJob State and Robot's movement.
+
+            Since this simulation is for a single type of Job, the Robot's initial
+            pose is already the correct position for beginning this Job. Different
+            types of Jobs might require a different position, as such this is the
+            State to reposition them before effectively doing work.
+            '''
+            Shopfloor.preemption.wait(STATE_SLEEP)
+
+        def next(self):
+            return Shopfloor.check_job_status_then_change_state(Shopfloor, Shopfloor.begin_job, Shopfloor.op00, Shopfloor.shutdown)
+            # check for process step list and which ohne is the next one
+            # once all steps are done, go to finish state
+
+
+    class OP00(State):
+        def run(self):
+            Shopfloor.current_job.begin_process_step(0)
+
+            Shopfloor.preemption.wait(STATE_SLEEP)
+            Shopfloor.current_job.finish_process_step(0)
+
+        def next(self):
+            return Shopfloor.check_job_status_then_change_state(Shopfloor, Shopfloor.op00, Shopfloor.transition_to_op10, Shopfloor.shutdown)
+
+
+    class OP10(State):
+        def run(self):
+            Shopfloor.current_job.begin_process_step(1)
+
+            S1.status = 'BUSY'
+            S2.status = 'BUSY'
+            A1.status = 'BUSY'
+            A1.current_station = Station11.header
+
+            Shopfloor.preemption.wait(STATE_SLEEP)
+            Shopfloor.current_job.finish_process_step(1)
+            S1.reset()
+            S2.reset()
+
+        def next(self):
+            return Shopfloor.check_job_status_then_change_state(Shopfloor, Shopfloor.op10, Shopfloor.transition_to_op20, Shopfloor.shutdown)
+
+
+    class OP20(State):
+        def run(self):
+            A1.current_station = Station12.header
+            Shopfloor.current_job.begin_process_step(2)
+            S4.status = 'BUSY'
+            M1.status = 'BUSY'
+            M2.status = 'BUSY'
+
+            Shopfloor.preemption.wait(STATE_SLEEP)
+            Shopfloor.current_job.finish_process_step(2)
+            S4.reset()
+
+        def next(self):
+            return Shopfloor.check_job_status_then_change_state(Shopfloor, Shopfloor.op20, Shopfloor.transition_to_op30, Shopfloor.shutdown)
+
+
+    class OP30(State):
+        def run(self):
+            A1.current_station = Station13.header
+            M1.current_station = Station13.header
+            M2.current_station = Station13.header
+            Shopfloor.current_job.begin_process_step(3)
+            S3.status = 'BUSY'
+
+            Shopfloor.preemption.wait(STATE_SLEEP)
+            Shopfloor.current_job.finish_process_step(3)
+            S3.reset()
+
+        def next(self):
+            return Shopfloor.check_job_status_then_change_state(Shopfloor, Shopfloor.op30, Shopfloor.transition_to_op40, Shopfloor.shutdown)
+
+
+    class OP40(State):
+        def run(self):
+            A1.current_station = Station14.header
+            M1.current_station = Station14.header
+            M2.current_station = Station14.header
+            Shopfloor.current_job.begin_process_step(4)
+            S5.status = 'BUSY'
+            S6.status = 'BUSY'
+
+            Shopfloor.preemption.wait(STATE_SLEEP)
+            Shopfloor.current_job.finish_process_step(4)
+            S5.reset()
+            S6.reset()
+            M1.reset()
+            M2.reset()
+
+        def next(self):
+            return Shopfloor.check_job_status_then_change_state(Shopfloor, Shopfloor.op40, Shopfloor.transition_to_op50, Shopfloor.shutdown)
+
+
+    class OP50(State):
+        def run(self):
+            A1.current_station = Station15.header
+            Shopfloor.current_job.begin_process_step(5)
+
+            Shopfloor.preemption.wait(STATE_SLEEP)
+            Shopfloor.current_job.finish_process_step(5)
+
+        def next(self):
+            return Shopfloor.check_job_status_then_change_state(Shopfloor, Shopfloor.op50, Shopfloor.transition_to_op60, Shopfloor.shutdown)
+
+
+    class OP60(State):
+        def run(self):
+            A1.current_station = Station16.header
+            Shopfloor.current_job.begin_process_step(6)
+
+            Shopfloor.preemption.wait(STATE_SLEEP)
+            Shopfloor.current_job.finish_process_step(6)
+
+        def next(self):
+            return Shopfloor.check_job_status_then_change_state(Shopfloor, Shopfloor.op60, Shopfloor.finish_job, Shopfloor.shutdown)
+
+
+    class FinishJob(State):
+        ''' Do anything needed to finish the Job. '''
+
+        def run(self):
+            # Set the Job to DONE and release it, its PS and OPs from the simulation
+            Shopfloor.retire_job(Shopfloor, Shopfloor.current_job)
+
+            Shopfloor.current_job = None
+            Shopfloor.preemption.wait(STATE_SLEEP)
+
+        def next(self):
+            return Shopfloor.reset
+
+
+    class Reset(State):
+        '''Reset all Shopfloor resettable entities to their initial state.'''
+
+        def run(self):
+            for entity in Shopfloor.resettable_entities:
+                entity.reset()
+            A1.current_station = Station11.header
+            M1.current_station = Station12.header
+            M2.current_station = Station12.header
+            Shopfloor.create_job(Shopfloor, "Porsche1", [
+                                 Ps00, Ps01, Ps02, Ps03, Ps04, Ps05, Ps06])
+            Shopfloor.preemption.wait(5)
+
+        def next(self):
+            return Shopfloor.idle
+
+
+    class TransitionToOP10(State):
+        def run(self):
+            # start as threads
+            th1 = th.Thread(target=P1.move_robot_thread, args=[Station11_pos, Shopfloor.preemption])
+            th2 = th.Thread(target=P2.move_robot_thread, args=[init_pos_1, Shopfloor.preemption])
+            th3 = th.Thread(target=P3.move_robot_thread, args=[init_pos_2, Shopfloor.preemption])
+            th4 = th.Thread(target=P4.move_robot_thread, args=[init_pos_3, Shopfloor.preemption])
+            th5 = th.Thread(target=P5.move_robot_thread, args=[init_pos_4, Shopfloor.preemption])
+            th6 = th.Thread(target=P6.move_robot_thread, args=[init_pos_5, Shopfloor.preemption])
+            th1.start()
+            th2.start()
+            th3.start()
+            th4.start()
+            th5.start()
+            th6.start()
+            Shopfloor.preemption.join(th1)
+
+        def next(self):
+            return Shopfloor.check_job_status_then_change_state(Shopfloor, Shopfloor.transition_to_op10, Shopfloor.op10, Shopfloor.shutdown)
+
+
+    class TransitionToOP20(State):
+        '''Transition State from OP10 to OP20'''
+
+        def run(self):
+            # start as threads
+            th1 = th.Thread(target=P1.move_robot_thread, args=[Station12_pos, Shopfloor.preemption])
+            th2 = th.Thread(target=P2.move_robot_thread, args=[Station11_pos, Shopfloor.preemption])
+            th3 = th.Thread(target=P3.move_robot_thread, args=[init_pos_1, Shopfloor.preemption])
+            th4 = th.Thread(target=P4.move_robot_thread, args=[init_pos_2, Shopfloor.preemption])
+            th5 = th.Thread(target=P5.move_robot_thread, args=[init_pos_3, Shopfloor.preemption])
+            th6 = th.Thread(target=P6.move_robot_thread, args=[init_pos_4, Shopfloor.preemption])
+            th1.start()
+            th2.start()
+            th3.start()
+            th4.start()
+            th5.start()
+            th6.start()
+            Shopfloor.preemption.join(th2)
+
+        def next(self):
+            return Shopfloor.check_job_status_then_change_state(Shopfloor, Shopfloor.transition_to_op20, Shopfloor.op20, Shopfloor.shutdown)
+
+
+    class TransitionToOP30(State):
+        '''Transition State from OP20 to OP30'''
+
+        def run(self):
+            th1 = th.Thread(target=P1.move_robot_thread, args=[Station13_pos, Shopfloor.preemption])
+            th2 = th.Thread(target=P2.move_robot_thread, args=[Station12_pos, Shopfloor.preemption])
+            th3 = th.Thread(target=P3.move_robot_thread, args=[Station11_pos, Shopfloor.preemption])
+            th4 = th.Thread(target=P4.move_robot_thread, args=[init_pos_1, Shopfloor.preemption])
+            th5 = th.Thread(target=P5.move_robot_thread, args=[init_pos_2, Shopfloor.preemption])
+            th6 = th.Thread(target=P6.move_robot_thread, args=[init_pos_3, Shopfloor.preemption])
+            th1.start()
+            th2.start()
+            th3.start()
+            th4.start()
+            th5.start()
+            th6.start()
+            Shopfloor.preemption.join(th1)
+
+        def next(self):
+            return Shopfloor.check_job_status_then_change_state(Shopfloor, Shopfloor.transition_to_op30, Shopfloor.op30, Shopfloor.shutdown)
+
+
+    class TransitionToOP40(State):
+        '''Transition State from OP30 to OP40'''
+
+        def run(self):
+            th1 = th.Thread(target=P1.move_robot_thread, args=[Station14_pos, Shopfloor.preemption])
+            th2 = th.Thread(target=P2.move_robot_thread, args=[Station13_pos, Shopfloor.preemption])
+            th3 = th.Thread(target=P3.move_robot_thread, args=[Station12_pos, Shopfloor.preemption])
+            th4 = th.Thread(target=P4.move_robot_thread, args=[Station11_pos, Shopfloor.preemption])
+            th5 = th.Thread(target=P5.move_robot_thread, args=[init_pos_1, Shopfloor.preemption])
+            th6 = th.Thread(target=P6.move_robot_thread, args=[init_pos_2, Shopfloor.preemption])
+            th1.start()
+            th2.start()
+            th3.start()
+            th4.start()
+            th5.start()
+            th6.start()
+            Shopfloor.preemption.join(th1)
+
+        def next(self):
+            return Shopfloor.check_job_status_then_change_state(Shopfloor, Shopfloor.transition_to_op40, Shopfloor.op40, Shopfloor.shutdown)
+
+
+    class TransitionToOP50(State):
+        '''Transition State from OP40 to OP50'''
+
+        def run(self):
+            th1 = th.Thread(target=P1.move_robot_thread, args=[Station15_pos, Shopfloor.preemption])
+            th2 = th.Thread(target=P2.move_robot_thread, args=[Station14_pos, Shopfloor.preemption])
+            th3 = th.Thread(target=P3.move_robot_thread, args=[Station13_pos, Shopfloor.preemption])
+            th4 = th.Thread(target=P4.move_robot_thread, args=[Station12_pos, Shopfloor.preemption])
+            th5 = th.Thread(target=P5.move_robot_thread, args=[Station11_pos, Shopfloor.preemption])
+            th6 = th.Thread(target=P6.move_robot_thread, args=[init_pos_1, Shopfloor.preemption])
+            th1.start()
+            th2.start()
+            th3.start()
+            th4.start()
+            th5.start()
+            th6.start()
+            Shopfloor.preemption.join(th1)
+
+        def next(self):
+            return Shopfloor.check_job_status_then_change_state(Shopfloor, Shopfloor.transition_to_op50, Shopfloor.op50, Shopfloor.shutdown)
+
+
+    class TransitionToOP60(State):
+        '''Transition State from OP50 to OP60'''
+
+        def run(self):
+            th1 = th.Thread(target=P1.move_robot_thread, args=[Station16_pos, Shopfloor.preemption])
+            th2 = th.Thread(target=P2.move_robot_thread, args=[Station15_pos, Shopfloor.preemption])
+            th3 = th.Thread(target=P3.move_robot_thread, args=[Station14_pos, Shopfloor.preemption])
+            th4 = th.Thread(target=P4.move_robot_thread, args=[Station13_pos, Shopfloor.preemption])
+            th5 = th.Thread(target=P5.move_robot_thread, args=[Station12_pos, Shopfloor.preemption])
+            th6 = th.Thread(target=P6.move_robot_thread, args=[Station11_pos, Shopfloor.preemption])
+            th1.start()
+            th2.start()
+            th3.start()
+            th4.start()
+            th5.start()
+            th6.start()
+            Shopfloor.preemption.join(th1)
+
+        def next(self):
+            return Shopfloor.check_job_status_then_change_state(Shopfloor, Shopfloor.transition_to_op60, Shopfloor.op60, Shopfloor.shutdown)
+
+
+    ''' Entity and State Machine initialization. '''
+
+    # Define Station Positions for Products
+    init_pos_1 = [360, -800, 0]
+    init_pos_2 = [660, -800, 0]
+    init_pos_3 = [960, -800, 0]
+    init_pos_4 = [1260, -800, 0]
+    init_pos_5 = [1560, -800, 0]
+    init_pos_6 = [1860, -800, 0]
+    Station11_pos = [360, 550, 0]
+    Station12_pos = [360, 1650, 0]
+    Station13_pos = [360, 2750, 0]
+    Station14_pos = [360, 3850, 0]
+    Station15_pos = [360, 4950, 0]
+    Station16_pos = [360, 5000, 0]
+
+    # Instantiate general structure
+    Structure1 = Structure("Structure-001", "Structure1",
+                          "structure", "Im a structure")
+
+    # Instantiate Zones
+    Station11 = Zone("Station11", "Station11", "stations",
+                     "I'm Station 001!", Structure1)
+    Station12 = Zone("Station12", "Station12", "stations",
+                     "I'm Station 002!", Structure1)
+    Station13 = Zone("Station13", "Station13", "stations",
+                     "I'm Station 003!", Structure1)
+    Station14 = Zone("Station14", "Station14", "stations",
+                     "I'm Station 004!", Structure1)
+    Station15 = Zone("Station15", "Station15", "stations",
+                     "I'm Station 005!", Structure1)
+    Station16 = Zone("Station16", "Station16", "stations",
+                     "I'm Station 006!", Structure1)
+    Robot1 = Zone("robotzone", "robotzone", "robots",
+                  "mobile robot area 1", Structure1)
+    Halle = Zone("Halle", "Halle", "infrastructure", "Facility Layout", Structure1)
+
+    Products = Zone("Products", "Products", "products",
+                    "Produktbeschreibung", Structure1)
+
+    # Instantiate AGV
+    A1 = TwinAgv("Agv-001", "A1", "robots", "I'm AGV 001!", "agv", Robot1, facility_type="2", initial_euler=[0, 0, 0],
+                 initial_position=(1000, 0, 0), initial_orientation=[0, 0, 0, 0], current_station=Station11.header)
+
+    # Instantiate Mobile Robots
+    M1 = TwinAgv("MobileRobot-001", "M1", "robots", "I'm Mobile Robot 001!", "mobile", Robot1, facility_type="2", initial_euler=[0, 0, 0],
+                 initial_position=[1200, 0, 0], initial_orientation=[0, 0, 0, 0], current_station=Station12.header)
+    M2 = TwinAgv("MobileRobot-002", "M2", "robots", "I'm Mobile Robot 002!", "mobile", Robot1, facility_type="2", initial_euler=[0, 0, 0],
+                 initial_position=[1400, 0, 0], initial_orientation=[0, 0, 0, 0], current_station=Station12.header)
+
+    P1 = TwinAgv("Product-001", "P1", "products", "I'm product 001!", "mobile", Products, facility_type="Porsche_Panamera_Green_BP_2", initial_euler=[0, 0, 180],
+                 initial_position=init_pos_1, initial_orientation=[0, 0, 0, 0], current_station=Station11.header)
+
+    P2 = TwinAgv("Product-002", "P2", "products", "I'm product 002!", "mobile", Products, facility_type="Audi_a3_white", initial_euler=[0, 0, 180],
+                 initial_position=init_pos_2, initial_orientation=[0, 0, 0, 0], current_station=Station11.header)
+
+    P3 = TwinAgv("Product-003", "P3", "products", "I'm product 003!", "mobile", Products, facility_type="Audi_q2_red", initial_euler=[0, 0, 180],
+                 initial_position=init_pos_3, initial_orientation=[0, 0, 0, 0], current_station=Station11.header)
+
+    P4 = TwinAgv("Product-004", "P4", "products", "I'm product 004!", "mobile", Products, facility_type="BMW_i8_BP_red_2", initial_euler=[0, 0, 180],
+                 initial_position=init_pos_4, initial_orientation=[0, 0, 0, 0], current_station=Station11.header)
+
+    P5 = TwinAgv("Product-005", "P5", "products", "I'm product 005!", "mobile", Products, facility_type="ActrosBP_4", initial_euler=[0, 0, 180],
+                 initial_position=init_pos_5, initial_orientation=[0, 0, 0, 0], current_station=Station11.header)
+
+    P6 = TwinAgv("Product-006", "P6", "products", "I'm product 006!", "mobile", Products, facility_type="BMW_m2_coupe_BP_blue_4", initial_euler=[0, 0, 180],
+                 initial_position=init_pos_6, initial_orientation=[0, 0, 0, 0], current_station=Station11.header)
+    # Add Robots and AGVs to Robot-Zone
+    #Robot1.facilities.extend([A1.facility, M1.facility, M2.facility])
+    #Robot1.movers.extend([A1.mover, M1.mover, M2.mover])
+    # Robot1.update_state()
+
+    #Hallenfacility=facility("Halle",[4300,-3800,-2],[0,0,90], Halle,jtpath=CAD_PATH+"Halle_bereinigt.jt",)
+    Hallenareas = area([-600, -1440, -1], "WorkerArea", 4320, 8000, Halle)
+
+
+    # Halle.update_state()
+
+    # Initialise Areas:
+    Station11_area1 = area([0, 0, 0], "WorkerArea", 720, 1100, Station11)
+    Station12_area1 = area([0, 1100, 0], "WorkerArea", 720, 1100, Station12)
+    Station13_area1 = area([0, 2200, 0], "WorkerArea", 720, 1100, Station13)
+    Station14_area1 = area([0, 3300, 0], "WorkerArea", 720, 1100, Station14)
+
+    # Initialise Workers
+    Station11_worker1 = facility("operator11", [208, 510, 88], [
+                                 0, 0, 0],   Station11, facility_type="Brian_BP_5")
+    Station11_worker2 = facility("operator12", [208, 766, 88], [
+                                 0, 0, 0],   Station11, facility_type="Brian_BP_5")
+    Station11_worker3 = facility("operator13", [517, 645, 88], [
+                                 0, 0, 180], Station11, facility_type="Brian_BP_5")
+    Station12_worker1 = facility("operator21", [208, 1514, 88], [
+                                 0, 0, 0],  Station12, facility_type="Brian_BP_5")
+    Station12_worker2 = facility("operator22", [517, 1502, 88], [
+                                 0, 0, 180], Station12, facility_type="Brian_BP_5")
+    Station12_worker3 = facility("operator23", [573, 1801, 88], [
+                                 0, 0, 0],  Station12, facility_type="Brian_BP_5")
+    Station13_worker1 = facility("operator31", [208, 2652, 88], [
+                                 0, 0, 0],  Station13, facility_type="Brian_BP_5")
+    Station13_worker2 = facility("operator32", [517, 2645, 88], [
+                                 0, 0, 180], Station13, facility_type="Brian_BP_5")
+    Station14_worker1 = facility("operator41", [208, 3650, 88], [
+                                 0, 0, 0],  Station14, facility_type="Brian_BP_5")
+    Station14_worker2 = facility("operator42", [208, 4020, 88], [
+                                 0, 0, 0],  Station14, facility_type="Brian_BP_5")
+    Station14_worker3 = facility("operator43", [517, 3650, 88], [
+                                 0, 0, 180], Station14, facility_type="Brian_BP_5")
+    Station14_worker4 = facility("operator44", [517, 4020, 88], [
+                                 0, 0, 0],  Station14, facility_type="Brian_BP_5")
+
+    # Initialise Shelves
+    Station11_shelf1 = facility("Shelf11", [760, 150, 0], [
+                                0, 0, 90], Station11, facility_type="14")
+    Station11_shelf2 = facility("Shelf12", [760, 400, 0], [
+                                0, 0, 90], Station11, facility_type="14")
+    Station11_shelf3 = facility("Shelf13", [760, 650, 0], [
+                                0, 0, 90], Station11, facility_type="14")
+    Station11_shelf4 = facility("Shelf14", [760, 900, 0], [
+                                0, 0, 90], Station11, facility_type="14")
+    Station12_shelf1 = facility("Shelf21", [760, 1250, 0], [
+                                0, 0, 90], Station12, facility_type="14")
+    Station12_shelf2 = facility("Shelf22", [760, 1500, 0], [
+                                0, 0, 90], Station12, facility_type="14")
+    Station12_shelf3 = facility("Shelf23", [760, 1750, 0], [
+                                0, 0, 90], Station12, facility_type="14")
+    Station12_shelf4 = facility("Shelf24", [760, 1900, 0], [
+                                0, 0, 90], Station12, facility_type="14")
+    Station13_shelf1 = facility("Shelf31", [760, 2350, 0], [
+                                0, 0, 90], Station13, facility_type="14")
+    Station13_shelf2 = facility("Shelf32", [760, 2600, 0], [
+                                0, 0, 90], Station13, facility_type="14")
+    Station13_shelf3 = facility("Shelf33", [760, 2850, 0], [
+                                0, 0, 90], Station13, facility_type="14")
+    Station13_shelf4 = facility("Shelf34", [760, 3100, 0], [
+                                0, 0, 90], Station13, facility_type="14")
+    Station14_shelf1 = facility("Shelf41", [760, 3450, 0], [
+                                0, 0, 90], Station14, facility_type="14")
+    Station14_shelf2 = facility("Shelf42", [760, 3700, 0], [
+                                0, 0, 90], Station14, facility_type="14")
+    Station14_shelf3 = facility("Shelf43", [760, 3950, 0], [
+                                0, 0, 90], Station14, facility_type="14")
+    Station14_shelf4 = facility("Shelf44", [760, 4200, 0], [
+                                0, 0, 90], Station14, facility_type="14")
+
+    # Instantiate Operations
+    Op00 = Operation("OP-000", "Op00",
+                     "operations", "Main frame preparation")
+    Op10 = Operation("OP-010", "Op10",
+                     "operations", "Sub-assemble cross member")
+    Op20 = Operation("OP-020", "Op20",
+                     "operations", "Assemble cross member")
+    Op30 = Operation("OP-030", "Op30",
+                     "operations", "Assemble rear member")
+    Op40 = Operation("OP-040", "Op40",
+                     "operations", "Assemble front member")
+    Op50 = Operation("OP-050", "Op50",
+                     "operations", "Measurement")
+    Op60 = Operation("OP-060", "Op60",
+                     "operations", "Disassembly")
+
+    # Instantiate Process Steps
+    Ps00 = ProcessStep("PS-000", "Ps00", "process_steps", "I'm Process Step 00!",
+                       [copy.deepcopy(Op00)], Station11.header, nextPs="PS-001")
+    Ps01 = ProcessStep("PS-001", "Ps01", "process_steps", "I'm Process Step 01!",
+                       [copy.deepcopy(Op10)], Station11.header, prevPs="PS-000", nextPs="PS-002")
+    Ps02 = ProcessStep("PS-002", "Ps02", "process_steps", "I'm Process Step 02!",
+                       [copy.deepcopy(Op20)], Station12.header, prevPs="PS-001", nextPs="PS-003")
+    Ps03 = ProcessStep("PS-003", "Ps03", "process_steps", "I'm Process Step 03!",
+                       [copy.deepcopy(Op30)], Station13.header, prevPs="PS-002", nextPs="PS-004")
+    Ps04 = ProcessStep("PS-004", "Ps04", "process_steps", "I'm Process Step 04!",
+                       [copy.deepcopy(Op40)], Station14.header, prevPs="PS-003", nextPs="PS-005")
+    Ps05 = ProcessStep("PS-005", "Ps05", "process_steps", "I'm Process Step 05!",
+                       [copy.deepcopy(Op50)], Station15.header, prevPs="PS-004", nextPs="PS-006")
+    Ps06 = ProcessStep("PS-006", "Ps06", "process_steps", "I'm Process Step 06!",
+                       [copy.deepcopy(Op60)], Station16.header, prevPs="PS-005")
+
+    # Instantiate Stationary Robots
+    S1 = StationaryRobot("StationaryRobot-001", "S1", "robots", "I'm Stationary Robot 001!", "stationary",
+                         initial_position=[615, 100, 0], initial_orientation=[0, 0, 0, 0], current_station=Station11.header)
+    S2 = StationaryRobot("StationaryRobot-002", "S2", "robots", "I'm Stationary Robot 002!", "stationary",
+                         initial_position=[690, 100, 0], initial_orientation=[0, 0, 0, 0], current_station=Station11.header)
+    S3 = StationaryRobot("StationaryRobot-003", "S3", "robots", "I'm Stationary Robot 003!", "stationary",
+                         initial_position=[685, 415, 0], initial_orientation=[0, 0, 0, 0], current_station=Station13.header)
+    S4 = StationaryRobot("StationaryRobot-004", "S4", "robots", "I'm Stationary Robot 004!", "stationary",
+                         initial_position=[490, 600, 0], initial_orientation=[0, 0, 0, 0], current_station=Station12.header)
+    S5 = StationaryRobot("StationaryRobot-005", "S5", "robots", "I'm Stationary Robot 005!", "stationary",
+                         initial_position=[490, 320, 0], initial_orientation=[0, 0, 0, 0], current_station=Station14.header)
+    S6 = StationaryRobot("StationaryRobot-006", "S6", "robots", "I'm Stationary Robot 006!", "stationary",
+                         initial_position=[490, 270, 0], initial_orientation=[0, 0, 0, 0], current_station=Station14.header)
+
+    # Stations of the pipeline, the Robots that work at them (like in the OPxx
+    # States), where the products go and the products themselves
+    Shopfloor.line = ProductionLine(station_robots={
+        Station11.header._id: [S1, S2, A1],
+        Station12.header._id: [S4, M1, M2, A1],
+        Station13.header._id: [S3, M1, M2, A1],
+        Station14.header._id: [S5, S6, M1, M2, A1],
+        Station15.header._id: [A1],
+        Station16.header._id: [A1],
+    }, station_positions={
+        Station11.header._id: Station11_pos,
+        Station12.header._id: Station12_pos,
+        Station13.header._id: Station13_pos,
+        Station14.header._id: Station14_pos,
+        Station15.header._id: Station15_pos,
+        Station16.header._id: Station16_pos,
+    }, products=[P1, P2, P3, P4, P5, P6])
+
+    # List of entities that have the reset() method
+    Shopfloor.resettable_entities = [S1, S2, S3, S4, S5, S6,
+                                     M1, M2,
+                                     A1,
+                                     ]
+
+    # List of entities that publish data to MQTT
+    Shopfloor.publishing_entities = EntityRegistry([S1, S2, S3, S4, S5, S6,
+                                                     M1, M2,
+                                                     A1,
+                                                     P1, P2, P3, P4, P5, P6,
+                                                     Robot1, Structure1, Halle, Station11, Station12, Station13, Station14, Station15, Station16, Products
+                                                     ])
+
+
+    # Initialize State flow variables
+    Shopfloor.prev_state = None  # Will store a ref to the previous State
+    Shopfloor.flexibility = flexibility  # The scenario's flexibility id
+
+    # Initialize thread related variables
+    Shopfloor.run_event = th.Event()
+    Shopfloor.preemption = Preemption(Shopfloor)
+
+    # History of finished Jobs, written in the background
+    Shopfloor.archive = JobArchive(scenario=scenario_name)
+
+    # Stationary variable initialization (State registration):
+    Shopfloor.initialize = Initialize()
+    Shopfloor.shutdown = Shutdown()
+    Shopfloor.on_hold = OnHold()
+    Shopfloor.idle = Idle()
+    Shopfloor.begin_job = BeginJob()
+    Shopfloor.finish_job = FinishJob()
+    Shopfloor.pipeline = Pipeline()
+    Shopfloor.op00 = OP00()
+    Shopfloor.op10 = OP10()
+    Shopfloor.op20 = OP20()
+    Shopfloor.op30 = OP30()
+    Shopfloor.op40 = OP40()
+    Shopfloor.op50 = OP50()
+    Shopfloor.op60 = OP60()
+    Shopfloor.reset = Reset()
+    Shopfloor.transition_to_op10 = TransitionToOP10()
+    Shopfloor.transition_to_op20 = TransitionToOP20()
+    Shopfloor.transition_to_op30 = TransitionToOP30()
+    Shopfloor.transition_to_op40 = TransitionToOP40()
+    Shopfloor.transition_to_op50 = TransitionToOP50()
+    Shopfloor.transition_to_op60 = TransitionToOP60()
+
+    return Shopfloor
@@ -0,0 +1,87 @@
+"""
+    asyncio example with one state machine per AGV. Every AGV drives to its
+    station, works there and drives back, over and over. All machines share
+    the same State instances and run concurrently on a single event loop.
+
+    State flow (per AGV): DriveToStation -> Work -> DriveBack -> DriveToStation...
+
+    Run it with e.g. 1000 AGVs, 10 times faster than real time:
+
+        python -m shopfloor_simulation.scenarios.examples.async_robots
+"""
+
+import asyncio
+
+from shopfloor_simulation.entities import Agv
+from shopfloor_simulation.state_machine import AsyncState, AsyncStateMachine, SimClock
+
+AGV_COUNT = 1000
+TIME_SCALE = 10  # Simulated seconds per real second
+WORK_TIME = 2  # Simulated seconds spent at the station
+RUN_TIME = 5  # Real seconds to run the example for
+
+
+class AgvMachine(AsyncStateMachine):
+    def __init__(self, agv, station_position, clock):
+        self.agv = agv
+        self.station_position = station_position
+        self.cycles = 0  # How many times the AGV has worked at its station
+        AsyncStateMachine.__init__(self, drive_to_station, clock)
+
+
+class DriveToStation(AsyncState):
+    async def run(self, machine):
+        await machine.agv.move_robot_async(machine.station_position, machine.clock)
+
+    def next(self, machine):
+        return work
+
+
+class Work(AsyncState):
+    async def run(self, machine):
+        machine.agv.status = "BUSY"
+        await machine.clock.sleep(WORK_TIME)
+        machine.agv.status = "IDLE"
+        machine.cycles += 1
+
+    def next(self, machine):
+        return drive_back
+
+
+class DriveBack(AsyncState):
+    async def run(self, machine):
+        await machine.agv.move_robot_async(machine.agv.initial_pose["position"], machine.clock)
+
+    def next(self, machine):
+        return drive_to_station
+
+
+# State definition (shared by every machine)
+drive_to_station = DriveToStation()
+work = Work()
+drive_back = DriveBack()
+
+
+async def main():
+    clock = SimClock(time_scale=TIME_SCALE)
+    machines = []
+    for i in range(AGV_COUNT):
+        agv = Agv("Agv-{:04d}".format(i), "A" + str(i), "robots", "I'm AGV " + str(i) + "!", "agv",
+                  initial_position=[0, i * 10, 0])
+        machines.append(AgvMachine(agv, [100, i * 10, 0], clock))
+
+    task = asyncio.create_task(AsyncStateMachine.run_concurrently(machines))
+    await asyncio.sleep(RUN_TIME)
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+
+    cycles = sum(machine.cycles for machine in machines)
+    print("[#] " + str(AGV_COUNT) + " AGVs finished " + str(cycles) +
+          " work cycles in " + str(RUN_TIME) + "s.")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
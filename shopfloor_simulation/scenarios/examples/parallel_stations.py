@@ -0,0 +1,108 @@
+"""
+    Scenario with one child state machine per station. The stations work
+    concurrently, scheduled by the scenario's shared clock, while the top-level
+    (blocking) state machine monitors them.
+
+    Top-level state flow: StartLine -> Monitor -> Monitor... -> Shutdown (end)
+    Station state flow: Work -> Work...
+"""
+
+from time import sleep
+
+from shopfloor_simulation.state_machine import (AsyncState, AsyncStateMachine,
+                                                SimulatedScenario, State)
+
+STATE_SLEEP = 1  # Amount of time to wait between states.
+SCENARIO_NAME = __file__.split("\\")[-1].replace(".py", "")
+STATION_CYCLE_TIMES = [2, 3, 1.5]  # Simulated seconds per produced part, per station
+MONITOR_ROUNDS = 5  # How many times to print the line's output before shutting down
+
+
+class StationMachine(AsyncStateMachine):
+    def __init__(self, name, cycle_time):
+        self.name = name
+        self.cycle_time = cycle_time
+        self.produced = 0
+        AsyncStateMachine.__init__(self, work)
+
+
+class Work(AsyncState):
+    async def run(self, machine):
+        await machine.clock.sleep(machine.cycle_time)
+        machine.produced += 1
+
+    def next(self, machine):
+        return work
+
+
+class Scenario(SimulatedScenario):
+    def __init__(self):
+        print("[#] Initializing Scenario " + SCENARIO_NAME)
+
+        # The States reach the scenario's children through this reference
+        Scenario.instance = self
+
+        SimulatedScenario.__init__(self, Scenario.start_line)
+
+    def runAll(self):
+        prev_state_info = ""
+        state_info = ""
+        repeats = 0  # How many times has the same state_info been repeated
+
+        while self.is_active:
+            # Transition to the next state
+            self.current_state = self.current_state.next()
+
+            # Print state log and update values
+            prev_state_info, state_info, repeats = self.log_state_flow(
+                prev_state_info, state_info, repeats)
+
+            # Run the current state
+            self.current_state.run()
+
+        print("[#] Scenario " + SCENARIO_NAME + " has been shut down.")
+
+
+class StartLine(State):
+    def run(self):
+        for i, cycle_time in enumerate(STATION_CYCLE_TIMES):
+            Scenario.instance.add_child(
+                StationMachine("Station1" + str(i + 1), cycle_time))
+        Scenario.instance.start_children()
+
+    def next(self):
+        return Scenario.monitor
+
+
+class Monitor(State):
+    def run(self):
+        sleep(STATE_SLEEP)
+        Scenario.rounds += 1
+        print(", ".join(station.name + ": " + str(station.produced)
+                        for station in Scenario.instance.children))
+
+    def next(self):
+        if Scenario.rounds >= MONITOR_ROUNDS:
+            return Scenario.shutdown
+        return Scenario.monitor
+
+
+class Shutdown(State):
+    def run(self):
+        Scenario.instance.stop_children()
+        Scenario.instance.is_active = False
+
+    def next(self):
+        return Scenario.shutdown
+
+
+# State definition
+work = Work()  # Shared by every station
+Scenario.start_line = StartLine()
+Scenario.monitor = Monitor()
+Scenario.shutdown = Shutdown()
+
+Scenario.rounds = 0
+
+if __name__ == "__main__":
+    Scenario().runAll()
@@ -475,7 +475,8 @@ Shopfloor.publisher = ShopfloorPublisher(
     publishing_entities=Shopfloor.publishing_entities)
 Shopfloor.subscriber = JobManager(
     name="MQTT-S",
-    subscribed_topics=["freeaim/echo/jobs/+/status"])
+    subscribed_topics=["freeaim/echo/jobs/+/status"],
+    root_topic="freeaim/echo/")
 
 # Create 3 Jobs
 create_job()
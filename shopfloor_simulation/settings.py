@@ -2,6 +2,8 @@
     User configuration can be set here.
 """
 
+import os
+
 from dotenv import dotenv_values
 
 # secrets = {"USER": "foo", "EMAIL": "foo@example.org"}
@@ -16,3 +18,60 @@ MQTT_USERNAME = secrets["MQTT_USERNAME"]
 MQTT_PASSWORD = secrets["MQTT_PASSWORD"]
 MQTT_CLIENT_ID = "Shopfloor-Simulation-"  # A random number will be appended
 ROOT_TOPIC = "freeaimTwin/StateMachine/"  # The start of every topic used
+# 3 (v3.1.1) or 5. Opt-in v5: the broker doesn't echo our own messages, sessions outlive short
+# disconnections and hot topics get topic aliases. The broker must support it.
+MQTT_VERSION = 3
+MQTT_SESSION_EXPIRY = 300  # Time (s) the broker keeps the session after a disconnection (v5)
+MQTT_USER_PROPERTIES = False  # Send a sequence number and timestamp with every message (v5)
+
+# The MQTT clients always collect metrics (message counts, latencies, rate limiting, command queue).
+# Opt-in: seconds between publishing them on ROOT_TOPIC/metrics/<id>. 0 doesn't publish them.
+METRICS_INTERVAL = 0
+
+# Namespace -> payload encoding: "json", "msgpack" or "cbor", e.g. {"metrics": "msgpack"}.
+# Other namespaces use JSON, which ThingWorx and the DTV expect.
+PAYLOAD_ENCODINGS = {}
+
+# Token-bucket rate limits, so a fast publishing loop doesn't get us throttled by a shared broker.
+# Messages over a limit wait, and only the latest one of every topic is sent (see rate_limit.py).
+MQTT_RATE_LIMIT = None  # Messages/s per client. None is unlimited.
+MQTT_RATE_BURST = None  # Messages a client can send at once. Defaults to one second's worth.
+# Topic pattern (MQTT wildcards) -> messages/s of every matching topic, or (messages/s, burst),
+# e.g. {ROOT_TOPIC + "products/+/pose2": 10}
+TOPIC_RATE_LIMITS = {}
+
+# Opt-in: second connection for control traffic (subscriptions, tooltips, Jobs), so it never waits
+# behind telemetry or its rate limits (see DTVMqttClient). It doubles the connections to the broker.
+MQTT_CONTROL_CONNECTION = False
+
+# Also publish the layout as one compressed, retained message: "zlib", "zstd" or "" (off)
+LAYOUT_SNAPSHOT = ""
+
+# Namespaces also published as one message per publishing loop on ROOT_TOPIC/frames/<namespace>,
+# e.g. ["robots", "products"]. The per-entity topics are published either way.
+FRAME_NAMESPACES = []
+
+# Publish moves as motion segments plus corrections when the actual position is more than this
+# away from the predicted one (see DTVMqttClient). 0 publishes every step, which the DTV needs.
+DEAD_RECKONING_TOLERANCE = 0
+
+# Field path -> {"quantum": q, "deadband": d}, applied before payloads are compared, so that
+# insignificant changes aren't published (see publish_filter.py), e.g. positions to 1 mm:
+# "pose.position": {"quantum": 1}, "pose2": {"quantum": 1}, "battery_status": {"quantum": 0.001}
+PUBLISH_FILTERS = {}
+
+
+''' Job history. '''
+ARCHIVE_PATH = "job_history.sqlite3"  # SQLite database with the finished Jobs
+
+''' Scenario definitions. '''
+# Per-user folder for compiled scenarios. Empty disables it.
+SCENARIO_CACHE_PATH = os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"),
+                                   "shopfloor_simulation")
+MAX_WARM_SCENARIOS = 2  # Scenarios the Scenario Manager keeps built. None keeps all.
+# Opt-in: build the next likely scenario in the background and keep it connected, so switching
+# to it is fast. It costs a second set of MQTT connections and the memory of a second scenario.
+HOT_STANDBY = False
+
+''' Time-series recording. '''
+RECORDER_PATH = ""  # Folder for entity time-series chunks. Empty disables it.
@@ -0,0 +1,82 @@
+import hashlib
+import json
+import zlib
+
+import jsonpickle
+
+try:
+    import zstandard
+except ImportError:  # zstandard is only needed for "zstd" snapshots
+    zstandard = None
+
+from shopfloor_simulation.entities import Structure, Zone
+
+''' Layout snapshots.
+
+    The layout (the Structure and its Zones) is published entity by entity,
+    attribute by attribute, which means hundreds of topics for a viewer to
+    subscribe to and receive on connect. A layout snapshot is the whole
+    layout as one compressed, retained message: a viewer fetches it with a
+    single subscription.
+
+    The snapshot is JSON, {"<namespace>/<id>": payload, ...}, where every
+    payload is what the entity's head topic carries, compressed with zlib or
+    zstd. With MQTT v5 its content type says so, e.g. "application/json+zlib".
+    Its hash (SHA-256 of the uncompressed JSON) is retained on its own
+    topic, so a viewer can check whether its cached layout is still current.
+'''
+
+SNAPSHOT_TOPIC = "layout/snapshot"  # After the root topic
+SNAPSHOT_HASH_TOPIC = "layout/hash"  # After the root topic
+
+# Snapshot hash last published per snapshot topic, by this process
+published_hashes = {}
+
+
+def compress_zlib(data):
+    return zlib.compress(data, 9)
+
+
+def compress_zstd(data):
+    if zstandard is None:
+        raise ImportError("zstd layout snapshots require the zstandard package.")
+    return zstandard.ZstdCompressor(level=19).compress(data)
+
+
+# Compression name -> function(bytes) -> bytes
+COMPRESSIONS = {"zlib": compress_zlib, "zstd": compress_zstd}
+
+
+def is_layout(entity):
+    return isinstance(entity, (Structure, Zone))
+
+
+class LayoutSnapshot:
+    ''' The layout entities among `entities`, as one compressed blob with a content hash.
+
+        `static_payloads`: entity id -> pre-serialized JSON payload, used
+        instead of encoding the entity again (see CompiledScenario).
+    '''
+
+    def __init__(self, entities, static_payloads=None, compression="zlib"):
+        if compression not in COMPRESSIONS:
+            raise ValueError("Unknown snapshot compression '" + str(compression) +
+                             "'. Use one of: " + ", ".join(COMPRESSIONS) + ".")
+        static_payloads = static_payloads if static_payloads is not None else {}
+
+        layout = {}
+        for entity in entities:
+            if not is_layout(entity):
+                continue
+            payload = static_payloads.get(entity.header._id)
+            if payload is None:
+                payload = jsonpickle.encode(entity, unpicklable=False)
+            layout[entity.header._namespace + "/" + entity.header._id] = json.loads(payload)
+
+        # Sorted keys, so the same layout always has the same hash
+        data = json.dumps(layout, sort_keys=True, separators=(",", ":")).encode("utf-8")
+        self.entity_count = len(layout)
+        self.compression = compression
+        self.size = len(data)
+        self.hash = hashlib.sha256(data).hexdigest()
+        self.blob = COMPRESSIONS[compression](data)
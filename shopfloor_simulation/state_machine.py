@@ -1,5 +1,11 @@
-from shopfloor_simulation.entities import Job
+from shopfloor_simulation.commands import JOB_STATUS, CommandQueue
+from shopfloor_simulation.entities import EntityRegistry, Job
+from time import time, perf_counter
+import asyncio
 import copy
+import threading as th
+
+PREEMPTION_POLL = 0.1  # Seconds between the status checks of a Preemption while ON_HOLD or joining
 
 ''' State Machine and State definition '''
 # as described in: https://python-3-patterns-idioms-test.readthedocs.io/en/latest/StateMachine.html
@@ -49,8 +55,9 @@ class StateMachine:
             An example implementation can be found in `scenarioXX.py`.
         """
 
-        # Format the state's class name into a string.
-        state_info = "[#] " + self.current_state.__class__.__name__
+        # Format the state's name (or class name) into a string.
+        state_info = "[#] " + getattr(self.current_state, "name",
+                                      self.current_state.__class__.__name__)
 
         if state_info != prev_state_info and repeats > 0:
             # New state, and previous logs were repeating. Add a newline to avoid overwriting it.
@@ -72,17 +79,24 @@ class StateMachine:
 
 
 class SimulatedScenario(StateMachine):
-    def __init__(self, initial_state):
+    def __init__(self, initial_state, **properties):
+        ''' Set the default properties, then run the initial State.
+
+            `properties` override the defaults before the initial State runs,
+            e.g. `manager=scenario_manager`.
+        '''
         # MQTT related properties
         self.mqtt = None  # A ref to the MQTT Client object
         self.resettable_entities = []  # Objects that have a reset() method
-        self.publishing_entities = []  # Objects that will publish via MQTT
+        self.publishing_entities = EntityRegistry()  # Objects that will publish via MQTT
 
         # Job related properties
-        self.job_queue = []  # Queue with incoming Jobs
-        self.job_update_queue = []  # Queue with updates regarding Jobs' status
+        self.job_queue = EntityRegistry()  # Queue with incoming Jobs, in arrival order
+        self.commands = CommandQueue(self.command_handlers)  # Received commands, e.g. Job statuses
         self.job_count = 0  # How many Jobs have been created
         self.current_job = None  # Will store ref to Job objects
+        self.job_start_times = {}  # Job id -> time the Job was picked up
+        self.archive = None  # Optional JobArchive that stores finished Jobs
 
         # State flow related properties
         self.manager = None  # A ref to the Scenario Manager
@@ -92,11 +106,86 @@ class SimulatedScenario(StateMachine):
 
         # Threading related properties
         self.run_event = None  # threading.run_event() for synced thread shut down
+        self.preemption = Preemption(self)  # Interruptible sleeps (see Preemption)
+
+        # Child state machines (see `add_child`)
+        self.clock = SimClock()  # Shared by all child state machines
+        self.children = []  # AsyncStateMachines running alongside this one
+        self.children_loop = None  # Event loop that runs the children
+        self.children_thread = None  # Thread that runs children_loop
+
+        for name, value in properties.items():
+            setattr(self, name, value)
 
         # Set and run the initial State
         self.current_state = initial_state
         self.current_state.run()
 
+    def add_child(self, machine):
+        ''' Add a child AsyncStateMachine, e.g. one per station, AGV or Job.
+
+            Children share the scenario's clock and run concurrently on one
+            event loop in a background thread, while this (blocking) state
+            machine keeps running. Children added after `start_children()` start
+            right away.
+
+            The DTV flexibility scenarios run one child per Job in PIPELINED
+            mode (see `pipeline.JobMachine`), with the stations modelled by the
+            ProductionLine's capacities. Per-station children are shown in
+            `scenarios/examples/parallel_stations.py`.
+        '''
+        machine.clock = self.clock
+        machine.parent = self
+        self.children.append(machine)
+        if self.children_loop is not None:
+            # Called through the class, so class scenarios (self is the class) work too
+            self.children_loop.call_soon_threadsafe(
+                SimulatedScenario.schedule_child, self, machine)
+
+    def schedule_child(self, machine):
+        ''' Start a child on the children loop. Must be called from that loop. '''
+        task = self.children_loop.create_task(machine.runAll())
+        machine.task = task
+        # Finished children are dropped, so short lived ones (e.g. per Job) don't pile up
+        task.add_done_callback(
+            lambda _: SimulatedScenario.remove_child(self, machine))
+
+    def remove_child(self, machine):
+        if machine in self.children:
+            self.children.remove(machine)
+
+    def start_children(self):
+        ''' Start the children loop in a background thread and run every child on it. '''
+        if self.children_thread is not None:
+            return
+        self.children_loop = asyncio.new_event_loop()
+        for machine in self.children:
+            self.children_loop.call_soon(
+                SimulatedScenario.schedule_child, self, machine)
+        self.children_thread = th.Thread(
+            target=self.children_loop.run_forever, name="children", daemon=True)
+        self.children_thread.start()
+
+    def stop_children(self):
+        ''' Stop every child and the children loop, and wait for the thread to finish. '''
+        if self.children_thread is None:
+            return
+
+        async def cancel_children():
+            for machine in list(self.children):
+                machine.is_active = False
+                if getattr(machine, "task", None) is not None:
+                    machine.task.cancel()
+            await asyncio.sleep(0)  # Let the cancelled tasks finish
+
+        asyncio.run_coroutine_threadsafe(
+            cancel_children(), self.children_loop).result()
+        self.children_loop.call_soon_threadsafe(self.children_loop.stop)
+        self.children_thread.join()
+        self.children_loop.close()
+        self.children_loop = None
+        self.children_thread = None
+
     def check_job_status_then_change_state(self, current_state, next_state, shutdown_state):
         ''' Wrapper for the logic to check the Job status before state transition.
 
@@ -132,25 +221,25 @@ class SimulatedScenario(StateMachine):
             for job in self.job_queue:
                 if job.status == "IN_PROGRESS":
                     self.current_job = job
+                    self.job_start_times.setdefault(job.header._id, time())
                     return
 
     def update_jobs(self):
-        ''' Search the Job Queue and update the Jobs with their new statuses.
+        ''' Apply the received commands, e.g. the new Job statuses, in one batch.
 
-            Check if there are Job updates. For every one of them, search the
-            `job_queue` for a matching id and apply the new status.
+            Returns how many were applied.
         '''
-        if len(self.job_update_queue) > 0:
-            # Loop through the new Job updates
-            for (job_id, new_status) in self.job_update_queue:
-                # Loop through the existing Jobs inside the job_queue
-                for job in self.job_queue:
-                    # Search for a matching id. If found, apply the new status
-                    if job.header._id == job_id:
-                        job.status = new_status
-                        break
-            # Empty the update queue
-            self.job_update_queue = []
+        return self.commands.drain(self)
+
+    def apply_job_status(self, job_id, new_status):
+        ''' Search the Job Queue for the Job with `job_id` and apply its new status. '''
+        for job in self.job_queue:
+            if job.header._id == job_id:
+                job.status = new_status
+                break
+
+    # Command type -> function that applies it (see CommandQueue)
+    command_handlers = {JOB_STATUS: apply_job_status}
 
     def create_job(self, jobname, process_steps: list):
         ''' Create a new Job and add it to the Job Queue.
@@ -186,15 +275,251 @@ class SimulatedScenario(StateMachine):
         )
 
         # Setup the new Job in the simulation
-        self.job_queue.append(new_job)
-        self.publishing_entities.append(new_job)
+        self.job_queue.add(new_job)
+        self.publishing_entities.add(new_job)
         self.mqtt.initialize_single_topic(new_job)
         self.job_count += 1
 
         # Setup the Job's process steps
         for ps in new_job.process_steps:
             for op in ps.operations:
-                self.publishing_entities.append(op)
+                self.publishing_entities.add(op)
                 self.mqtt.initialize_single_topic(op)
-            self.publishing_entities.append(ps)
+            self.publishing_entities.add(ps)
             self.mqtt.initialize_single_topic(ps)
+
+    def retire_job(self, job, retain=False):
+        ''' Finish a Job and release it from the simulation.
+
+            The Job, its ProcessSteps and Operations are removed from the
+            publishing entities, and the MQTT client is told to publish their
+            final state (retained if `retain` is True) and forget their cached
+            payloads. If the scenario has an `archive`, the Job is queued to be
+            written to it. Nothing else keeps a reference to the Job afterwards.
+        '''
+        job.status = "DONE"
+        self.job_queue.discard(job)
+
+        started_at = self.job_start_times.pop(job.header._id, None)
+        if self.archive is not None:
+            self.archive.archive(job, started_at=started_at)
+
+        retired = [job]
+        for ps in job.process_steps:
+            retired.extend(ps.operations)
+            retired.append(ps)
+
+        for entity in retired:
+            self.publishing_entities.discard(entity)
+            self.mqtt.retire_entity(entity, retain=retain)
+
+
+class Preemption:
+    ''' Interruptible sleep for the blocking scenarios.
+
+        States and robot moves sleep through `wait()` instead of `time.sleep()`,
+        and whoever receives a command (e.g. `DTVMqttClient.on_message`) calls
+        `signal()`. The sleeping threads then react right away, instead of
+        after their sleep:
+        - If the selected flexibility changed, the sleep is aborted, so the
+        scenario can shut down.
+        - If the current Job is ON_HOLD, the sleep is paused until the Job is
+        IN_PROGRESS again, then sleeps the remaining time.
+
+        Only the scenario's own thread applies the received commands
+        (`update_jobs`): the robot move threads sleep with `update=False` and
+        only check the statuses, and the scenario thread waits for them with
+        `join()`, which keeps applying the commands meanwhile.
+
+        `scenario` is the scenario instance, or the class for scenarios that
+        keep their state on the class (e.g. `Preemption(Shopfloor)`).
+    '''
+
+    def __init__(self, scenario):
+        self.scenario = scenario
+        self.condition = th.Condition()
+
+    def signal(self):
+        ''' Wake every sleeping thread, so it checks the scenario again. '''
+        with self.condition:
+            self.condition.notify_all()
+
+    def update(self):
+        ''' Apply the received commands, and wake the other sleeping threads if they changed anything. '''
+        if SimulatedScenario.update_jobs(self.scenario):
+            self.signal()
+
+    def is_aborted(self):
+        ''' True if the selected flexibility isn't the scenario's anymore. '''
+        manager = self.scenario.manager
+        return manager is not None and manager.selected_flexibility != self.scenario.flexibility
+
+    def is_held(self):
+        ''' True if the current Job is ON_HOLD. '''
+        job = self.scenario.current_job
+        return job is not None and job.status == "ON_HOLD"
+
+    def wait(self, seconds, update=True):
+        ''' Sleep for `seconds`, not counting the time spent ON_HOLD.
+
+            Returns False if the sleep was aborted, True otherwise. With
+            `seconds` = 0, it only waits while the current Job is ON_HOLD.
+            `update`: apply the received commands while sleeping. Only the
+            scenario's thread should, the other threads pass False.
+        '''
+        remaining = seconds
+        with self.condition:
+            while True:
+                # Apply the received Job statuses before checking them
+                if update:
+                    self.update()
+
+                if self.is_aborted():
+                    return False
+                elif self.is_held():
+                    # Polled, in case the signal came before this thread was waiting
+                    self.condition.wait(PREEMPTION_POLL)
+                elif remaining <= 0:
+                    return True
+                else:
+                    start = perf_counter()
+                    self.condition.wait(remaining)
+                    remaining -= perf_counter() - start
+
+    def join(self, thread):
+        ''' Wait for `thread` (e.g. a robot move) to end, applying the received commands meanwhile. '''
+        while thread.is_alive():
+            self.update()
+            thread.join(PREEMPTION_POLL)
+
+
+class SimClock:
+    ''' Simulation time shared by the state machines running on one event loop.
+
+        `time_scale` is the amount of simulated seconds per real second, e.g.
+        10 runs the simulation ten times faster than real time.
+    '''
+
+    def __init__(self, time_scale=1.0):
+        self.time_scale = time_scale
+        self.start = perf_counter()
+
+    def now(self):
+        ''' Simulated seconds since the clock was created. '''
+        return (perf_counter() - self.start) * self.time_scale
+
+    async def sleep(self, seconds):
+        ''' Wait for `seconds` of simulated time. '''
+        await asyncio.sleep(seconds / self.time_scale)
+
+
+class AsyncState:
+    '''
+    Defines a State inside an AsyncStateMachine.
+
+    Unlike `State`, `run()` is a coroutine and both methods receive the
+    machine they're running in. A single State instance can then be shared by
+    thousands of machines, since everything specific to one machine is stored
+    in the machine itself.
+    '''
+
+    async def run(self, machine):
+        ''' What happens inside the State. Await `machine.clock.sleep()` instead of sleeping. '''
+        assert 0, "run not implemented"
+
+    def next(self, machine):
+        ''' Rules for deciding which should the next State be. '''
+        assert 0, "next not implemented"
+
+
+class AsyncStateMachine:
+    '''
+    asyncio variant of the StateMachine. Many of them can run concurrently on a
+    single event loop (see `run_concurrently`), all sharing one SimClock.
+    '''
+
+    def __init__(self, initial_state, clock=None):
+        self.current_state = initial_state
+        self.clock = clock if clock is not None else SimClock()
+        self.is_active = True  # Signals if the state machine should keep running
+        self.parent = None  # The machine this one is a child of
+        self.children = []  # Nested machines, run by `run_children()`
+
+    async def runAll(self):
+        ''' Run the initial State, then run States until `is_active` is cleared. '''
+        await self.current_state.run(self)
+        while self.is_active:
+            self.current_state = self.current_state.next(self)
+            await self.current_state.run(self)
+            # Let the other machines run, even if this State didn't wait
+            await asyncio.sleep(0)
+
+    @staticmethod
+    async def run_concurrently(machines):
+        ''' Run every machine in `machines` on the current event loop until they all stop. '''
+        await asyncio.gather(*(machine.runAll() for machine in machines))
+
+    def add_child(self, machine):
+        ''' Nest a machine inside this one. It shares this machine's clock. '''
+        machine.clock = self.clock
+        machine.parent = self
+        self.children.append(machine)
+
+    async def run_children(self):
+        ''' Run the nested machines concurrently until they all stop. '''
+        await AsyncStateMachine.run_concurrently(self.children)
+
+
+class ParallelState(AsyncState):
+    '''
+    Composite State that runs its machine's children concurrently and only
+    finishes once all of them have stopped (fork/join). Used to build
+    hierarchical machines, e.g. a line whose stations are child machines.
+    '''
+
+    def __init__(self, next_state=None):
+        self.next_state = next_state
+
+    async def run(self, machine):
+        await machine.run_children()
+
+    def next(self, machine):
+        return self.next_state
+
+
+class AsyncSimulatedScenario(AsyncStateMachine):
+    ''' asyncio variant of the SimulatedScenario.
+
+        Job handling is shared with SimulatedScenario. Unlike the blocking
+        scenarios, all state lives in the instance, so the same scenario class
+        can be instantiated many times.
+    '''
+
+    def __init__(self, initial_state, clock=None):
+        AsyncStateMachine.__init__(self, initial_state, clock)
+
+        # MQTT related properties
+        self.mqtt = None  # A ref to the MQTT Client object
+        self.resettable_entities = []  # Objects that have a reset() method
+        self.publishing_entities = EntityRegistry()  # Objects that will publish via MQTT
+
+        # Job related properties
+        self.job_queue = EntityRegistry()  # Queue with incoming Jobs, in arrival order
+        self.commands = CommandQueue(self.command_handlers)  # Received commands, e.g. Job statuses
+        self.job_count = 0  # How many Jobs have been created
+        self.current_job = None  # Will store ref to Job objects
+        self.job_start_times = {}  # Job id -> time the Job was picked up
+        self.archive = None  # Optional JobArchive that stores finished Jobs
+
+        # State flow related properties
+        self.manager = None  # A ref to the Scenario Manager
+        self.prev_state = None  # Will store a ref to the previous State
+        self.flexibility = None  # The flexibility id of the scenario
+
+    check_job_status_then_change_state = SimulatedScenario.check_job_status_then_change_state
+    update_current_job = SimulatedScenario.update_current_job
+    update_jobs = SimulatedScenario.update_jobs
+    apply_job_status = SimulatedScenario.apply_job_status
+    command_handlers = SimulatedScenario.command_handlers
+    create_job = SimulatedScenario.create_job
+    retire_job = SimulatedScenario.retire_job
@@ -0,0 +1,119 @@
+import re
+
+# Path parameter, e.g. {job_id} or {flexibility:int}
+PARAMETER = re.compile(r"^\{(\w+)(?::(\w+))?\}$")
+
+# Parameter type -> function that converts the topic level
+CONVERTERS = {"str": str, "int": int, "float": float}
+
+
+class Route:
+    ''' A topic pattern and its handler. `parameters` are (level, name, converter). '''
+
+    def __init__(self, pattern, handler, parameters):
+        self.pattern = pattern
+        self.handler = handler
+        self.parameters = parameters
+
+
+class RouteNode:
+    ''' A topic level inside the TopicRouter trie. '''
+
+    def __init__(self):
+        self.children = {}  # Topic level -> RouteNode
+        self.wildcard = None  # RouteNode for `+` and parameters
+        self.route = None  # Route of the pattern that ends here
+        self.multi_level = None  # Route of the pattern that ends here with `#`
+
+
+class TopicRouter:
+    ''' Dispatch received MQTT messages to handlers by topic.
+
+        Topic patterns are stored in a trie, level by level, so finding the
+        handler of a topic only depends on the amount of levels of that topic,
+        not on the amount of patterns. Patterns support the MQTT wildcards `+`
+        (one level) and `#` (every remaining level, last level only), and path
+        parameters, which match one level like `+` and are passed to the
+        handler as keyword arguments:
+
+            router.add(ROOT_TOPIC + "jobs/{job_id}/status", handle_job_status)
+            router.dispatch(msg.topic, msg)  # -> handle_job_status(msg, job_id="Job-001")
+
+        Parameters can be typed, e.g. `{flexibility:int}` (str, int or float).
+        Exact levels win over `+` and parameters, which win over `#`.
+    '''
+
+    def __init__(self):
+        self.root = RouteNode()
+
+    def add(self, pattern, handler):
+        ''' Route the topics that match `pattern` to `handler(message, **parameters)`. '''
+        node = self.root
+        parameters = []
+        levels = pattern.split('/')
+        for index, level in enumerate(levels):
+            if level == '#':
+                if index != len(levels) - 1:
+                    raise ValueError(
+                        "'#' must be the last level of the topic pattern " + pattern)
+                if node.multi_level is not None:
+                    raise ValueError("Topic pattern already routed: " + pattern)
+                node.multi_level = Route(pattern, handler, parameters)
+                return
+
+            parameter = PARAMETER.match(level)
+            if parameter is not None:
+                name, kind = parameter.groups()
+                if kind is not None and kind not in CONVERTERS:
+                    raise ValueError("Unknown parameter type '" + kind +
+                                     "' in the topic pattern " + pattern)
+                parameters.append((index, name, CONVERTERS[kind or "str"]))
+            elif '+' in level or '#' in level or '{' in level:
+                if level != '+':
+                    raise ValueError("Invalid level '" + level +
+                                     "' in the topic pattern " + pattern)
+
+            if level == '+' or parameter is not None:
+                if node.wildcard is None:
+                    node.wildcard = RouteNode()
+                node = node.wildcard
+            else:
+                node = node.children.setdefault(level, RouteNode())
+
+        if node.route is not None:
+            raise ValueError("Topic pattern already routed: " + pattern)
+        node.route = Route(pattern, handler, parameters)
+
+    def match(self, topic):
+        ''' Return the Route of `topic` and its parameters, or (None, None). '''
+        levels = topic.split('/')
+        route = self.match_levels(self.root, levels, 0)
+        if route is None:
+            return None, None
+        parameters = {name: convert(levels[index])
+                      for index, name, convert in route.parameters}
+        return route, parameters
+
+    def match_levels(self, node, levels, index):
+        if index == len(levels):
+            # `a/#` also matches `a`
+            return node.route if node.route is not None else node.multi_level
+
+        child = node.children.get(levels[index])
+        if child is not None:
+            route = self.match_levels(child, levels, index + 1)
+            if route is not None:
+                return route
+        if node.wildcard is not None:
+            route = self.match_levels(node.wildcard, levels, index + 1)
+            if route is not None:
+                return route
+        return node.multi_level
+
+    def dispatch(self, topic, message):
+        ''' Call the handler of `topic` with `message`. Returns False if no pattern matches. '''
+        route, parameters = self.match(topic)
+        if route is None:
+            return False
+        route.handler(message, **parameters)
+        return True
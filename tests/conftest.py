@@ -0,0 +1,9 @@
+import os
+import tempfile
+
+# settings.py reads the MQTT credentials from a .env in the working directory.
+# Run the tests from a directory with placeholder credentials (no test connects).
+WORKING_DIR = tempfile.mkdtemp(prefix="shopfloor_tests_")
+with open(os.path.join(WORKING_DIR, ".env"), "w") as env:
+    env.write("MQTT_USERNAME=test\nMQTT_PASSWORD=test\n")
+os.chdir(WORKING_DIR)
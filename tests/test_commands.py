@@ -0,0 +1,31 @@
+from shopfloor_simulation.commands import JOB_STATUS, CommandQueue
+
+
+def test_only_the_last_value_of_every_key_is_applied():
+    applied = []
+    queue = CommandQueue({JOB_STATUS: lambda scenario, key, value: applied.append((key, value))})
+    queue.put(JOB_STATUS, "Job-001", "ON_HOLD")
+    queue.put(JOB_STATUS, "Job-002", "ON_HOLD")
+    queue.put(JOB_STATUS, "Job-001", "IN_PROGRESS")
+
+    assert queue.drain(None) == 2
+    # In the order they were last received
+    assert applied == [("Job-002", "ON_HOLD"), ("Job-001", "IN_PROGRESS")]
+    assert queue.metrics.counters["coalesced"] == 1
+    assert queue.drain(None) == 0
+
+
+def test_failing_and_unknown_commands_dont_stop_the_batch():
+    applied = []
+
+    def handler(scenario, key, value):
+        if value == "bad":
+            raise ValueError(value)
+        applied.append(key)
+
+    queue = CommandQueue({JOB_STATUS: handler})
+    queue.put("unknown", "x", 1)
+    queue.put(JOB_STATUS, "Job-001", "bad")
+    queue.put(JOB_STATUS, "Job-002", "DONE")
+    queue.drain(None)
+    assert applied == ["Job-002"]
@@ -0,0 +1,43 @@
+import jsonpickle
+import pytest
+
+from shopfloor_simulation.entities import MOVEMENT_SLEEP, Robot, motion_position
+
+
+class TrackedRobot(Robot):
+    track_motion = True
+
+
+def make_robot(cls=TrackedRobot):
+    return cls("Agv-001", "A1", "robots", "", "agv", initial_position=[0, 0, 0])
+
+
+def test_motion_predicts_every_step():
+    robot = make_robot()
+    steps = robot.move_steps([10, -4, 0])
+    moved = 0
+    for _ in steps:
+        moved += 1
+        motion = robot.motion
+        assert robot.status == "TRANSPORT"
+        assert motion["start"] == [0, 0, 0] and motion["target"] == [10, -4, 0]
+        predicted = motion_position(motion, motion["start_time"] + moved * MOVEMENT_SLEEP)
+        assert predicted == pytest.approx(robot.pose["position"], abs=1e-3)
+    assert robot.pose["position"] == [10, -4, 0]
+    assert robot.motion is None
+    assert robot.status == "IDLE"
+
+
+def test_stopped_moves_restore_the_status():
+    robot = make_robot()
+    steps = robot.move_steps([100, 0, 0])
+    next(steps)
+    steps.close()
+    assert robot.motion is None
+    assert robot.status == "IDLE"
+
+
+def test_motion_is_only_published_with_dead_reckoning():
+    plain, tracked = make_robot(Robot), make_robot()
+    assert "motion" not in jsonpickle.decode(jsonpickle.encode(plain, unpicklable=False))
+    assert "motion" in jsonpickle.decode(jsonpickle.encode(tracked, unpicklable=False))
@@ -0,0 +1,47 @@
+import pytest
+
+from shopfloor_simulation.mqtt_log import MqttLogReader, MqttLogWriter
+
+MESSAGES = [
+    ("freeaimTwin/StateMachine/robots/R1", b'{"status": "IDLE"}', 0, False),
+    ("freeaimTwin/StateMachine/jobs/Job-001/status", b"IN_PROGRESS", 1, True),
+    ("/VR/viewer_info/tooltip", b"", 2, False),
+]
+
+
+def test_messages_are_read_back_as_written(tmp_path):
+    path = str(tmp_path / "messages.log")
+    writer = MqttLogWriter(path)
+    for message in MESSAGES:
+        writer.write(*message)
+    writer.close()
+    assert writer.message_count == len(MESSAGES)
+
+    reader = MqttLogReader(path)
+    records = [(bytes(topic).decode("utf-8"), bytes(payload), qos, retain, timestamp)
+               for timestamp, topic, payload, qos, retain in reader.records()]
+    reader.close()
+    assert [record[:4] for record in records] == MESSAGES
+    timestamps = [record[4] for record in records]
+    assert timestamps == sorted(timestamps)
+
+
+def test_truncated_log_stops_at_the_last_complete_message(tmp_path):
+    path = str(tmp_path / "messages.log")
+    writer = MqttLogWriter(path)
+    for message in MESSAGES[:2]:
+        writer.write(*message)
+    writer.close()
+    with open(path, "r+b") as log:
+        log.truncate(log.seek(0, 2) - 1)
+
+    reader = MqttLogReader(path)
+    assert len(list(reader.records())) == 1
+    reader.close()
+
+
+def test_other_files_are_rejected(tmp_path):
+    path = tmp_path / "other.log"
+    path.write_bytes(b"not a message log")
+    with pytest.raises(ValueError):
+        MqttLogReader(str(path))
@@ -0,0 +1,57 @@
+from shopfloor_simulation.mqtt_utils import TopicAliases, coalesce_messages, payload_bytes
+
+
+def test_hot_topics_get_an_alias():
+    aliases = TopicAliases(threshold=3)
+    aliases.reset(10)
+    assert aliases.resolve("a") == ("a", None)
+    assert aliases.resolve("a") == ("a", None)
+    assert aliases.resolve("a") == ("a", 1)  # Sent once more along with the alias
+    assert aliases.resolve("a") == ("", 1)
+
+
+def test_no_aliases_until_the_broker_allows_them():
+    aliases = TopicAliases(threshold=1)
+    assert [aliases.resolve("a") for _ in range(3)] == [("a", None)] * 3
+
+
+def test_least_recently_used_alias_is_reused():
+    aliases = TopicAliases(threshold=1)
+    aliases.reset(2)
+    assert aliases.resolve("a") == ("a", 1)
+    assert aliases.resolve("b") == ("b", 2)
+    assert aliases.resolve("a") == ("", 1)
+    assert aliases.resolve("c") == ("c", 2)  # "b" was the least recently used
+    assert aliases.resolve("b") == ("b", 1)
+
+
+def test_qos_above_0_sends_the_full_topic():
+    aliases = TopicAliases(threshold=1)
+    aliases.reset(10)
+    assert aliases.resolve("a", qos=1) == ("a", None)
+    assert aliases.resolve("a") == ("a", 1)
+    assert aliases.resolve("a", qos=2) == ("a", None)  # Even once it has an alias
+    assert aliases.resolve("a") == ("", 1)
+
+
+def test_reset_forgets_the_aliases():
+    aliases = TopicAliases(threshold=1)
+    aliases.reset(10)
+    aliases.resolve("a")
+    aliases.reset(0)  # Disconnected
+    assert aliases.resolve("a") == ("a", None)
+    aliases.reset(10)
+    assert aliases.resolve("a") == ("a", 1)
+
+
+def test_coalesced_publish_keeps_retain_and_qos():
+    held = ("old", 1, True, None, None)
+    newer = ("new", 0, False, {"seq": 2}, "application/json")
+    assert coalesce_messages(held, newer) == ("new", 1, True, {"seq": 2}, "application/json")
+
+
+def test_payload_bytes_match_paho():
+    assert payload_bytes(None) == b""
+    assert payload_bytes("é") == "é".encode("utf-8")
+    assert payload_bytes(1.5) == b"1.5"
+    assert payload_bytes(bytearray(b"ab")) == b"ab"
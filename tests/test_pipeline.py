@@ -0,0 +1,53 @@
+import pytest
+
+from shopfloor_simulation.entities import ProcessStep
+from shopfloor_simulation.pipeline import ProcessStepGraph
+
+
+def step(_id, next_ps="", prev_ps=""):
+    return ProcessStep(_id, _id, "process_steps", "", [], None, next_ps, prev_ps)
+
+
+def run_graph(graph):
+    ''' Finish the ready steps one at a time, returning the order they ran in. '''
+    order = []
+    while not graph.is_finished():
+        index = graph.pop_ready()
+        assert index is not None
+        order.append(index)
+        graph.done(index)
+    return order
+
+
+def test_steps_run_after_their_predecessors():
+    # 0 -> (1, 2) -> 3
+    graph = ProcessStepGraph([
+        step("PS0", next_ps=["PS1", "PS2"]),
+        step("PS1", prev_ps="PS0"),
+        step("PS2", prev_ps="PS0"),
+        step("PS3", prev_ps=["PS1", "PS2"]),
+    ])
+    assert graph.pop_ready() == 0
+    assert graph.pop_ready() is None
+    graph.done(0)
+    assert {graph.pop_ready(), graph.pop_ready()} == {1, 2}
+    graph.done(1)
+    assert graph.pop_ready() is None  # Still waiting for PS2
+    graph.done(2)
+    assert graph.pop_ready() == 3
+    graph.done(3)
+    assert graph.is_finished()
+
+
+def test_links_outside_the_job_are_satisfied():
+    graph = ProcessStepGraph([step("PS5", prev_ps="PS4", next_ps="PS6"), step("PS6", prev_ps="PS5")])
+    assert run_graph(graph) == [0, 1]
+
+
+def test_cycles_are_rejected():
+    with pytest.raises(ValueError):
+        ProcessStepGraph([
+            step("PS0", next_ps="PS1"),
+            step("PS1", next_ps="PS2"),
+            step("PS2", next_ps="PS1"),
+        ])
@@ -0,0 +1,60 @@
+import pytest
+
+from shopfloor_simulation.publish_filter import PayloadFilter
+
+
+def test_numbers_lists_and_strings_are_quantized():
+    payload_filter = PayloadFilter({
+        "battery_status": {"quantum": 0.001},
+        "pose.position": {"quantum": 1},
+        "pose2": {"quantum": 1},
+    })
+    payload = {"battery_status": 0.98765,
+               "pose": {"position": [10.4, 20.6, 0]},
+               "pose2": "PE,10.4,-20.6,0,0,0,0"}
+    payload_filter.apply("R1", payload)
+    assert payload == {"battery_status": 0.988,
+                       "pose": {"position": [10, 21, 0]},
+                       "pose2": "PE,10,-21,0,0,0,0"}
+
+
+def test_changes_within_the_deadband_keep_the_published_value():
+    payload_filter = PayloadFilter({"pose.position": {"deadband": 5}})
+    values = []
+    for x in (0, 3, 4.9, 6, 8):
+        payload = {"pose": {"position": [x, 0, 0]}}
+        payload_filter.apply("R1", payload)
+        values.append(payload["pose"]["position"][0])
+    assert values == [0, 0, 0, 6, 6]
+    assert payload_filter.metrics.counters["filtered"] == 3
+    assert payload_filter.metrics.counters["filtered.pose.position"] == 3
+
+
+def test_entities_are_filtered_separately():
+    payload_filter = PayloadFilter({"battery_status": {"deadband": 0.1}})
+    payload_filter.apply("R1", {"battery_status": 1.0})
+    payload = {"battery_status": 0.5}
+    payload_filter.apply("R2", payload)
+    assert payload == {"battery_status": 0.5}
+
+
+def test_forget_starts_over():
+    payload_filter = PayloadFilter({"battery_status": {"deadband": 0.1}})
+    payload_filter.apply("R1", {"battery_status": 1.0})
+    payload_filter.forget("R1")
+    payload = {"battery_status": 0.95}
+    payload_filter.apply("R1", payload)
+    assert payload == {"battery_status": 0.95}
+
+
+def test_missing_fields_are_skipped():
+    payload_filter = PayloadFilter({"pose.position": {"quantum": 1}})
+    payload = {"status": "IDLE"}
+    payload_filter.apply("R1", payload)
+    assert payload == {"status": "IDLE"}
+
+
+@pytest.mark.parametrize("rule", [{"quantum": 0}, {"deadband": -1}])
+def test_invalid_rules(rule):
+    with pytest.raises(ValueError):
+        PayloadFilter({"battery_status": rule})
@@ -0,0 +1,60 @@
+import pytest
+
+from shopfloor_simulation.rate_limit import RateLimiter, TokenBucket
+
+
+def test_bucket_starts_full_and_refills():
+    bucket = TokenBucket(rate=10, burst=2)
+    now = bucket.updated
+    assert bucket.available(now)
+    bucket.take()
+    bucket.take()
+    assert not bucket.available(now)
+    assert bucket.available(now + 0.1)  # One token per 0.1 s
+
+
+def test_bucket_rejects_non_positive_rates():
+    with pytest.raises(ValueError):
+        TokenBucket(0)
+
+
+def test_first_message_of_a_topic_goes_out():
+    # The topic's bucket is created after `now` is taken in `admit`
+    limiter = RateLimiter(topic_limits={"a/+": 1})
+    assert limiter.admit("a/1", "first")
+    assert limiter.admit("a/2", "other topic")
+    assert not limiter.admit("a/1", "second")
+
+
+def test_held_messages_are_coalesced_to_the_latest():
+    limiter = RateLimiter(topic_limits={"a": (1, 1)})
+    assert limiter.admit("a", 1)
+    assert not limiter.admit("a", 2)
+    assert not limiter.admit("a", 3)
+    limiter.topic_buckets["a"].tokens = 1
+    assert limiter.release() == [("a", 3)]
+    assert limiter.release() == []
+    assert limiter.metrics.counters["rate_limited"] == 1
+    assert limiter.metrics.counters["rate_limited_coalesced"] == 1
+
+
+def test_coalesce_function_merges_held_and_newer():
+    limiter = RateLimiter(topic_limits={"a": (1, 1)},
+                          coalesce=lambda held, newer: held + newer)
+    limiter.admit("a", "x")
+    limiter.admit("a", "y")
+    limiter.admit("a", "z")
+    limiter.topic_buckets["a"].tokens = 1
+    assert limiter.release() == [("a", "yz")]
+
+
+def test_global_limit_holds_back_other_topics():
+    limiter = RateLimiter(rate=1, burst=1)
+    assert limiter.admit("a", 1)
+    assert not limiter.admit("b", 2)
+
+
+def test_topics_without_limit_are_not_held():
+    limiter = RateLimiter(topic_limits={"a": (1, 1)})
+    assert limiter.admit("a", 1)
+    assert all(limiter.admit("b", i) for i in range(10))
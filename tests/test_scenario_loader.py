@@ -0,0 +1,89 @@
+import copy
+import os
+
+import pytest
+
+from shopfloor_simulation.scenario_loader import (GUARD_JOB, CompiledScenario,
+                                                  ScenarioDefinitionError,
+                                                  load_definition)
+
+SCENARIOS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                         "shopfloor_simulation", "scenarios")
+DEFINITIONS = ["dtv/flexibility0.json", "dtv/flexibility1.json", "scenarioTwinViewer1.json"]
+
+
+def flexibility0():
+    return load_definition(os.path.join(SCENARIOS, "dtv", "flexibility0.json"))
+
+
+def state(definition, name):
+    return next(spec for spec in definition["states"] if spec["name"] == name)
+
+
+@pytest.mark.parametrize("path", DEFINITIONS)
+def test_shipped_definitions_compile(path):
+    compiled = CompiledScenario(load_definition(os.path.join(SCENARIOS, path)))
+    assert compiled.initial_state.name == compiled.definition["initial_state"]
+    assert len(compiled.transitions) == len(compiled.definition["states"])
+
+
+def test_flexibility0_transitions():
+    compiled = CompiledScenario(flexibility0())
+    assert compiled.flexibility == 0
+    assert compiled.shutdown_state.name == "shutdown"
+    assert compiled.on_hold_state.name == "on_hold"
+    assert GUARD_JOB in [guard for guard, _ in compiled.transitions]
+
+
+def test_definitions_without_flexibility_need_no_shutdown_state():
+    definition = load_definition(os.path.join(SCENARIOS, "scenarioTwinViewer1.json"))
+    assert "flexibility" not in definition and "shutdown_state" not in definition
+    assert CompiledScenario(definition).shutdown_state is None
+
+
+def unknown_next_state(definition):
+    state(definition, "idle")["next"] = "missing"
+
+
+def unknown_action(definition):
+    state(definition, "idle")["actions"] = [["teleport"]]
+
+
+def wrong_argument_count(definition):
+    state(definition, "idle")["actions"] = [["begin_step"]]
+
+
+def negative_step_index(definition):
+    state(definition, "idle")["actions"] = [["begin_step", -1]]
+
+
+def unknown_guard(definition):
+    state(definition, "idle")["guard"] = "maybe"
+
+
+def state_defined_twice(definition):
+    definition["states"].append(copy.deepcopy(state(definition, "idle")))
+
+
+def missing_shutdown_state(definition):
+    del definition["shutdown_state"]
+
+
+def unknown_robot(definition):
+    definition["publishing"].append("R99")
+
+
+def unknown_robot_kind(definition):
+    definition["robots"][next(iter(definition["robots"]))]["kind"] = "drone"
+
+
+@pytest.mark.parametrize("break_definition", [
+    unknown_next_state, unknown_action, wrong_argument_count, negative_step_index,
+    unknown_guard, state_defined_twice, missing_shutdown_state, unknown_robot,
+    unknown_robot_kind,
+])
+def test_invalid_definitions_are_rejected(break_definition):
+    definition = flexibility0()
+    break_definition(definition)
+    with pytest.raises(ScenarioDefinitionError):
+        CompiledScenario(definition)
@@ -0,0 +1,91 @@
+import threading as th
+from time import perf_counter, sleep
+from types import SimpleNamespace
+
+from shopfloor_simulation.commands import JOB_STATUS
+from shopfloor_simulation.entities import Job
+from shopfloor_simulation.scenario_loader import action_hold
+from shopfloor_simulation.state_machine import SimulatedScenario, State
+
+
+class Idle(State):
+    def run(self):
+        pass
+
+    def next(self):
+        return self
+
+
+def make_scenario(status="IN_PROGRESS"):
+    scenario = SimulatedScenario(Idle(), flexibility=0,
+                                 manager=SimpleNamespace(selected_flexibility=0))
+    job = Job("Job-001", "Porsche1", "jobs", "", [])
+    job.status = status
+    scenario.job_queue.add(job)
+    scenario.current_job = job
+    return scenario
+
+
+def later(seconds, function):
+    ''' Call `function` from another thread after `seconds`, like a received command. '''
+    def run():
+        sleep(seconds)
+        function()
+    thread = th.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
+
+
+def resume(scenario):
+    scenario.commands.put(JOB_STATUS, "Job-001", "IN_PROGRESS")
+    scenario.preemption.signal()
+
+
+def test_wait_sleeps_when_nothing_happens():
+    scenario = make_scenario()
+    start = perf_counter()
+    assert scenario.preemption.wait(0.1)
+    assert perf_counter() - start >= 0.1
+
+
+def test_hold_pauses_the_wait_until_resumed():
+    scenario = make_scenario("ON_HOLD")
+    later(0.3, lambda: resume(scenario))
+    start = perf_counter()
+    assert scenario.preemption.wait(0.1)
+    elapsed = perf_counter() - start
+    # The time spent ON_HOLD doesn't count towards the sleep
+    assert 0.4 <= elapsed < 1
+    assert scenario.current_job.status == "IN_PROGRESS"
+
+
+def test_flexibility_change_aborts_the_wait():
+    scenario = make_scenario()
+
+    def switch():
+        scenario.manager.selected_flexibility = 1
+        scenario.preemption.signal()
+
+    later(0.1, switch)
+    start = perf_counter()
+    assert not scenario.preemption.wait(10)
+    assert perf_counter() - start < 1
+
+
+def test_join_applies_the_commands_for_the_other_threads():
+    scenario = make_scenario("ON_HOLD")
+    # A robot move: it only checks the statuses, it doesn't apply them
+    move = th.Thread(target=scenario.preemption.wait, args=(0,), kwargs={"update": False}, daemon=True)
+    move.start()
+    scenario.commands.put(JOB_STATUS, "Job-001", "IN_PROGRESS")
+    start = perf_counter()
+    scenario.preemption.join(move)
+    assert perf_counter() - start < 1
+    assert scenario.current_job.status == "IN_PROGRESS"
+
+
+def test_hold_action_doesnt_spin_when_not_on_hold():
+    scenario = make_scenario()
+    start = perf_counter()
+    action_hold(scenario, 0.1)
+    assert perf_counter() - start >= 0.1
@@ -0,0 +1,59 @@
+import pytest
+
+from shopfloor_simulation.topic_router import TopicRouter
+
+
+def make_router():
+    router = TopicRouter()
+    router.add("root/jobs/{job_id}/status", "status")
+    router.add("root/jobs/+/progress", "progress")
+    router.add("root/jobs/Job-001/status", "exact")
+    router.add("root/flexibility/{flexibility:int}", "flexibility")
+    router.add("root/#", "everything")
+    return router
+
+
+def test_parameters_are_passed_by_name():
+    route, parameters = make_router().match("root/jobs/Job-002/status")
+    assert route.handler == "status"
+    assert parameters == {"job_id": "Job-002"}
+
+
+def test_typed_parameters_are_converted():
+    route, parameters = make_router().match("root/flexibility/1")
+    assert route.handler == "flexibility"
+    assert parameters == {"flexibility": 1}
+
+
+def test_exact_levels_win_over_parameters_and_wildcards():
+    router = make_router()
+    assert router.match("root/jobs/Job-001/status")[0].handler == "exact"
+    assert router.match("root/jobs/Job-001/progress")[0].handler == "progress"
+    assert router.match("root/jobs/Job-001/other")[0].handler == "everything"
+    assert router.match("root")[0].handler == "everything"  # `a/#` also matches `a`
+
+
+def test_unmatched_topics():
+    router = make_router()
+    assert router.match("other/jobs/Job-001/status") == (None, None)
+    assert not router.dispatch("other", None)
+
+
+def test_dispatch_calls_the_handler():
+    calls = []
+    router = TopicRouter()
+    router.add("jobs/{job_id}/status", lambda msg, job_id: calls.append((msg, job_id)))
+    assert router.dispatch("jobs/Job-003/status", "ON_HOLD")
+    assert calls == [("ON_HOLD", "Job-003")]
+
+
+@pytest.mark.parametrize("pattern", ["a/#/b", "a/b+", "a/{x:bytes}"])
+def test_invalid_patterns(pattern):
+    with pytest.raises(ValueError):
+        TopicRouter().add(pattern, None)
+
+
+def test_patterns_are_routed_once():
+    router = make_router()
+    with pytest.raises(ValueError):
+        router.add("root/jobs/{other}/status", None)